@@ -1,6 +1,12 @@
 import streamlit as st
 import pandas as pd
-from utils import visualizations
+import threading
+import time
+from datetime import date
+from utils import instrumentation, local_store, result_cache, visualizations
+from utils.db_connection import get_pool_stats
+from utils.parallel import run_parallel
+from utils.warmup import CacheWarmup, enabled as warmup_enabled
 from queries import query1, query2, query3, query4, query5, query6, query7, query8, query9, query10
 
 st.set_page_config(page_title="Olist E-commerce Data Analysis", layout="wide")
@@ -10,8 +16,28 @@ st.markdown('''
 The dataset chosen is the **Olist E-commerce Public Dataset**, which contains information about orders made at Olist, a Brazilian e-commerce marketplace. Spanning from 2016 to 2018, the dataset comprises multiple CSV files that represent different entities in a relational model, such as customers, orders, products, sellers, and more. For better data comprehension for European viewers, **1 EUR is approximately 6 BRL**, as all financial figures in the dataset are denominated in Brazilian Reais (BRL). This exchange rate is essential for interpreting revenue, pricing, and freight costs accurately within the context of the analysis.
 ''')
 
+BRAZIL_STATES = [
+    "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA",
+    "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO",
+]
+DELAYED_ORDERS_PAGE_SIZE = 50
+# Purchase dates the dataset spans, the default filter range
+DATASET_DATES = (date(2016, 9, 1), date(2018, 10, 31))
+OVERVIEW_TITLE = "Overview"
+OVERVIEW_DEFAULT_PANELS = [
+    "Sales trends",
+    "Average order value by customer state",
+    "Most common payment types",
+    "Sales by product category",
+]
+# Sales trends granularity options -> granularity of utils.rollups
+GRANULARITIES = {"Daily": "day", "Weekly": "week", "Monthly": "month", "Quarterly": "quarter"}
+# Views whose query can answer from the sketches of utils.sketches
+APPROXIMATE_TITLES = {"Most popular products", "Cities with highest number of customers", "Distinct buyers by state"}
+WARMUP_ICONS = {"pending": "⚪", "running": "⏳", "warm": "✅", "failed": "❌"}
+
 query_options = {
-    "Monthly sales trends": query1.monthly_sales_trends,
+    "Sales trends": query1.sales_trends,
     "Average order value by customer state": query2.average_order_value_by_state,
     "Most popular products": query3.most_popular_products,
     "Average delivery time per seller": query4.average_delivery_time_per_seller,
@@ -19,13 +45,71 @@ query_options = {
     "Most common payment types": query6.most_common_payment_types,
     "Sales by product category": query7.sales_by_product_category,
     "Cities with highest number of customers": query8.top_cities_by_customers,
+    "Distinct buyers by state": query8.distinct_buyers_by_state,
     "Average freight value by state": query9.average_freight_value_by_state,
     "Orders with delayed delivery": query10.orders_with_delayed_delivery
 }
 
 st.sidebar.title("Queries")
-selected_query_title = st.sidebar.selectbox("Select a query to display:", list(query_options.keys()))
-selected_query_function = query_options[selected_query_title]
+selected_query_title = st.sidebar.selectbox("Select a query to display:", [OVERVIEW_TITLE] + list(query_options.keys()))
+selected_query_function = query_options.get(selected_query_title)
+
+def query_filters(date_range=DATASET_DATES, customer_state="All", product_category="All", seller_id=""):
+    """
+    Returns the filters passed to every query function. The full date range and
+    "All" map to None, so unfiltered views keep reading the summaries and the
+    warm caches. Always the same keys in the same order, for the cache keys.
+    """
+    start_date = date_range[0] if len(date_range) > 0 else None
+    end_date = date_range[1] if len(date_range) > 1 else None
+    return {
+        "start_date": None if start_date == DATASET_DATES[0] else start_date,
+        "end_date": None if end_date == DATASET_DATES[1] else end_date,
+        "customer_state": None if customer_state == "All" else customer_state,
+        "product_category": None if product_category == "All" else product_category,
+        "seller_id": seller_id.strip() or None,
+    }
+
+def product_categories():
+    # Same call as the unfiltered view, so both share a cache entry
+    return query7.sales_by_product_category(**query_filters())["product_category"].dropna().sort_values().tolist()
+
+@st.cache_resource
+def warmup_holder():
+    # Shared by every session of this process
+    return {"warmup": None, "data_version": None, "lock": threading.Lock()}
+
+def current_data_version():
+    """
+    Returns the data version and clears the Streamlit memory cache when a load
+    changed it since the previous run of any session of this process. The memory
+    cache is keyed by the query arguments only, while the disk cache below it
+    also keys on the data version.
+    """
+    holder = warmup_holder()
+    version = result_cache.data_version()
+    with holder["lock"]:
+        if holder["data_version"] is not None and holder["data_version"] != version:
+            st.cache_data.clear()
+        holder["data_version"] = version
+    return version
+
+# Runs before any query, so none answers from a memory cache of an earlier load
+data_version = current_data_version()
+
+st.sidebar.title("Filters")
+filters = query_filters(
+    st.sidebar.date_input("Purchase date", value=DATASET_DATES),
+    st.sidebar.selectbox("Customer state", ["All"] + BRAZIL_STATES),
+    st.sidebar.selectbox("Product category", ["All"] + product_categories()),
+    st.sidebar.text_input("Seller id"),
+)
+
+approximate = st.sidebar.checkbox(
+    "Approximate answers",
+    help="Answer the top products, top cities and distinct buyers from sketches, with error bounds. Filtered views stay exact.",
+)
+show_diagnostics = st.sidebar.checkbox("Show query diagnostics")
 
 st.sidebar.markdown("---")
 
@@ -34,14 +118,175 @@ st.sidebar.markdown("This is a Brazilian ecommerce public dataset of orders made
 
 st.sidebar.markdown("> Made by [Heitor Tanoue](https://github.com/heitortanoue)")
 
+def delayed_orders_filters(filters, min_delay_days=0.0):
+    return {**filters, "min_delay_days": min_delay_days or None}
+
+def query_arguments(title, filters, approximate=False):
+    # approximate is only passed when set, so exact calls share the cache entries of the warmup
+    return {**filters, "approximate": True} if approximate and title in APPROXIMATE_TITLES else filters
+
+def panel_loaders(filters=None, approximate=False):
+    """
+    Returns, for each query, a callable loading the data and distribution its view
+    draws with the given filters, the default ones when omitted. They make the
+    same calls as the views, so they also fill the caches the views read.
+    """
+    filters = filters or query_filters()
+    loaders = {
+        title: (lambda title=title, function=function: (function(**query_arguments(title, filters, approximate)), None))
+        for title, function in query_options.items()
+    }
+    loaders["Average delivery time per seller"] = lambda: (
+        query4.average_delivery_time_per_seller(**filters),
+        query4.delivery_time_distribution(**filters),
+    )
+    delayed_filters = delayed_orders_filters(filters)
+    loaders["Orders with delayed delivery"] = lambda: (
+        query10.delayed_orders_page(DELAYED_ORDERS_PAGE_SIZE, None, **delayed_filters)[0],
+        query10.delay_distribution(**delayed_filters),
+    )
+    return loaders
+
+def current_warmup(version):
+    """
+    Starts the cache warm-up on the first run of the app, and again after a data
+    load changes the data version.
+    """
+    holder = warmup_holder()
+    with holder["lock"]:
+        warmup = holder["warmup"]
+        if warmup is None or warmup.data_version != version:
+            warmup = holder["warmup"] = CacheWarmup(panel_loaders(), data_version=version)
+    return warmup
+
+def warmup_status(warmup):
+    st.markdown("**Cache warm-up**")
+    for title, status in warmup.status().items():
+        detail = f" ({status['duration_ms']} ms)" if status["state"] == "warm" else ""
+        st.markdown(f"{WARMUP_ICONS[status['state']]} {title}{detail}")
+
+if warmup_enabled():
+    warmup = current_warmup(data_version)
+    with st.sidebar:
+        with st.expander("Cache status", expanded=not warmup.done):
+            if warmup.done:
+                warmup_status(warmup)
+            else:
+                # Refresh the indicator until every query is warm
+                st.fragment(run_every=2)(warmup_status)(warmup)
+
 st.header(selected_query_title)
 
 def load_data():
-    return selected_query_function()
+    return selected_query_function(**query_arguments(selected_query_title, filters, approximate))
+
+def sales_trends_view():
+    granularity = GRANULARITIES[st.radio("Granularity", list(GRANULARITIES), index=2, horizontal=True)]
+    data = query1.sales_trends(granularity, **filters)
+    st.dataframe(data)
+    visualizations.visualize_data(data, selected_query_title, granularity=granularity)
+
+def delayed_orders_view():
+    min_delay_days = st.number_input("Minimum delay (days)", min_value=0.0, value=0.0, step=1.0)
+    delayed_filters = delayed_orders_filters(filters, min_delay_days)
+
+    # Keyset pagination: keep the cursors of the visited pages, restart when the filters change
+    if st.session_state.get("delayed_orders_filters") != delayed_filters:
+        st.session_state["delayed_orders_filters"] = delayed_filters
+        st.session_state["delayed_orders_cursors"] = [None]
+    cursors = st.session_state["delayed_orders_cursors"]
+
+    page, next_cursor = query10.delayed_orders_page(DELAYED_ORDERS_PAGE_SIZE, cursors[-1], **delayed_filters)
+    st.dataframe(page)
+
+    previous_column, page_column, next_column = st.columns([1, 4, 1])
+    page_column.markdown(f"Page {len(cursors)}")
+    if previous_column.button("Previous page", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_column.button("Next page", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
+    visualizations.visualize_data(page, selected_query_title, distribution=query10.delay_distribution(**delayed_filters))
+
+def overview():
+    titles = st.multiselect("Panels", list(query_options.keys()), default=OVERVIEW_DEFAULT_PANELS)
+    loaders = panel_loaders(filters, approximate)
+
+    # One slot per panel, filled as soon as its queries finish
+    columns = st.columns(2)
+    slots = {}
+    for i, title in enumerate(titles):
+        slots[title] = columns[i % 2].empty()
+        slots[title].info(f"Loading {title.lower()}...")
+
+    start = time.perf_counter()
+    durations = []
+    for title, result, error, duration_ms in run_parallel({title: loaders[title] for title in titles}):
+        durations.append(duration_ms)
+        with slots[title].container():
+            st.subheader(title)
+            if error is not None:
+                st.error(f"Query failed: {error}")
+                continue
+            data, distribution = result
+            visualizations.visualize_data(data, title, distribution=distribution)
+            st.caption(f"Loaded in {duration_ms} ms")
+
+    if durations:
+        total_ms = int((time.perf_counter() - start) * 1000)
+        st.caption(f"{len(durations)} panels rendered in {total_ms} ms, their queries add up to {sum(durations)} ms.")
+
+def query_diagnostics():
+    """
+    Shows the query calls recorded by utils.instrumentation in this process, for
+    every session, with the result cache and connection pool counters.
+    """
+    calls = instrumentation.history()
+    st.markdown("**Per query**")
+    st.dataframe(pd.DataFrame.from_dict(instrumentation.stats(), orient="index"))
+    st.markdown("**Recent calls**")
+    st.dataframe(pd.DataFrame([
+        {key: call.get(key) for key in ("started_at", "query", "backend", "cache", "wall_ms", "arguments", "error")}
+        for call in calls
+    ]))
+    st.markdown("**Recent pipelines**")
+    st.dataframe(pd.DataFrame([
+        {
+            "query": call["query"],
+            **{key: record.get(key) for key in (
+                "collection", "kind", "stages", "wall_ms", "returned", "explain",
+                "docs_examined", "keys_examined", "server_ms", "collection_scan", "used_disk",
+            )},
+        }
+        for call in calls for record in call["pipelines"]
+    ]))
+    cache_column, pool_column = st.columns(2)
+    cache_column.markdown("**Result cache**")
+    cache_column.json(result_cache.stats())
+    if not local_store.enabled():
+        pool_column.markdown("**Connection pool**")
+        pool_column.json(get_pool_stats())
+
+if selected_query_title == OVERVIEW_TITLE:
+    overview()
+elif selected_query_title == "Orders with delayed delivery":
+    delayed_orders_view()
+elif selected_query_title == "Sales trends":
+    sales_trends_view()
+else:
+    data = load_data()
+
+    # Display the data
+    st.dataframe(data)
 
-data = load_data()
+    distribution = None
+    if selected_query_title == "Average delivery time per seller":
+        distribution = query4.delivery_time_distribution(**filters)
 
-# Display the data
-st.dataframe(data)
+    visualizations.visualize_data(data, selected_query_title, distribution=distribution)
 
-visualizations.visualize_data(data, selected_query_title)
+if show_diagnostics:
+    with st.expander("Query diagnostics", expanded=True):
+        query_diagnostics()
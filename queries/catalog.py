@@ -0,0 +1,74 @@
+from utils.schema import has_embedded_dimensions
+from queries import query1, query2, query3, query4, query5, query6, query7, query8, query9, query10
+
+# Query name -> (source collection, pipeline builder, builder takes the embedded flag)
+PIPELINES = {
+    "monthly_sales_trends": ("orders", query1.build_pipeline, False),
+    "average_order_value_by_state": ("orders", query2.build_pipeline, True),
+    "most_popular_products": ("orders", query3.build_pipeline, False),
+    "average_delivery_time_per_seller": ("orders", query4.build_pipeline, False),
+    "top_rated_products": ("orders", query5.build_pipeline, False),
+    "most_common_payment_types": ("orders", query6.build_pipeline, False),
+    "sales_by_product_category": ("orders", query7.build_pipeline, True),
+    "top_cities_by_customers": ("customers", query8.build_pipeline, False),
+    "distinct_buyers_by_state": ("orders", query8.build_buyers_pipeline, False),
+    "average_freight_value_by_state": ("orders", query9.build_pipeline, True),
+    "orders_with_delayed_delivery": ("orders", query10.build_pipeline, True),
+}
+
+def build_pipeline(db, name):
+    """
+    Builds the pipeline of a query for the schema currently loaded in the database.
+
+    Returns:
+        tuple: The source collection name and the aggregation pipeline.
+    """
+    collection, build, uses_embedded = PIPELINES[name]
+    pipeline = build(has_embedded_dimensions(db)) if uses_embedded else build()
+    return collection, pipeline
+
+# Query name -> data its result depends on. "orders" covers the orders with their
+# items and payments, "reviews" the review embedded in each order.
+DEPENDENCIES = {
+    "monthly_sales_trends": {"orders"},
+    "average_order_value_by_state": {"orders", "customers"},
+    "most_popular_products": {"orders", "products"},
+    "average_delivery_time_per_seller": {"orders"},
+    "top_rated_products": {"orders", "reviews", "products"},
+    "most_common_payment_types": {"orders"},
+    "sales_by_product_category": {"orders", "products"},
+    "top_cities_by_customers": {"customers"},
+    "distinct_buyers_by_state": {"orders", "customers"},
+    "average_freight_value_by_state": {"orders", "customers"},
+    "orders_with_delayed_delivery": {"orders", "customers"},
+}
+
+def affected_queries(changed):
+    """
+    Lists the queries whose results depend on any of the changed data.
+
+    Args:
+        changed (iterable): Changed data, keys used in DEPENDENCIES.
+
+    Returns:
+        list: Query names.
+    """
+    changed = set(changed)
+    return [name for name, dependencies in DEPENDENCIES.items() if dependencies & changed]
+
+def affected_results(changed):
+    """
+    Lists the queries whose cached results may differ after the data changed:
+    the affected_queries() plus, since the customer state and product category
+    filters read customers and products, every query when those change.
+
+    Args:
+        changed (iterable): Changed data, keys used in DEPENDENCIES.
+
+    Returns:
+        list: Query names.
+    """
+    changed = set(changed)
+    if changed & {"customers", "products"}:
+        return list(DEPENDENCIES)
+    return affected_queries(changed)
@@ -0,0 +1,88 @@
+from datetime import date, datetime, time
+from utils.schema import has_embedded_dimensions
+
+# Optional filters every query function accepts
+FILTER_NAMES = ("start_date", "end_date", "customer_state", "product_category", "seller_id")
+
+def as_datetime(value, end_of_day=False):
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, time.max if end_of_day else time.min)
+    return value
+
+def has_filters(**filters):
+    return any(filters.get(name) is not None for name in FILTER_NAMES)
+
+def build_stages(db, start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Builds the stages applying the optional filters, to be placed first in a
+    pipeline on the orders collection so the $match can use indexes.
+
+    Purchase dates and customer state select orders. Product category and seller
+    select the orders holding a matching item, and a $filter keeps only those
+    items, so stages unwinding or summing order_items see matching items only.
+
+    Without embedded dimensions, the customers of the state and the products of
+    the category are looked up first (through the customer_state and
+    category_product indexes) and matched by id.
+
+    Args:
+        db: The olistDB database.
+        start_date (date, optional): Earliest purchase date.
+        end_date (date, optional): Latest purchase date, included.
+        customer_state (str, optional): Customer state, e.g. "SP".
+        product_category (str, optional): English product category name.
+        seller_id (str, optional): Seller id.
+
+    Returns:
+        list: The stages, empty when no filter is set.
+    """
+    embedded = (customer_state is not None or product_category is not None) and has_embedded_dimensions(db)
+    match = {}
+    purchase_range = {}
+    if start_date is not None:
+        purchase_range["$gte"] = as_datetime(start_date)
+    if end_date is not None:
+        purchase_range["$lte"] = as_datetime(end_date, end_of_day=True)
+    if purchase_range:
+        match["order_purchase_timestamp"] = purchase_range
+
+    if customer_state is not None:
+        if embedded:
+            match["customer_state"] = customer_state
+        else:
+            match["customer_id"] = { "$in": db.customers.distinct("_id", { "customer_state": customer_state }) }
+
+    # Conditions on a single item, for $elemMatch on the orders and $filter on their items
+    item_conditions = []
+    if seller_id is not None:
+        item_conditions.append(("seller_id", seller_id))
+    if product_category is not None:
+        if embedded:
+            item_conditions.append(("product_category_name_english", product_category))
+        else:
+            product_ids = db.products.distinct("_id", { "product_category_name_english": product_category })
+            item_conditions.append(("product_id", { "$in": product_ids }))
+    if item_conditions:
+        match["order_items"] = { "$elemMatch": { field: value for field, value in item_conditions } }
+
+    if not match:
+        return []
+    stages = [{ "$match": match }]
+    if item_conditions:
+        stages.append({
+            "$addFields": {
+                "order_items": {
+                    "$filter": {
+                        "input": "$order_items",
+                        "as": "item",
+                        "cond": { "$and": [_item_condition(field, value) for field, value in item_conditions] }
+                    }
+                }
+            }
+        })
+    return stages
+
+def _item_condition(field, value):
+    if isinstance(value, dict):
+        return { "$in": [f"$$item.{field}", value["$in"]] }
+    return { "$eq": [f"$$item.{field}", value] }
@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+from queries.filters import as_datetime
+from utils.distributions import DEFAULT_QUANTILES, nearest_rank_index, quantile_name
+from utils.local_store import load_table
+
+# The ten analyses over the local columnar store (utils.local_store), returning
+# the same columns and order as the MongoDB pipelines in queries/query*.py.
+
+MS_PER_DAY = 1000 * 60 * 60 * 24
+
+def _tables(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Returns the orders, order_items, payments and reviews tables restricted to the
+    filters, with the semantics of queries.filters.build_stages: orders of the
+    dates and state holding a matching item, and only the matching items.
+    Unfiltered tables are returned as loaded.
+    """
+    orders = load_table("orders")
+    items = load_table("order_items")
+    tables = {"orders": orders, "order_items": items, "payments": load_table("payments"), "reviews": load_table("reviews")}
+    if all(value is None for value in (start_date, end_date, customer_state, product_category, seller_id)):
+        return tables
+
+    if start_date is not None:
+        orders = orders[orders["order_purchase_timestamp"] >= as_datetime(start_date)]
+    if end_date is not None:
+        orders = orders[orders["order_purchase_timestamp"] <= as_datetime(end_date, end_of_day=True)]
+    if customer_state is not None:
+        customers = load_table("customers")
+        orders = orders.merge(customers.loc[customers["customer_state"] == customer_state, ["customer_id"]], on="customer_id")
+    if seller_id is not None:
+        items = items[items["seller_id"] == seller_id]
+    if product_category is not None:
+        products = load_table("products")
+        category_products = products.loc[products["product_category_name_english"] == product_category, ["product_id"]]
+        items = items.merge(category_products, on="product_id")
+    if seller_id is not None or product_category is not None:
+        orders = orders.merge(items[["order_id"]].drop_duplicates(), on="order_id")
+
+    # Joining on the kept order ids is much faster than isin() on Arrow strings
+    order_ids = orders[["order_id"]]
+    tables["orders"] = orders
+    for name in ("order_items", "payments", "reviews"):
+        table = items if name == "order_items" else tables[name]
+        tables[name] = table.merge(order_ids, on="order_id")
+    return tables
+
+def _with_products(df, columns):
+    products = load_table("products").rename(columns={
+        "product_category_name_english": "product_category",
+        "product_name_lenght": "product_name_length",
+    })
+    return df.merge(products[["product_id", *columns]], on="product_id", how="inner")
+
+def monthly_sales_trends(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    tables = _tables(start_date, end_date, customer_state, product_category, seller_id)
+    df = tables["order_items"][["order_id", "price"]].merge(tables["orders"][["order_id", "order_purchase_timestamp"]], on="order_id")
+    purchased = df["order_purchase_timestamp"]
+    df = (
+        df.groupby([purchased.dt.year.rename("year"), purchased.dt.month.rename("month")])["price"]
+        .sum()
+        .round(2)
+        .rename("total_sales")
+        .reset_index()
+        .astype({"year": "int64", "month": "int64"})
+    )
+    df['date'] = pd.to_datetime(df[['year', 'month']].assign(DAY=1))
+    return df
+
+def _period_starts(dates, granularity):
+    # Same periods as utils.rollups.period_start: days, ISO weeks from Monday, months and quarters
+    days = dates.dt.normalize()
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        return days - pd.to_timedelta(days.dt.weekday, unit="D")
+    return days.dt.to_period("M" if granularity == "month" else "Q").dt.start_time
+
+def sales_trends(granularity="month", start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    tables = _tables(start_date, end_date, customer_state, product_category, seller_id)
+    items = tables["order_items"]
+    per_order = items.groupby("order_id").agg(
+        total_sales=("price", "sum"), items=("price", "size"), freight=("freight_value", "sum")
+    ).reset_index()
+    df = per_order.merge(tables["orders"][["order_id", "order_purchase_timestamp"]].dropna(), on="order_id")
+    df = (
+        df.groupby(_period_starts(df["order_purchase_timestamp"], granularity).rename("date"))
+        .agg(total_sales=("total_sales", "sum"), items=("items", "sum"), orders=("order_id", "size"), freight=("freight", "sum"))
+        .reset_index()
+        .round({"total_sales": 2, "freight": 2})
+    )
+    return df
+
+def average_order_value_by_state(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    tables = _tables(start_date, end_date, customer_state, product_category, seller_id)
+    items = tables["order_items"]
+    order_values = (items["price"] + items["freight_value"]).groupby(items["order_id"]).sum().rename("total_order_value")
+    df = (
+        tables["orders"][["order_id", "customer_id"]]
+        .merge(order_values, left_on="order_id", right_index=True)
+        .merge(load_table("customers")[["customer_id", "customer_state"]], on="customer_id")
+    )
+    df = df.groupby("customer_state")["total_order_value"].mean().rename("average_order_value").reset_index()
+    return df.sort_values("average_order_value", ascending=False, ignore_index=True)
+
+def most_popular_products(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    items = _tables(start_date, end_date, customer_state, product_category, seller_id)["order_items"]
+    counts = items["product_id"].value_counts().head(10).rename("purchase_count")
+    df = counts.rename_axis("product_id").reset_index()
+    return _with_products(df, ["product_category", "product_name_length"])
+
+def average_delivery_time_per_seller(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    tables = _tables(start_date, end_date, customer_state, product_category, seller_id)
+    orders = tables["orders"]
+    delivered = orders[orders["order_approved_at"].notna() & orders["order_delivered_customer_date"].notna()]
+    df = tables["order_items"][["order_id", "seller_id"]].merge(delivered, on="order_id")
+    delivery_days = (df["order_delivered_customer_date"] - df["order_approved_at"]).dt.total_seconds() * 1000 / MS_PER_DAY
+    df = delivery_days.groupby(df["seller_id"]).agg(["count", "mean"])
+    df.columns = ["delivery_count", "average_delivery_time_in_days"]
+    df = df[df["delivery_count"] >= 10].reset_index()
+    return df.sort_values("average_delivery_time_in_days", ignore_index=True)
+
+def top_rated_products(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    tables = _tables(start_date, end_date, customer_state, product_category, seller_id)
+    reviews = tables["reviews"].dropna(subset=["review_score"])
+    df = tables["order_items"][["order_id", "product_id"]].merge(reviews, on="order_id")
+    df = df.groupby("product_id")["review_score"].agg(["mean", "count"])
+    df.columns = ["average_review_score", "review_count"]
+    df = df[df["review_count"] >= 100].reset_index()
+    df = df.sort_values(["average_review_score", "review_count"], ascending=False).head(10)
+    return _with_products(df, ["product_category", "product_name_length"])
+
+def most_common_payment_types(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    payments = _tables(start_date, end_date, customer_state, product_category, seller_id)["payments"]
+    df = payments.groupby("payment_type")["payment_value"].agg(["count", "sum"])
+    df.columns = ["count", "total_amount"]
+    return df.reset_index().sort_values("count", ascending=False, ignore_index=True)
+
+def sales_by_product_category(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    items = _tables(start_date, end_date, customer_state, product_category, seller_id)["order_items"]
+    df = _with_products(items[["product_id", "price"]], ["product_category"])
+    df = df.groupby("product_category", dropna=False)["price"].agg(["sum", "count"])
+    df.columns = ["total_sales", "total_orders"]
+    return df.reset_index().sort_values("total_sales", ascending=False, ignore_index=True)
+
+def top_cities_by_customers(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    customers = load_table("customers")
+    if any(value is not None for value in (start_date, end_date, product_category, seller_id)):
+        # Customers with a matching order
+        orders = _tables(start_date, end_date, customer_state, product_category, seller_id)["orders"]
+        customers = customers.merge(orders[["customer_id"]].drop_duplicates(), on="customer_id")
+    elif customer_state is not None:
+        customers = customers[customers["customer_state"] == customer_state]
+    customers = customers.drop_duplicates("customer_unique_id")
+    df = customers["customer_city"].value_counts().head(10).rename("customer_count")
+    return df.rename_axis("customer_city").reset_index()
+
+def distinct_buyers_by_state(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    orders = _tables(start_date, end_date, customer_state, product_category, seller_id)["orders"]
+    buyers = load_table("customers").merge(orders[["customer_id"]].drop_duplicates(), on="customer_id")
+    buyers = buyers.drop_duplicates(["customer_state", "customer_unique_id"])
+    df = buyers["customer_state"].value_counts().rename("buyer_count")
+    return df.rename_axis("customer_state").reset_index()
+
+def average_freight_value_by_state(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    tables = _tables(start_date, end_date, customer_state, product_category, seller_id)
+    df = (
+        tables["order_items"][["order_id", "freight_value"]]
+        .merge(tables["orders"][["order_id", "customer_id"]], on="order_id")
+        .merge(load_table("customers")[["customer_id", "customer_state"]], on="customer_id")
+    )
+    df = df.groupby("customer_state")["freight_value"].agg(["mean", "count"])
+    df.columns = ["average_freight_value", "total_orders"]
+    return df.reset_index().sort_values("average_freight_value", ascending=False, ignore_index=True)
+
+def delayed_orders(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None, min_delay_days=None):
+    """
+    Returns the delayed orders with their customer_state and delay_in_days,
+    selected like query10.build_delay_stages().
+    """
+    orders = _tables(start_date, end_date, customer_state, product_category, seller_id)["orders"]
+    delivered = orders["order_delivered_customer_date"]
+    estimated = orders["order_estimated_delivery_date"]
+    df = orders[delivered.notna() & estimated.notna() & (delivered > estimated)]
+    df = df.merge(load_table("customers")[["customer_id", "customer_state"]], on="customer_id")
+    df = df.assign(delay_in_days=(df["order_delivered_customer_date"] - df["order_estimated_delivery_date"]).dt.total_seconds() * 1000 / MS_PER_DAY)
+    if min_delay_days is not None:
+        df = df[df["delay_in_days"] >= min_delay_days]
+    return df
+
+def orders_with_delayed_delivery(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    df = delayed_orders(start_date, end_date, customer_state, product_category, seller_id)[[
+        "order_id", "customer_id", "order_purchase_timestamp",
+        "order_delivered_customer_date", "order_estimated_delivery_date", "delay_in_days"
+    ]]
+    return df.sort_values("delay_in_days", ascending=False, ignore_index=True)
+
+def delayed_orders_page(page_size=50, after=None, **filters):
+    df = delayed_orders(**filters)
+    if after is not None:
+        last_delay, last_order_id = after
+        df = df[(df["delay_in_days"] < last_delay) | ((df["delay_in_days"] == last_delay) & (df["order_id"] > last_order_id))]
+    df = df.sort_values(["delay_in_days", "order_id"], ascending=[False, True]).head(page_size + 1)
+    df = df[[
+        "order_id", "customer_id", "customer_state", "order_purchase_timestamp",
+        "order_delivered_customer_date", "order_estimated_delivery_date", "delay_in_days"
+    ]].reset_index(drop=True)
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.head(page_size)
+        next_cursor = (float(df["delay_in_days"].iloc[-1]), df["order_id"].iloc[-1])
+    return df, next_cursor
+
+def distribution(values, buckets=None, boundaries=None, default=None, quantiles=DEFAULT_QUANTILES):
+    """
+    Local counterpart of utils.distributions: bins values like $bucketAuto
+    (equal-count bins) or $bucket (fixed edges, overflow in the default bin) and
+    picks nearest-rank quantiles.
+
+    Returns:
+        tuple: The same histogram DataFrame and quantiles dict as
+        utils.distributions.to_distribution().
+    """
+    values = np.sort(np.asarray(values, dtype="float64"))
+    values = values[~np.isnan(values)]
+    if boundaries is not None:
+        edges = np.asarray(boundaries, dtype="float64")
+        counts, _ = np.histogram(values[(values >= edges[0]) & (values < edges[-1])], bins=edges)
+        histogram = pd.DataFrame({ "bin_start": boundaries[:-1], "bin_end": boundaries[1:], "count": counts })
+        overflow = int(((values < edges[0]) | (values >= edges[-1])).sum())
+        if default is not None and overflow:
+            histogram.loc[len(histogram)] = [default, np.nan, overflow]
+        histogram = histogram[histogram["count"] > 0]
+    elif len(values):
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, (buckets or 20) + 1)))
+        if len(edges) == 1:
+            # All values are equal, a single zero-width bin
+            edges, counts = np.append(edges, edges[0]), [len(values)]
+        else:
+            counts, _ = np.histogram(values, bins=edges)
+        histogram = pd.DataFrame({ "bin_start": edges[:-1], "bin_end": edges[1:], "count": counts })
+    else:
+        histogram = pd.DataFrame(columns=["bin_start", "bin_end", "count"])
+    histogram = histogram.astype({ "bin_start": "float64", "bin_end": "float64", "count": "int64" })
+
+    summary = { "count": len(values) }
+    if len(values):
+        for q in quantiles:
+            summary[quantile_name(q)] = float(values[nearest_rank_index(q, len(values))])
+    return histogram.sort_values("bin_start").reset_index(drop=True), summary
@@ -0,0 +1,85 @@
+import importlib
+from utils.db_connection import get_database
+from utils import partitions, summaries
+from utils.schema import has_embedded_dimensions
+from queries.filters import build_stages as build_filter_stages, has_filters
+import streamlit as st
+
+# Queries derived from one scan of the orders with their items unwound.
+# Query name -> (query module, build_facet takes the embedded flag)
+FACETS = {
+    "monthly_sales_trends": ("query1", False),
+    "average_order_value_by_state": ("query2", True),
+    "most_popular_products": ("query3", False),
+    "top_rated_products": ("query5", False),
+    "sales_by_product_category": ("query7", True),
+    "average_freight_value_by_state": ("query9", True),
+}
+
+def build_pipeline(embedded=False, names=None):
+    """
+    Builds a single pipeline unwinding the order items once and computing the
+    result of each query in its own $facet branch.
+
+    Args:
+        embedded (bool): Whether orders embed their customer and product fields.
+        names (iterable, optional): Queries to compute. All of FACETS when omitted.
+
+    Returns:
+        list: The aggregation pipeline, on the orders collection.
+    """
+    facets = {}
+    for name in names or FACETS:
+        module_name, uses_embedded = FACETS[name]
+        # Imported here since the query modules read their results through this one
+        build_facet = importlib.import_module(f"queries.{module_name}").build_facet
+        facets[name] = build_facet(embedded) if uses_embedded else build_facet()
+    return [
+        { "$unwind": "$order_items" },
+        { "$facet": facets }
+    ]
+
+def scan(db, names=None, **filters):
+    """
+    Computes the results of several queries with one pass over the orders.
+
+    Args:
+        filters: Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        dict: Query name -> result rows.
+    """
+    pipeline = build_filter_stages(db, **filters) + build_pipeline(has_embedded_dimensions(db), names)
+    result = partitions.aggregate(db, "orders", pipeline, allowDiskUse=True)
+    return result[0] if result else { name: [] for name in names or FACETS }
+
+@st.cache_data
+def cached_scan(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Returns the results of all FACETS queries, scanning the orders only the first
+    time any of them is needed with the same filters.
+    """
+    return scan(
+        get_database(), start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
+
+def aggregate(db, name, sort=None, **filters):
+    """
+    Returns the result of a FACETS query, served from its summary collection when
+    that is fresh and unfiltered, and from the shared scan otherwise.
+
+    Args:
+        db: The olistDB database.
+        name (str): Query name.
+        sort (list, optional): (field, direction) pairs restoring the query's order.
+        filters: Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        list: The result rows.
+    """
+    if not has_filters(**filters):
+        rows = summaries.read_summary(db, name, sort)
+        if rows is not None:
+            return rows
+    return cached_scan(**filters)[name]
@@ -1,17 +1,13 @@
 import pandas as pd
 from utils.db_connection import get_database
+from queries import order_facts
+from queries import local
+from queries.filters import build_stages
+from utils import instrumentation, local_store, partitions, result_cache, rollups
 import streamlit as st
 
-@st.cache_data
-def monthly_sales_trends():
-    """
-    Visualizes sales trends on a monthly basis.
-
-    Returns:
-        pd.DataFrame: DataFrame containing months and their corresponding total sales.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline():
+    return [
         { "$unwind": "$order_items" },
         {
             "$addFields": {
@@ -35,7 +31,85 @@ def monthly_sales_trends():
             }
         }
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+def build_trends_pipeline(granularity="month"):
+    return [
+        { "$match": { "order_purchase_timestamp": { "$type": "date" }, "order_items.0": { "$exists": True } } },
+        {
+            "$group": {
+                "_id": rollups.period_start_expression(granularity, "$order_purchase_timestamp"),
+                "revenue": { "$sum": { "$sum": "$order_items.price" } },
+                "items": { "$sum": { "$size": "$order_items" } },
+                "orders": { "$sum": 1 },
+                "freight": { "$sum": { "$sum": "$order_items.freight_value" } }
+            }
+        },
+        { "$sort": { "_id": 1 } },
+        { "$project": { "_id": 0, "period_start": "$_id", "revenue": 1, "items": 1, "orders": 1, "freight": 1 } }
+    ]
+
+def build_facet():
+    # Stages run on orders with order_items already unwound, see queries.order_facts
+    return build_pipeline()[1:]
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def monthly_sales_trends(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Visualizes sales trends on a monthly basis.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing months and their corresponding total sales.
+    """
+    if local_store.enabled():
+        return local.monthly_sales_trends(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = order_facts.aggregate(
+        db, "monthly_sales_trends",
+        sort=[("year", 1), ("month", 1)],
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
     df = pd.DataFrame(result)
     df['date'] = pd.to_datetime(df[['year', 'month']].assign(DAY=1))
     return df
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached(query="monthly_sales_trends")
+def sales_trends(granularity="month", start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Sales per day, ISO week, month or quarter, read from the sales rollups when
+    they are fresh. Rollups are not kept per seller, so a seller filter, like
+    missing or stale rollups, computes the result from the orders.
+
+    Args:
+        granularity (str): "day", "week", "month" or "quarter".
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame with the start date of each period and its total
+        sales, items, orders and freight.
+    """
+    if granularity not in rollups.GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(rollups.GRANULARITIES)}, got '{granularity}'.")
+    if local_store.enabled():
+        return local.sales_trends(granularity, start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = None
+    if seller_id is None:
+        result = rollups.read_rollups(db, granularity, start_date, end_date, customer_state, product_category)
+    if result is None:
+        filter_stages = build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+        result = partitions.aggregate(db, "orders", filter_stages + build_trends_pipeline(granularity), allowDiskUse=True)
+    df = pd.DataFrame(result, columns=["period_start", *rollups.METRICS])
+    df = df.rename(columns={"period_start": "date", "revenue": "total_sales"})
+    df["total_sales"] = df["total_sales"].round(2)
+    df["freight"] = df["freight"].round(2)
+    return df
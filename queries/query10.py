@@ -1,22 +1,30 @@
 import pandas as pd
 from utils.db_connection import get_database
+from utils import summaries
+from utils.schema import has_embedded_dimensions
+from utils.distributions import build_distribution_stage, supports_percentile, to_distribution
+from queries import filters, local
+from utils import instrumentation, local_store, partitions, result_cache
+import streamlit as st
 
-def orders_with_delayed_delivery():
-    """
-    Finds all orders where the actual delivery date was later than the estimated delivery date,
-    indicating a delayed delivery.
+MS_PER_DAY = 1000 * 60 * 60 * 24
 
-    Returns:
-        pd.DataFrame: DataFrame containing details of delayed orders.
+def build_delay_stages(embedded=False, min_delay_days=None):
     """
-    db = get_database()
-    pipeline = [
-        {
-            "$match": {
-                "order_delivered_customer_date": { "$ne": None },
-                "order_estimated_delivery_date": { "$ne": None }
-            }
-        },
+    Builds the stages selecting delayed orders and adding their customer_state
+    and delay_in_days. Filters from queries.filters go before them.
+    """
+    # Missing dates are stored as null, $type matches the partial index filter
+    match = {
+        "order_delivered_customer_date": { "$type": "date" },
+        "order_estimated_delivery_date": { "$type": "date" }
+    }
+    if embedded:
+        # An embedded customer_state means the customer exists, no join needed
+        match["customer_state"] = { "$ne": None }
+
+    stages = [
+        { "$match": match },
         {
             "$addFields": {
                 "is_delayed": {
@@ -31,18 +39,30 @@ def orders_with_delayed_delivery():
             "$match": {
                 "is_delayed": True
             }
-        },
-        {
-            "$lookup": {
-                "from": "customers",
-                "localField": "customer_id",
-                "foreignField": "_id",
-                "as": "customer_info"
-            }
-        },
-        {
-            "$unwind": "$customer_info"
-        },
+        }
+    ]
+    if not embedded:
+        stages += [
+            {
+                "$lookup": {
+                    "from": "customers",
+                    "localField": "customer_id",
+                    "foreignField": "_id",
+                    "as": "customer_info"
+                }
+            },
+            {
+                "$unwind": "$customer_info"
+            },
+            { "$addFields": { "customer_state": "$customer_info.customer_state" } }
+        ]
+    stages.append({ "$addFields": { "delay_in_days": { "$divide": ["$delay_in_ms", MS_PER_DAY] } } })
+    if min_delay_days is not None:
+        stages.append({ "$match": { "delay_in_days": { "$gte": min_delay_days } } })
+    return stages
+
+def build_pipeline(embedded=False):
+    return build_delay_stages(embedded) + [
         {
             "$project": {
                 "_id": 0,
@@ -51,9 +71,7 @@ def orders_with_delayed_delivery():
                 "order_purchase_timestamp": 1,
                 "order_delivered_customer_date": 1,
                 "order_estimated_delivery_date": 1,
-                "delay_in_days": {
-                    "$divide": ["$delay_in_ms", 1000 * 60 * 60 * 24]
-                }
+                "delay_in_days": 1
             }
         },
         {
@@ -61,6 +79,127 @@ def orders_with_delayed_delivery():
         }
     ]
 
-    result = list(db.orders.aggregate(pipeline))
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def orders_with_delayed_delivery(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Finds all orders where the actual delivery date was later than the estimated delivery date,
+    indicating a delayed delivery.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing details of delayed orders.
+    """
+    if local_store.enabled():
+        return local.orders_with_delayed_delivery(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = summaries.aggregate(
+        db, "orders_with_delayed_delivery", "orders", build_pipeline(has_embedded_dimensions(db)),
+        sort=[("delay_in_days", -1)],
+        filter_stages=filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+    )
+    df = pd.DataFrame(result)
+    return df
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached(query="orders_with_delayed_delivery")
+def delayed_orders_page(page_size=50, after=None, start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None, min_delay_days=None):
+    """
+    Returns one page of delayed orders, most delayed first, using keyset pagination.
+
+    Args:
+        page_size (int): Maximum number of orders in the page.
+        after (tuple, optional): (delay_in_days, order_id) of the last order of the
+            previous page. The first page is returned when omitted.
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+        min_delay_days (float, optional): Minimum delay in days.
+
+    Returns:
+        tuple: DataFrame with the page and the cursor of the next page, or None on
+        the last page.
+    """
+    if local_store.enabled():
+        return local.delayed_orders_page(
+            page_size, after, start_date=start_date, end_date=end_date, customer_state=customer_state,
+            product_category=product_category, seller_id=seller_id, min_delay_days=min_delay_days
+        )
+    db = get_database()
+    pipeline = (
+        filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+        + build_delay_stages(has_embedded_dimensions(db), min_delay_days)
+    )
+    if after is not None:
+        last_delay, last_order_id = after
+        pipeline.append({
+            "$match": {
+                "$or": [
+                    { "delay_in_days": { "$lt": last_delay } },
+                    { "delay_in_days": last_delay, "_id": { "$gt": last_order_id } }
+                ]
+            }
+        })
+    pipeline += [
+        { "$sort": { "delay_in_days": -1, "_id": 1 } },
+        # One extra order tells whether there is a next page
+        { "$limit": page_size + 1 },
+        {
+            "$project": {
+                "_id": 0,
+                "order_id": "$_id",
+                "customer_id": 1,
+                "customer_state": 1,
+                "order_purchase_timestamp": 1,
+                "order_delivered_customer_date": 1,
+                "order_estimated_delivery_date": 1,
+                "delay_in_days": 1
+            }
+        }
+    ]
+    result = partitions.aggregate(db, "orders", pipeline)
+    next_cursor = None
+    if len(result) > page_size:
+        result = result[:page_size]
+        next_cursor = (result[-1]["delay_in_days"], result[-1]["order_id"])
     df = pd.DataFrame(result)
-    return df
\ No newline at end of file
+    return df, next_cursor
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached(query="orders_with_delayed_delivery")
+def delay_distribution(bin_days=5, max_days=100, start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None, min_delay_days=None):
+    """
+    Summarizes the delays of delayed orders on the server as a $bucket histogram
+    and quantiles.
+
+    Args:
+        bin_days (int): Width of each bin in days.
+        max_days (int): Delays of at least this many days share the last bin,
+            which has no bin_end.
+        start_date, end_date, customer_state, product_category, seller_id,
+            min_delay_days: Same filters as delayed_orders_page().
+
+    Returns:
+        tuple: DataFrame with bin_start, bin_end and count per bin, and a dict with
+        the number of delayed orders and the p50, p90 and p99 delays in days.
+    """
+    boundaries = list(range(0, max_days, bin_days)) + [max_days]
+    if local_store.enabled():
+        delays = local.delayed_orders(start_date, end_date, customer_state, product_category, seller_id, min_delay_days)["delay_in_days"]
+        return local.distribution(delays, boundaries=boundaries, default=max_days)
+    db = get_database()
+    stage = build_distribution_stage(
+        "delay_in_days", boundaries=boundaries, default=max_days, use_percentile=supports_percentile(db)
+    )
+    embedded = has_embedded_dimensions(db)
+    filter_stages = filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+    if filter_stages or min_delay_days is not None:
+        result = partitions.aggregate(db, "orders", filter_stages + build_delay_stages(embedded, min_delay_days) + [stage], allowDiskUse=True)
+    else:
+        result = summaries.aggregate_rows(db, "orders_with_delayed_delivery", "orders", build_pipeline(embedded), [stage])
+    return to_distribution(result, boundaries)
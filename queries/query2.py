@@ -1,17 +1,29 @@
 import pandas as pd
 from utils.db_connection import get_database
+from queries import order_facts
+from queries import local
+from utils import instrumentation, local_store, result_cache
 import streamlit as st
 
-@st.cache_data
-def average_order_value_by_state():
-    """
-    Calculates the average total value of orders for each customer state.
-
-    Returns:
-        pd.DataFrame: DataFrame containing customer states and their average order values.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline(embedded=False):
+    if embedded:
+        # Orders carry customer_state, so the per-order total can be computed
+        # without unwinding the items or joining customers.
+        return [
+            { "$match": { "order_items.0": { "$exists": True }, "customer_state": { "$ne": None } } },
+            {
+                "$group": {
+                    "_id": "$customer_state",
+                    "average_order_value": {
+                        "$avg": {
+                            "$add": [{ "$sum": "$order_items.price" }, { "$sum": "$order_items.freight_value" }]
+                        }
+                    }
+                }
+            },
+            { "$sort": { "average_order_value": -1 } }
+        ]
+    return [
         { "$unwind": "$order_items" },
         {
             "$group": {
@@ -41,7 +53,56 @@ def average_order_value_by_state():
         },
         { "$sort": { "average_order_value": -1 } }
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+def build_facet(embedded=False):
+    # Stages run on orders with order_items already unwound, see queries.order_facts
+    if embedded:
+        return [
+            { "$match": { "customer_state": { "$ne": None } } },
+            {
+                "$group": {
+                    "_id": "$_id",
+                    "customer_state": { "$first": "$customer_state" },
+                    "total_order_value": {
+                        "$sum": {
+                            "$add": ["$order_items.price", "$order_items.freight_value"]
+                        }
+                    }
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$customer_state",
+                    "average_order_value": { "$avg": "$total_order_value" }
+                }
+            },
+            { "$sort": { "average_order_value": -1 } }
+        ]
+    return build_pipeline()[1:]
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def average_order_value_by_state(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Calculates the average total value of orders for each customer state.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing customer states and their average order values.
+    """
+    if local_store.enabled():
+        return local.average_order_value_by_state(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = order_facts.aggregate(
+        db, "average_order_value_by_state",
+        sort=[("average_order_value", -1)],
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
     df = pd.DataFrame(result)
     df.rename(columns={'_id': 'customer_state'}, inplace=True)
     return df
@@ -1,17 +1,13 @@
 import pandas as pd
 from utils.db_connection import get_database
+from queries import order_facts
+from queries import local
+from queries.filters import has_filters
+from utils import instrumentation, local_store, result_cache, sketches
 import streamlit as st
 
-@st.cache_data
-def most_popular_products():
-    """
-    Identifies the most frequently purchased products.
-
-    Returns:
-        pd.DataFrame: DataFrame containing product details and purchase counts.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline():
+    return [
         { "$unwind": "$order_items" },
         {
             "$group": {
@@ -40,6 +36,67 @@ def most_popular_products():
             }
         }
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+def build_facet():
+    # Stages run on orders with order_items already unwound, see queries.order_facts
+    return build_pipeline()[1:]
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def most_popular_products(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None, approximate=False):
+    """
+    Identifies the most frequently purchased products.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+        approximate (bool): Read the top products from the Count-Min sketch of
+            utils.sketches. Filtered queries, the local backend and missing or
+            stale sketches fall back to the exact result.
+
+    Returns:
+        pd.DataFrame: DataFrame containing product details and purchase counts.
+        With approximate, a purchase_count_error column holds how much each count
+        may exceed the true one (0 for exact results).
+    """
+    filters = dict(
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
+    if local_store.enabled():
+        df = local.most_popular_products(**filters)
+        return df.assign(purchase_count_error=0) if approximate else df
+    db = get_database()
+    if approximate and not has_filters(**filters):
+        sketch = sketches.read_top_products(db, 10)
+        if sketch is not None:
+            return top_products_frame(db, *sketch)
+    result = order_facts.aggregate(
+        db, "most_popular_products",
+        sort=[("purchase_count", -1)],
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
     df = pd.DataFrame(result)
-    return df
+    return df.assign(purchase_count_error=0) if approximate else df
+
+def top_products_frame(db, top, error):
+    # Estimated counts with the product details the exact pipeline looks up
+    products = {
+        product["_id"]: product
+        for product in db.products.find(
+            { "_id": { "$in": [product_id for product_id, _ in top] } },
+            { "product_category_name_english": 1, "product_name_lenght": 1 }
+        )
+    }
+    return pd.DataFrame([
+        {
+            "product_id": product_id,
+            "purchase_count": count,
+            "product_category": products.get(product_id, {}).get("product_category_name_english"),
+            "product_name_length": products.get(product_id, {}).get("product_name_lenght"),
+            "purchase_count_error": error,
+        }
+        for product_id, count in top
+    ])
@@ -1,21 +1,18 @@
 import pandas as pd
 from utils.db_connection import get_database
+from utils import summaries
+from utils.distributions import build_distribution_stage, supports_percentile, to_distribution
+from queries import filters, local
+from utils import instrumentation, local_store, result_cache
 import streamlit as st
 
-@st.cache_data
-def average_delivery_time_per_seller():
-    """
-    Computes the average delivery time from order approval to customer delivery for each seller.
-
-    Returns:
-        pd.DataFrame: DataFrame containing seller IDs and their average delivery times in days.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline():
+    return [
         {
+            # Missing dates are stored as null, $type matches the partial index filter
             "$match": {
-                "order_approved_at": { "$ne": None },
-                "order_delivered_customer_date": { "$ne": None }
+                "order_approved_at": { "$type": "date" },
+                "order_delivered_customer_date": { "$type": "date" }
             }
         },
         { "$unwind": "$order_items" },
@@ -49,7 +46,57 @@ def average_delivery_time_per_seller():
             "$sort": { "average_delivery_time_in_days": 1 }
         }
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def average_delivery_time_per_seller(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Computes the average delivery time from order approval to customer delivery for each seller.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing seller IDs and their average delivery times in days.
+    """
+    if local_store.enabled():
+        return local.average_delivery_time_per_seller(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = summaries.aggregate(
+        db, "average_delivery_time_per_seller", "orders", build_pipeline(),
+        sort=[("average_delivery_time_in_days", 1)],
+        filter_stages=filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+    )
     df = pd.DataFrame(result)
     df.rename(columns={"_id": "seller_id"}, inplace=True)
     return df
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached(query="average_delivery_time_per_seller")
+def delivery_time_distribution(buckets=100, start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Summarizes the average delivery times per seller on the server as a histogram
+    and quantiles.
+
+    Args:
+        buckets (int): Number of histogram bins, chosen by $bucketAuto.
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        tuple: DataFrame with bin_start, bin_end and count per bin, and a dict with
+        the number of sellers and the p50, p90 and p99 average delivery times.
+    """
+    if local_store.enabled():
+        per_seller = local.average_delivery_time_per_seller(start_date, end_date, customer_state, product_category, seller_id)
+        return local.distribution(per_seller["average_delivery_time_in_days"], buckets=buckets)
+    db = get_database()
+    result = summaries.aggregate_rows(
+        db, "average_delivery_time_per_seller", "orders", build_pipeline(),
+        [build_distribution_stage("average_delivery_time_in_days", buckets=buckets, use_percentile=supports_percentile(db))],
+        filter_stages=filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+    )
+    return to_distribution(result)
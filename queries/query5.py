@@ -1,18 +1,12 @@
 import pandas as pd
 from utils.db_connection import get_database
+from queries import order_facts
+from queries import local
+from utils import instrumentation, local_store, result_cache
 import streamlit as st
 
-@st.cache_data
-def top_rated_products():
-    """
-    Retrieves the top 10 products with the highest average review scores,
-    considering only products with at least 100 reviews.
-
-    Returns:
-        pd.DataFrame: DataFrame containing product details and review statistics.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline():
+    return [
         { "$unwind": "$order_items" },
         { "$match": { "review.review_score": { "$ne": None } } },
         {
@@ -45,6 +39,34 @@ def top_rated_products():
             }
         }
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+def build_facet():
+    # Stages run on orders with order_items already unwound, see queries.order_facts
+    return build_pipeline()[1:]
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def top_rated_products(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Retrieves the top 10 products with the highest average review scores,
+    considering only products with at least 100 reviews.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing product details and review statistics.
+    """
+    if local_store.enabled():
+        return local.top_rated_products(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = order_facts.aggregate(
+        db, "top_rated_products",
+        sort=[("average_review_score", -1), ("review_count", -1)],
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
     df = pd.DataFrame(result)
     return df
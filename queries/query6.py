@@ -1,18 +1,12 @@
 import pandas as pd
 from utils.db_connection import get_database
+from utils import summaries
+from queries import filters, local
+from utils import instrumentation, local_store, result_cache
 import streamlit as st
 
-@st.cache_data
-def most_common_payment_types():
-    """
-    Determines the distribution of payment types used by customers across all orders,
-    including the count and total payment value for each type.
-
-    Returns:
-        pd.DataFrame: DataFrame containing payment type statistics.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline():
+    return [
         { "$unwind": "$payment" },
         {
             "$group": {
@@ -23,7 +17,30 @@ def most_common_payment_types():
         },
         { "$sort": { "count": -1 } }
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def most_common_payment_types(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Determines the distribution of payment types used by customers across all orders,
+    including the count and total payment value for each type.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing payment type statistics.
+    """
+    if local_store.enabled():
+        return local.most_common_payment_types(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = summaries.aggregate(
+        db, "most_common_payment_types", "orders", build_pipeline(),
+        sort=[("count", -1)],
+        filter_stages=filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+    )
     df = pd.DataFrame(result)
     df.rename(columns={'_id': 'payment_type'}, inplace=True)
     return df
@@ -1,17 +1,25 @@
 import pandas as pd
 from utils.db_connection import get_database
+from queries import order_facts
+from queries import local
+from utils import instrumentation, local_store, result_cache
 import streamlit as st
 
-@st.cache_data
-def sales_by_product_category():
-    """
-    Calculates the total sales amount and the number of orders for each product category.
-
-    Returns:
-        pd.DataFrame: DataFrame containing sales statistics by product category.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline(embedded=False):
+    if embedded:
+        return [
+            {"$unwind": "$order_items"},
+            {"$match": {"order_items.product_category_name_english": {"$ne": None}}},
+            {
+                "$group": {
+                    "_id": "$order_items.product_category_name_english",
+                    "total_sales": {"$sum": "$order_items.price"},
+                    "total_orders": {"$sum": 1},
+                }
+            },
+            {"$sort": {"total_sales": -1}},
+        ]
+    return [
         {"$unwind": "$order_items"},
         {
             "$lookup": {
@@ -31,7 +39,34 @@ def sales_by_product_category():
         },
         {"$sort": {"total_sales": -1}},
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+def build_facet(embedded=False):
+    # Stages run on orders with order_items already unwound, see queries.order_facts
+    return build_pipeline(embedded)[1:]
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def sales_by_product_category(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Calculates the total sales amount and the number of orders for each product category.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing sales statistics by product category.
+    """
+    if local_store.enabled():
+        return local.sales_by_product_category(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = order_facts.aggregate(
+        db, "sales_by_product_category",
+        sort=[("total_sales", -1)],
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
     df = pd.DataFrame(result)
     df.rename(columns={"_id": "product_category"}, inplace=True)
     return df
@@ -1,17 +1,14 @@
 import pandas as pd
 from utils.db_connection import get_database
+from utils import summaries
+from queries import filters, local
+from utils import instrumentation, local_store, result_cache, sketches
 import streamlit as st
 
-@st.cache_data
-def top_cities_by_customers():
-    """
-    Identifies the top 10 cities with the highest number of registered customers.
-
-    Returns:
-        pd.DataFrame: DataFrame containing cities and their customer counts.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline():
+    return [
+        # Sorting first lets the unique_id_city index answer the $group with a DISTINCT_SCAN
+        { "$sort": { "customer_unique_id": 1 } },
         {
             "$group": {
                 "_id": "$customer_unique_id",
@@ -27,7 +24,130 @@ def top_cities_by_customers():
         { "$sort": { "customer_count": -1 } },
         { "$limit": 10 }
     ]
-    result = list(db.customers.aggregate(pipeline))
+
+def build_buyers_pipeline():
+    return [
+        # One row per customer_id with an order, then per distinct person and state
+        { "$group": { "_id": "$customer_id" } },
+        {
+            "$lookup": {
+                "from": "customers",
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "customer"
+            }
+        },
+        { "$unwind": "$customer" },
+        { "$group": { "_id": { "customer_state": "$customer.customer_state", "customer_unique_id": "$customer.customer_unique_id" } } },
+        { "$group": { "_id": "$_id.customer_state", "buyer_count": { "$sum": 1 } } },
+        { "$sort": { "buyer_count": -1 } }
+    ]
+
+def build_customer_filter_stages(db, start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Builds the stages selecting the customers the filters apply to.
+
+    Returns:
+        tuple: The collection the stages start from and the stages, which output
+        customer documents. The stages are empty without filters.
+    """
+    if start_date is None and end_date is None and product_category is None and seller_id is None:
+        return "customers", [{ "$match": { "customer_state": customer_state } }] if customer_state is not None else []
+    # Customers with a matching order
+    return "orders", filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id) + [
+        { "$group": { "_id": "$customer_id" } },
+        {
+            "$lookup": {
+                "from": "customers",
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "customer"
+            }
+        },
+        { "$unwind": "$customer" },
+        { "$replaceRoot": { "newRoot": "$customer" } }
+    ]
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def top_cities_by_customers(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None, approximate=False):
+    """
+    Identifies the top 10 cities with the highest number of registered customers.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters. Order filters count the customers with a matching
+            order, see queries.filters.build_stages.
+        approximate (bool): Read the counts from the per-city HyperLogLogs of
+            utils.sketches. Filtered queries, the local backend and missing or
+            stale sketches fall back to the exact result.
+
+    Returns:
+        pd.DataFrame: DataFrame containing cities and their customer counts.
+        With approximate, a customer_count_error column holds the half-width of
+        a 95% interval around each count (0 for exact results).
+    """
+    if local_store.enabled():
+        df = local.top_cities_by_customers(start_date, end_date, customer_state, product_category, seller_id)
+        return df.assign(customer_count_error=0) if approximate else df
+    db = get_database()
+    if approximate and not filters.has_filters(
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    ):
+        rows = sketches.read_distinct_counts(db, sketches.CITY_CUSTOMERS, limit=10)
+        if rows is not None:
+            return pd.DataFrame(
+                [(row["key"], row["estimate"], row["error"]) for row in rows],
+                columns=["customer_city", "customer_count", "customer_count_error"]
+            )
+    collection, filter_stages = build_customer_filter_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+    result = summaries.aggregate(
+        db, "top_cities_by_customers", collection, build_pipeline(),
+        sort=[("customer_count", -1)],
+        filter_stages=filter_stages
+    )
     df = pd.DataFrame(result)
     df.rename(columns={'_id': 'customer_city'}, inplace=True)
-    return df
+    return df.assign(customer_count_error=0) if approximate else df
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def distinct_buyers_by_state(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None, approximate=False):
+    """
+    Counts the distinct people (customer_unique_id) who placed an order, per
+    customer state.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+        approximate (bool): Read the counts from the per-state HyperLogLogs of
+            utils.sketches. Filtered queries, the local backend and missing or
+            stale sketches fall back to the exact result.
+
+    Returns:
+        pd.DataFrame: DataFrame containing states and their buyer counts. With
+        approximate, a buyer_count_error column holds the half-width of a 95%
+        interval around each count (0 for exact results).
+    """
+    if local_store.enabled():
+        df = local.distinct_buyers_by_state(start_date, end_date, customer_state, product_category, seller_id)
+        return df.assign(buyer_count_error=0) if approximate else df
+    db = get_database()
+    filter_stages = filters.build_stages(db, start_date, end_date, customer_state, product_category, seller_id)
+    if approximate and not filter_stages:
+        rows = sketches.read_distinct_counts(db, sketches.STATE_BUYERS)
+        if rows is not None:
+            return pd.DataFrame(
+                [(row["key"], row["estimate"], row["error"]) for row in rows],
+                columns=["customer_state", "buyer_count", "buyer_count_error"]
+            )
+    result = summaries.aggregate(
+        db, "distinct_buyers_by_state", "orders", build_buyers_pipeline(),
+        sort=[("buyer_count", -1)],
+        filter_stages=filter_stages
+    )
+    df = pd.DataFrame(result, columns=["_id", "buyer_count"]).rename(columns={"_id": "customer_state"})
+    return df.assign(buyer_count_error=0) if approximate else df
@@ -1,17 +1,31 @@
 import pandas as pd
 from utils.db_connection import get_database
+from queries import order_facts
+from queries import local
+from utils import instrumentation, local_store, result_cache
 import streamlit as st
 
-@st.cache_data
-def average_freight_value_by_state():
-    """
-    Computes the average freight (shipping) value charged to customers in each state.
-
-    Returns:
-        pd.DataFrame: DataFrame containing states and their average freight values.
-    """
-    db = get_database()
-    pipeline = [
+def build_pipeline(embedded=False):
+    if embedded:
+        # Sum freight and item counts per order instead of unwinding every item.
+        return [
+            { "$match": { "order_items.0": { "$exists": True }, "customer_state": { "$ne": None } } },
+            {
+                "$group": {
+                    "_id": "$customer_state",
+                    "total_freight_value": { "$sum": { "$sum": "$order_items.freight_value" } },
+                    "total_orders": { "$sum": { "$size": "$order_items" } }
+                }
+            },
+            {
+                "$project": {
+                    "average_freight_value": { "$divide": ["$total_freight_value", "$total_orders"] },
+                    "total_orders": 1
+                }
+            },
+            { "$sort": { "average_freight_value": -1 } }
+        ]
+    return [
         { "$unwind": "$order_items" },
         {
             "$lookup": {
@@ -31,7 +45,46 @@ def average_freight_value_by_state():
         },
         { "$sort": { "average_freight_value": -1 } }
     ]
-    result = list(db.orders.aggregate(pipeline))
+
+def build_facet(embedded=False):
+    # Stages run on orders with order_items already unwound, see queries.order_facts
+    if embedded:
+        return [
+            { "$match": { "customer_state": { "$ne": None } } },
+            {
+                "$group": {
+                    "_id": "$customer_state",
+                    "average_freight_value": { "$avg": "$order_items.freight_value" },
+                    "total_orders": { "$sum": 1 }
+                }
+            },
+            { "$sort": { "average_freight_value": -1 } }
+        ]
+    return build_pipeline()[1:]
+
+@instrumentation.instrumented
+@st.cache_data
+@result_cache.cached
+def average_freight_value_by_state(start_date=None, end_date=None, customer_state=None, product_category=None, seller_id=None):
+    """
+    Computes the average freight (shipping) value charged to customers in each state.
+
+    Args:
+        start_date, end_date, customer_state, product_category, seller_id:
+            Optional filters, see queries.filters.build_stages.
+
+    Returns:
+        pd.DataFrame: DataFrame containing states and their average freight values.
+    """
+    if local_store.enabled():
+        return local.average_freight_value_by_state(start_date, end_date, customer_state, product_category, seller_id)
+    db = get_database()
+    result = order_facts.aggregate(
+        db, "average_freight_value_by_state",
+        sort=[("average_freight_value", -1)],
+        start_date=start_date, end_date=end_date, customer_state=customer_state,
+        product_category=product_category, seller_id=seller_id
+    )
     df = pd.DataFrame(result)
     df.rename(columns={'_id': 'customer_state'}, inplace=True)
     return df
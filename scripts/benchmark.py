@@ -0,0 +1,239 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import pandas as pd
+import pymongo
+import streamlit as st
+from utils import instrumentation, synthetic
+from utils.db_connection import DEFAULT_DATABASE_NAME, get_database
+from utils.schema import get_month_partitions, has_embedded_dimensions
+from queries import query1, query2, query3, query4, query5, query6, query7, query8, query9, query10
+
+DEFAULT_URI = "mongodb://localhost:27017"
+REPORT_VERSION = 1
+SCALES = { "100k": 100_000, "1M": 1_000_000, "10M": 10_000_000 }
+# Query functions timed by 'run', the ten sidebar queries and the calls behind the charts
+BENCHMARKS = {
+    "monthly_sales_trends": query1.monthly_sales_trends,
+    "sales_trends_daily": lambda: query1.sales_trends("day"),
+    "average_order_value_by_state": query2.average_order_value_by_state,
+    "most_popular_products": query3.most_popular_products,
+    "average_delivery_time_per_seller": query4.average_delivery_time_per_seller,
+    "delivery_time_distribution": query4.delivery_time_distribution,
+    "top_rated_products": query5.top_rated_products,
+    "most_common_payment_types": query6.most_common_payment_types,
+    "sales_by_product_category": query7.sales_by_product_category,
+    "top_cities_by_customers": query8.top_cities_by_customers,
+    "distinct_buyers_by_state": query8.distinct_buyers_by_state,
+    # Served from the sketches with --summaries, exact otherwise
+    "most_popular_products_approximate": lambda: query3.most_popular_products(approximate=True),
+    "top_cities_by_customers_approximate": lambda: query8.top_cities_by_customers(approximate=True),
+    "distinct_buyers_by_state_approximate": lambda: query8.distinct_buyers_by_state(approximate=True),
+    "average_freight_value_by_state": query9.average_freight_value_by_state,
+    "orders_with_delayed_delivery": query10.orders_with_delayed_delivery,
+    "delayed_orders_page": lambda: query10.delayed_orders_page()[0],
+    "delay_distribution": lambda: query10.delay_distribution()[0],
+}
+# Collections whose query plans are cleared before the cold runs
+PLAN_CACHE_COLLECTIONS = ("orders", "customers", "products")
+
+def parse_scale(value):
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(SCALES)} or a number of orders, got '{value}'")
+
+def use_server(uri):
+    # The benchmark never falls back to MONGODB_CONNECTION_STRING from .env, it would overwrite that database
+    os.environ["MONGODB_CONNECTION_STRING"] = uri
+    os.environ["MONGODB_DATABASE"] = DEFAULT_DATABASE_NAME
+
+def generate(args):
+    start = time.perf_counter()
+    counts = synthetic.generate_dataset(args.data_dir, args.scale, seed=args.seed, chunk_size=args.chunk_size)
+    for file_name, count in counts.items():
+        print(f"Wrote {count} rows to '{file_name}'.")
+    print(f"Generated {args.scale} orders in {time.perf_counter() - start:.1f} s.")
+
+def load(args):
+    client = pymongo.MongoClient(args.uri)
+    db = client[DEFAULT_DATABASE_NAME]
+    if db.orders.estimated_document_count():
+        if not args.drop:
+            raise SystemExit(f"'{DEFAULT_DATABASE_NAME}' on {args.uri} already holds orders, pass --drop to replace it.")
+        client.drop_database(DEFAULT_DATABASE_NAME)
+        print(f"Dropped '{DEFAULT_DATABASE_NAME}'.")
+    client.close()
+
+    command = [
+        sys.executable, "-m", "scripts.create", "--data-dir", args.data_dir, "--stream",
+        "--workers", str(args.workers), "--checkpoint", os.path.join(args.data_dir, "load_checkpoint.jsonl"),
+    ]
+    if args.embed_dimensions:
+        command.append("--embed-dimensions")
+    if args.partition_by_month:
+        command.append("--partition-by-month")
+    use_server(args.uri)
+    start = time.perf_counter()
+    subprocess.run(command, check=True, env=os.environ)
+    print(f"Loaded '{args.data_dir}' in {time.perf_counter() - start:.1f} s.")
+    if args.summaries:
+        subprocess.run([sys.executable, "-m", "scripts.preaggregate"], check=True, env=os.environ)
+
+def time_query(function):
+    # Clear the in-memory caches so every run executes the pipelines
+    st.cache_data.clear()
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1000
+
+def code_version():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return { "commit": None, "dirty": None }
+    return { "commit": commit, "dirty": dirty }
+
+def run(args):
+    use_server(args.uri)
+    # Results must be computed by the pipelines, not read from the result cache or the summaries
+    os.environ["RESULT_CACHE_TTL_SECONDS"] = "0"
+    if not args.summaries:
+        os.environ["SUMMARY_MAX_AGE_SECONDS"] = "0"
+    # Explains would re-run the pipelines while others are being timed
+    os.environ["QUERY_EXPLAIN"] = "off"
+    instrumentation.logger.setLevel(logging.WARNING)
+
+    db = get_database()
+    names = args.only or list(BENCHMARKS)
+    results = {}
+
+    # Cold: the first run of each query in this process, with empty query plan caches.
+    # Restart mongod before 'run' to also start from an empty storage engine cache.
+    for collection in PLAN_CACHE_COLLECTIONS:
+        db.command("planCacheClear", collection)
+    for name in names:
+        instrumentation.clear()
+        result, cold_ms = time_query(BENCHMARKS[name])
+        results[name] = {
+            "rows": len(result),
+            "cold_ms": round(cold_ms, 1),
+            # Reads the instrumented query function made, see utils.instrumentation
+            "pipelines": [
+                { key: record.get(key) for key in ("collection", "kind", "stages", "wall_ms", "returned") }
+                for call in instrumentation.history() for record in call["pipelines"]
+            ],
+        }
+        print(f"{name:<34} cold {cold_ms:>10.1f} ms")
+
+    # Warm: the following runs, with the server caches filled by the earlier ones
+    for name in names:
+        timings = [time_query(BENCHMARKS[name])[1] for _ in range(args.repeat)]
+        results[name].update(
+            warm_ms=round(statistics.median(timings), 1),
+            warm_min_ms=round(min(timings), 1),
+            warm_max_ms=round(max(timings), 1),
+            warm_runs_ms=[round(timing, 1) for timing in timings],
+        )
+        print(f"{name:<34} warm {results[name]['warm_ms']:>10.1f} ms (min {results[name]['warm_min_ms']:.1f}, max {results[name]['warm_max_ms']:.1f})")
+
+    report = {
+        "report_version": REPORT_VERSION,
+        "label": args.label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "code": code_version(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pymongo": pymongo.version,
+            "pandas": pd.__version__,
+            "mongodb": db.client.server_info()["version"],
+        },
+        "dataset": {
+            "orders": db.orders.estimated_document_count(),
+            "customers": db.customers.estimated_document_count(),
+            "products": db.products.estimated_document_count(),
+            "sellers": db.sellers.estimated_document_count(),
+            "embedded_dimensions": has_embedded_dimensions(db),
+            "month_partitions": len(get_month_partitions(db)),
+        },
+        "settings": { "repeat": args.repeat, "summaries": args.summaries },
+        "queries": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to '{args.output}'.")
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = []
+    print(f"{'query':<34}{'baseline (ms)':>15}{'current (ms)':>14}{'change':>9}")
+    for name, result in current["queries"].items():
+        if name not in baseline["queries"]:
+            print(f"{name:<34}{'-':>15}{result[args.metric]:>14.1f}")
+            continue
+        before, after = baseline["queries"][name][args.metric], result[args.metric]
+        change = (after - before) / before if before else 0.0
+        # Differences of a few milliseconds are noise, whatever their ratio
+        regressed = change > args.threshold and after - before > args.min_ms
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<34}{before:>15.1f}{after:>14.1f}{change:>+8.0%}{'  regression' if regressed else ''}")
+    if baseline.get("dataset") != current.get("dataset"):
+        print("Warning: the reports were made on different datasets.")
+    if regressions:
+        raise SystemExit(f"{len(regressions)} queries are more than {args.threshold:.0%} slower: {', '.join(regressions)}.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard queries on synthetic Olist data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="Write synthetic Olist CSV files.")
+    generate_parser.add_argument("--scale", type=parse_scale, default=SCALES["100k"], help="Orders to generate: 100k, 1M, 10M or a number.")
+    generate_parser.add_argument("--data-dir", required=True, help="Output directory.")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument("--chunk-size", type=int, default=synthetic.DEFAULT_CHUNK_SIZE, help="Orders generated at a time.")
+
+    load_parser = commands.add_parser("load", help="Load the CSV files into a MongoDB server with scripts.create.")
+    load_parser.add_argument("--data-dir", required=True)
+    load_parser.add_argument("--uri", default=DEFAULT_URI, help=f"Server to load, {DEFAULT_URI} by default.")
+    load_parser.add_argument("--drop", action="store_true", help="Replace the database if it already holds orders.")
+    load_parser.add_argument("--workers", type=int, default=4, help="Writer threads per collection.")
+    load_parser.add_argument("--embed-dimensions", action="store_true")
+    load_parser.add_argument("--partition-by-month", action="store_true", help="Also copy the orders into month partitions.")
+    load_parser.add_argument("--summaries", action="store_true", help="Also materialize the summaries.")
+
+    run_parser = commands.add_parser("run", help="Time each query function cold and warm and write a JSON report.")
+    run_parser.add_argument("--uri", default=DEFAULT_URI)
+    run_parser.add_argument("--repeat", type=int, default=5, help="Warm runs per query.")
+    run_parser.add_argument("--output", default="benchmark_report.json")
+    run_parser.add_argument("--label", help="Free-form label stored in the report, e.g. the scale.")
+    run_parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Time only these queries.")
+    run_parser.add_argument("--summaries", action="store_true", help="Serve the queries from fresh summaries, rollups and sketches instead of running them.")
+
+    compare_parser = commands.add_parser("compare", help="Compare two reports, exit with status 1 on regressions.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--metric", default="warm_ms", choices=["warm_ms", "warm_min_ms", "cold_ms"])
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown reported as a regression.")
+    compare_parser.add_argument("--min-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this.")
+
+    args = parser.parse_args()
+    { "generate": generate, "load": load, "run": run, "compare": compare }[args.command](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import argparse
+import statistics
+import time
+from utils.db_connection import get_database
+from utils.schema import has_embedded_dimensions
+from queries import query2, query7, query9, query10
+
+# Queries whose pipelines differ between the $lookup and the embedded schema
+QUERIES = {
+    "average_order_value_by_state": query2.build_pipeline,
+    "sales_by_product_category": query7.build_pipeline,
+    "average_freight_value_by_state": query9.build_pipeline,
+    "orders_with_delayed_delivery": query10.build_pipeline,
+}
+
+def time_pipeline(db, pipeline, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = list(db.orders.aggregate(pipeline))
+        timings.append((time.perf_counter() - start) * 1000)
+    return rows, timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query times on the $lookup and the embedded orders schema.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per pipeline.")
+    args = parser.parse_args()
+
+    db = get_database()
+    if not has_embedded_dimensions(db):
+        raise SystemExit("The orders collection has no embedded dimensions, reload it with 'python -m scripts.create --embed-dimensions'.")
+
+    print(f"{'query':<34}{'lookup (ms)':>14}{'embedded (ms)':>16}{'speedup':>10}")
+    for name, build_pipeline in QUERIES.items():
+        lookup_rows, lookup_timings = time_pipeline(db, build_pipeline(embedded=False), args.repeat)
+        embedded_rows, embedded_timings = time_pipeline(db, build_pipeline(embedded=True), args.repeat)
+        if len(lookup_rows) != len(embedded_rows):
+            print(f"Warning: '{name}' returned {len(lookup_rows)} rows with $lookup and {len(embedded_rows)} embedded.")
+
+        lookup_ms = statistics.median(lookup_timings)
+        embedded_ms = statistics.median(embedded_timings)
+        print(f"{name:<34}{lookup_ms:>14.1f}{embedded_ms:>16.1f}{lookup_ms / embedded_ms:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
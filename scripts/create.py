@@ -1,13 +1,89 @@
+import argparse
 import pandas as pd
 import pymongo
-import json
-import pickle
-from datetime import datetime
 from dotenv import load_dotenv
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.loader import (
+    build_order_documents,
+    embed_dimensions,
+    group_records,
+    peak_memory_mb,
+    push_order_children,
+    read_dataset_csv,
+    stream_documents,
+    stream_order_documents,
+    to_document_frame,
+    write_batches,
+    ORDER_ITEM_DATE_COLUMNS,
+    REVIEW_DATE_COLUMNS,
+)
+from utils.checkpoint import CheckpointJournal
+from utils.incremental import (
+    add_dimensions,
+    classify_order_changes,
+    get_purchase_watermark,
+    listed_order_ids,
+    load_orders,
+    read_extract,
+    set_reviews,
+    split_changed,
+    upsert_documents,
+)
+from utils.schema import bump_data_version, get_month_partitions, has_embedded_dimensions, set_embedded_dimensions
+from utils import partitions, result_cache, rollups, sketches, summaries
+from queries.catalog import affected_queries, affected_results
+from utils.indexes import create_indexes
 
 load_dotenv()
 
+parser = argparse.ArgumentParser(description="Import the Olist CSV files into MongoDB.")
+parser.add_argument(
+    '--embed-dimensions',
+    action='store_true',
+    help="Embed customer_state/customer_city on each order and product_category_name_english on each order item."
+)
+parser.add_argument(
+    '--workers',
+    type=int,
+    default=1,
+    help="Writer threads per collection. With more than one, batches are written unordered and the customers, "
+         "geolocations, sellers and products collections load in parallel while the orders are built."
+)
+parser.add_argument('--batch-size', type=int, default=1000, help="Documents per insert_many call.")
+parser.add_argument(
+    '--stream',
+    action='store_true',
+    help="Read the CSV files in chunks and write documents as they are read, keeping memory bounded."
+)
+parser.add_argument('--chunk-size', type=int, default=50000, help="Rows per CSV chunk in --stream mode.")
+parser.add_argument('--data-dir', default='./dataset', help="Directory holding the Olist CSV files.")
+parser.add_argument(
+    '--incremental',
+    action='store_true',
+    help="Upsert only the new or changed orders, customers and reviews found in --data-dir, "
+         "and mark the affected summaries stale."
+)
+parser.add_argument(
+    '--partition-by-month',
+    action='store_true',
+    help="Also copy the orders into one collection per purchase month (orders_YYYY_MM), which queries filtered by "
+         "purchase date read instead of the whole orders collection. Incremental loads keep existing partitions up to date."
+)
+parser.add_argument(
+    '--sketches',
+    action='store_true',
+    help="Also build the Count-Min and HyperLogLog sketches answering the approximate top products, top cities "
+         "and buyers per state. Incremental loads keep existing sketches up to date."
+)
+parser.add_argument(
+    '--checkpoint',
+    default='load_checkpoint.jsonl',
+    help="Journal recording the load progress. An interrupted load resumes from it; it is removed once the load completes."
+)
+args = parser.parse_args()
+
 mongo_connection_string = os.getenv('MONGODB_CONNECTION_STRING')
 
 # Connect to MongoDB
@@ -15,194 +91,323 @@ client = pymongo.MongoClient(mongo_connection_string, timeoutMS=10*60*1000)
 db = client['olistDB']
 print("Connected to MongoDB.")
 
-# Load CSV data into DataFrames
-customers_df = pd.read_csv('./dataset/olist_customers_dataset.csv')
-geolocations_df = pd.read_csv('./dataset/olist_geolocation_dataset.csv')
-order_items_df = pd.read_csv('./dataset/olist_order_items_dataset.csv')
-order_payments_df = pd.read_csv('./dataset/olist_order_payments_dataset.csv')
-order_reviews_df = pd.read_csv('./dataset/olist_order_reviews_dataset.csv')
-orders_df = pd.read_csv('./dataset/olist_orders_dataset.csv')
-products_df = pd.read_csv('./dataset/olist_products_dataset.csv')
-sellers_df = pd.read_csv('./dataset/olist_sellers_dataset.csv')
-product_category_translation_df = pd.read_csv('./dataset/product_category_name_translation.csv')
-print("Data loaded into DataFrames.")
+# ------------------ Checkpoint Journal ------------------
 
-# ------------------ Customers Collection ------------------
+journal = CheckpointJournal(args.checkpoint)
+if journal.resumed:
+    print(f"Resuming the load recorded in '{args.checkpoint}'.")
 
-# Rename 'customer_id' to '_id' for MongoDB
-customers_df.rename(columns={'customer_id': '_id'}, inplace=True)
+# ------------------ Collection Writers ------------------
 
-# Convert DataFrame to dictionary format
-customers_data = customers_df.to_dict(orient='records')
+def load_collection(name, documents):
+    if journal.is_done(name):
+        print(f"{name.capitalize()} collection already loaded, skipping.")
+        return
+    start = time.perf_counter()
+    inserted = write_batches(
+        db[name],
+        documents,
+        batch_size=journal.batch_size(name, args.batch_size),
+        workers=args.workers,
+        on_batch=lambda index, batch: journal.record_batch(name, index),
+        skip=journal.completed_batches(name)
+    )
+    journal.complete(name)
+    seconds = time.perf_counter() - start
+    print(f"{name.capitalize()} collection inserted: {inserted} documents in {seconds:.1f}s ({inserted / max(seconds, 1e-9):.0f} docs/s).")
 
-# Insert data into MongoDB
-db.customers.insert_many(customers_data)
+# Independent collections load in the background while the orders are built
+collection_loader = ThreadPoolExecutor(max_workers=4, thread_name_prefix="load") if args.workers > 1 else None
+collection_loads = []
 
-print("Customers collection inserted.")
+def submit_collection(name, documents):
+    if collection_loader:
+        collection_loads.append(collection_loader.submit(load_collection, name, documents))
+    else:
+        load_collection(name, documents)
 
-# ------------------ Geolocations Collection ------------------
+def add_category_translation(products_df, product_category_translation_df):
+    # Merge product category translations
+    products_df = pd.merge(products_df, product_category_translation_df, on='product_category_name', how='left')
 
-# Convert DataFrame to dictionary format
-geolocations_data = geolocations_df.to_dict(orient='records')
+    # Replace NaN in 'product_category_name_english' with 'Unknown'
+    products_df['product_category_name_english'] = products_df['product_category_name_english'].fillna('Unknown')
+    return products_df
 
-# Insert data into MongoDB
-db.geolocations.insert_many(geolocations_data)
+def add_geolocation_ids(geolocations_df):
+    # Geolocations have no natural key, the row number makes retried batches idempotent
+    return geolocations_df.assign(_id=geolocations_df.index)
 
-print("Geolocations collection inserted.")
+# ------------------ In-memory Load ------------------
 
-# ------------------ Sellers Collection ------------------
+def load_in_memory():
+    # Load CSV data into DataFrames
+    customers_df = read_dataset_csv(args.data_dir, 'olist_customers_dataset.csv')
+    geolocations_df = read_dataset_csv(args.data_dir, 'olist_geolocation_dataset.csv')
+    order_items_df = read_dataset_csv(args.data_dir, 'olist_order_items_dataset.csv')
+    order_payments_df = read_dataset_csv(args.data_dir, 'olist_order_payments_dataset.csv')
+    order_reviews_df = read_dataset_csv(args.data_dir, 'olist_order_reviews_dataset.csv')
+    orders_df = read_dataset_csv(args.data_dir, 'olist_orders_dataset.csv')
+    products_df = read_dataset_csv(args.data_dir, 'olist_products_dataset.csv')
+    sellers_df = read_dataset_csv(args.data_dir, 'olist_sellers_dataset.csv')
+    product_category_translation_df = read_dataset_csv(args.data_dir, 'product_category_name_translation.csv')
+    print("Data loaded into DataFrames.")
 
-# Rename 'seller_id' to '_id' for MongoDB
-sellers_df.rename(columns={'seller_id': '_id'}, inplace=True)
+    # ------------------ Customers Collection ------------------
 
-# Convert DataFrame to dictionary format
-sellers_data = sellers_df.to_dict(orient='records')
+    # Rename 'customer_id' to '_id' for MongoDB
+    customers_df.rename(columns={'customer_id': '_id'}, inplace=True)
 
-# Insert data into MongoDB
-db.sellers.insert_many(sellers_data)
+    # Convert DataFrame to dictionary format and insert it into MongoDB
+    submit_collection('customers', to_document_frame(customers_df).to_dict(orient='records'))
 
-print("Sellers collection inserted.")
+    # ------------------ Geolocations Collection ------------------
 
-# ------------------ Products Collection ------------------
+    submit_collection('geolocations', to_document_frame(add_geolocation_ids(geolocations_df)).to_dict(orient='records'))
 
-# Merge product category translations
-products_df = pd.merge(products_df, product_category_translation_df, on='product_category_name', how='left')
+    # ------------------ Sellers Collection ------------------
 
-# Replace NaN in 'product_category_name_english' with 'Unknown'
-products_df['product_category_name_english'].fillna('Unknown', inplace=True)
+    # Rename 'seller_id' to '_id' for MongoDB
+    sellers_df.rename(columns={'seller_id': '_id'}, inplace=True)
 
-# Rename 'product_id' to '_id' for MongoDB
-products_df.rename(columns={'product_id': '_id'}, inplace=True)
+    submit_collection('sellers', to_document_frame(sellers_df).to_dict(orient='records'))
 
-# Convert DataFrame to dictionary format
-products_data = products_df.to_dict(orient='records')
+    # ------------------ Products Collection ------------------
 
-# Insert data into MongoDB
-db.products.insert_many(products_data)
+    products_df = add_category_translation(products_df, product_category_translation_df)
 
-print("Products collection inserted.")
+    # Rename 'product_id' to '_id' for MongoDB
+    products_df.rename(columns={'product_id': '_id'}, inplace=True)
 
-# ------------------ Orders Collection ------------------
+    submit_collection('products', to_document_frame(products_df).to_dict(orient='records'))
 
-# Convert date columns to datetime
-date_columns = [
-    'order_purchase_timestamp',
-    'order_approved_at',
-    'order_delivered_carrier_date',
-    'order_delivered_customer_date',
-    'order_estimated_delivery_date'
-]
+    # ------------------ Orders Collection ------------------
 
-for col in date_columns:
-    orders_df[col] = pd.to_datetime(orders_df[col], errors='coerce')
+    # Denormalize customer location and product category into the orders
+    if args.embed_dimensions:
+        customer_dimensions_df = customers_df[['_id', 'customer_city', 'customer_state']].rename(columns={'_id': 'customer_id'})
+        orders_df = orders_df.merge(customer_dimensions_df, on='customer_id', how='left')
 
-# Prepare order items data
-order_items_df['shipping_limit_date'] = pd.to_datetime(order_items_df['shipping_limit_date'], errors='coerce')
-order_items_df.dropna(subset=['order_id'], inplace=True)
-order_items_grouped = order_items_df.groupby('order_id').apply(lambda x: x.to_dict(orient='records')).to_dict()
+        product_dimensions_df = products_df[['_id', 'product_category_name_english']].rename(columns={'_id': 'product_id'})
+        order_items_df = order_items_df.merge(product_dimensions_df, on='product_id', how='left')
 
-# Prepare order payments data
-order_payments_df.dropna(subset=['order_id'], inplace=True)
-order_payments_grouped = order_payments_df.groupby('order_id').apply(lambda x: x.to_dict(orient='records')).to_dict()
+    # ------------------ Build Order Documents ------------------
 
-# Prepare order reviews data
-review_date_columns = ['review_creation_date', 'review_answer_timestamp']
-for col in review_date_columns:
-    order_reviews_df[col] = pd.to_datetime(order_reviews_df[col], errors='coerce')
+    if journal.is_done('orders'):
+        print("Orders collection already loaded, skipping.")
+        return
 
-order_reviews_df.dropna(subset=['order_id'], inplace=True)
-order_reviews_grouped = order_reviews_df.groupby('order_id').apply(lambda x: x.to_dict(orient='records')).to_dict()
+    build_start = time.perf_counter()
+    orders_data = build_order_documents(orders_df, order_items_df, order_payments_df, order_reviews_df)
+    build_seconds = time.perf_counter() - build_start
+    print(f"Built {len(orders_data)} order documents in {build_seconds:.1f}s ({len(orders_data) / max(build_seconds, 1e-9):.0f} docs/s).")
 
-# ------------------ Caching Mechanism ------------------
+    # ------------------ Insert Orders ------------------
 
-# Load processed order IDs from cache if exists
-cache_file = 'processed_orders.pkl'
-if os.path.exists(cache_file):
-    with open(cache_file, 'rb') as f:
-        processed_order_ids = pickle.load(f)
-else:
-    processed_order_ids = set()
+    load_collection('orders', orders_data)
+
+# ------------------ Streaming Load ------------------
 
-# ------------------ Process and Insert Orders ------------------
+def load_streaming():
+    def chunks(file_name, chunk_size=args.chunk_size):
+        return read_dataset_csv(args.data_dir, file_name, chunk_size=chunk_size)
 
-batch_size = 1000
-orders_data_batch = []
-batch_count = 0
+    product_category_translation_df = read_dataset_csv(args.data_dir, 'product_category_name_translation.csv')
 
-try:
-    total_orders = len(orders_df)
-    for index, order in orders_df.iterrows():
-        order_dict = order.to_dict()
-        order_id = order_dict['order_id']
+    submit_collection('customers', stream_documents(chunks('olist_customers_dataset.csv'), rename={'customer_id': '_id'}))
+    submit_collection('geolocations', stream_documents(chunks('olist_geolocation_dataset.csv'), transform=add_geolocation_ids))
+    submit_collection('sellers', stream_documents(chunks('olist_sellers_dataset.csv'), rename={'seller_id': '_id'}))
+    submit_collection('products', stream_documents(
+        chunks('olist_products_dataset.csv'),
+        rename={'product_id': '_id'},
+        transform=lambda chunk: add_category_translation(chunk, product_category_translation_df)
+    ))
 
-        # Skip if order has been processed already
-        if order_id in processed_order_ids:
+    # Orders are written first, their items, payments and review are pushed into them afterwards
+    load_collection('orders', stream_order_documents(chunks('olist_orders_dataset.csv')))
+
+    children = [
+        ('olist_order_items_dataset.csv', 'order_items', ORDER_ITEM_DATE_COLUMNS, 'order_item_id', False),
+        ('olist_order_payments_dataset.csv', 'payment', (), 'payment_sequential', False),
+        ('olist_order_reviews_dataset.csv', 'review', REVIEW_DATE_COLUMNS, None, True),
+    ]
+    for file_name, field, date_columns, key, first_only in children:
+        stage = f"orders.{field}"
+        if journal.is_done(stage):
+            print(f"Rows of orders.{field} already embedded, skipping.")
             continue
+        start = time.perf_counter()
+        rows = push_order_children(
+            db.orders,
+            chunks(file_name, journal.batch_size(stage, args.chunk_size)),
+            field,
+            date_columns,
+            key=key,
+            first_only=first_only,
+            on_chunk=lambda index: journal.record_batch(stage, index),
+            skip=journal.completed_batches(stage)
+        )
+        journal.complete(stage)
+        print(f"Embedded {rows} rows into orders.{field} in {time.perf_counter() - start:.1f}s.")
+
+    # The customers and products must be complete before they are embedded
+    for future in collection_loads:
+        future.result()
+    if args.embed_dimensions and not journal.is_done('embed_dimensions'):
+        embed_dimensions(db)
+        journal.complete('embed_dimensions')
+        print("Customer and product dimensions embedded into orders.")
+
+# ------------------ Incremental Load ------------------
+
+def load_incremental():
+    customers_df = read_extract(args.data_dir, 'olist_customers_dataset.csv').rename(columns={'customer_id': '_id'})
+    orders_df = read_extract(args.data_dir, 'olist_orders_dataset.csv')
+    order_items_df = read_extract(args.data_dir, 'olist_order_items_dataset.csv')
+    order_payments_df = read_extract(args.data_dir, 'olist_order_payments_dataset.csv')
+    order_reviews_df = read_extract(args.data_dir, 'olist_order_reviews_dataset.csv')
+    embedded = has_embedded_dimensions(db)
+    watermark = get_purchase_watermark(db)
+    print(f"Loading the extract in '{args.data_dir}', purchase watermark {watermark}.")
+    changed = set()
+
+    # ------------------ Customers ------------------
+
+    new_customers, changed_customers = split_changed(db.customers, to_document_frame(customers_df).to_dict(orient='records'))
+    upsert_documents(db.customers, new_customers + [updated for _, updated in changed_customers])
+    if new_customers or changed_customers:
+        changed.add('customers')
+    print(f"Customers: {len(new_customers)} new, {len(changed_customers)} changed.")
+
+    # ------------------ Orders ------------------
+
+    if embedded:
+        orders_df, order_items_df = add_dimensions(db, orders_df, order_items_df, customers_df)
+    orders_data = build_order_documents(orders_df, order_items_df, order_payments_df, order_reviews_df)
+    # Stored children are kept unless the extract lists the order in their file
+    listed = listed_order_ids(args.data_dir, { 'order_items': order_items_df, 'payment': order_payments_df, 'review': order_reviews_df })
+
+    # Orders purchased after the watermark cannot be stored yet
+    def is_after_watermark(order):
+        purchased_at = order['order_purchase_timestamp']
+        return watermark is not None and purchased_at is not None and purchased_at > watermark
+
+    new_orders, changed_orders = load_orders(db.orders, orders_data, listed, is_known_new=is_after_watermark)
+    if new_orders:
+        changed.add('orders')
+    changed |= classify_order_changes(changed_orders)
+    print(f"Orders: {len(new_orders)} new, {len(changed_orders)} changed.")
+
+    # ------------------ Reviews ------------------
+
+    # Reviews of orders that are not part of the extract update the stored orders
+    extra_reviews_df = order_reviews_df[~order_reviews_df['order_id'].isin(orders_df['order_id'])]
+    reviews = {
+        order_id: records[0]
+        for order_id, records in group_records(to_document_frame(extra_reviews_df, REVIEW_DATE_COLUMNS)).items()
+    }
+    changed_reviews = set_reviews(db.orders, reviews)
+    if changed_reviews:
+        changed.add('reviews')
+    print(f"Reviews: {changed_reviews} changed on existing orders.")
+
+    # Stored orders of customers that moved carry a stale embedded location
+    if embedded:
+        moved_customer_ids = [
+            updated['_id'] for current, updated in changed_customers
+            if (current.get('customer_city'), current.get('customer_state')) != (updated.get('customer_city'), updated.get('customer_state'))
+        ]
+        if moved_customer_ids:
+            embed_dimensions(db, { "customer_id": { "$in": moved_customer_ids } })
+
+    # Month partitions holding any written order are copied again, including the
+    # months changed orders were purchased in before
+    if get_month_partitions(db):
+        months = partitions.months_of(current['order_purchase_timestamp'] for current, _ in changed_orders)
+        months |= partitions.months_of_orders(
+            db,
+            order_ids=[order['_id'] for order in new_orders] + [updated['_id'] for _, updated in changed_orders] + list(reviews),
+            customer_ids=moved_customer_ids if embedded else None,
+        )
+        refreshed = partitions.refresh_partitions(db, months)
+        print(f"Refreshed {len(refreshed)} month partitions: {', '.join(refreshed) or 'none'}.")
+
+    meta = sketches.update_sketches(db, new_orders, changed_orders, new_customers, changed_customers)
+    if meta:
+        print(f"Updated the sketches in {meta['duration_ms']} ms.")
+
+    stale = affected_queries(changed)
+    summaries.mark_stale(db, stale)
+    print(f"Marked {len(stale)} summaries stale: {', '.join(stale) or 'none'}.")
+
+    # Rollups are rebuilt from the earliest purchase the extract touches, or in
+    # full when customers may have moved between states
+    if changed & {'orders', 'customers'}:
+        purchases = [
+            order['order_purchase_timestamp']
+            for order in new_orders + [order for pair in changed_orders for order in pair]
+            if order.get('order_purchase_timestamp') is not None
+        ]
+        since = min(purchases) if purchases and 'customers' not in changed else None
+        meta = rollups.update_rollups(db, embedded, since)
+        if meta:
+            print(f"Refreshed the sales rollups {'from ' + str(since.date()) if since else 'in full'} in {meta['duration_ms']} ms.")
+    if changed:
+        invalidate_results(affected_results(changed))
+
+def invalidate_results(queries=None):
+    # Cached results of the given queries, all by default, are no longer served
+    bump_data_version(db, queries)
+    if queries is None:
+        removed = result_cache.invalidate()
+        print(f"Removed {removed} cached query results.")
+    else:
+        # Results of the other queries stay valid, stale entries age out of the cache
+        print(f"Invalidated the cached results of {len(queries)} queries: {', '.join(queries) or 'none'}.")
+
+if args.incremental:
+    load_incremental()
+elif args.stream:
+    load_streaming()
+else:
+    load_in_memory()
+
+# Wait for the collections loading in the background
+for future in collection_loads:
+    future.result()
+if collection_loader:
+    collection_loader.shutdown()
+
+if not args.incremental:
+    set_embedded_dimensions(db, args.embed_dimensions)
+    # Every materialized result predates a full load
+    summaries.mark_stale(db)
+    invalidate_results()
+
+# ------------------ Indexes ------------------
+
+for collection, index_name, action in create_indexes(db):
+    print(f"Index {collection}.{index_name}: {action}")
+
+# ------------------ Month Partitions ------------------
+
+if not args.incremental:
+    # Partitions of an earlier load no longer match the orders
+    if args.partition_by_month:
+        counts = partitions.build_partitions(db)
+        print(f"Orders copied into {len(counts)} month partitions.")
+    else:
+        partitions.drop_partitions(db)
+
+# ------------------ Sketches ------------------
 
-        # Remove any NaN values
-        order_dict = {k: v if pd.notnull(v) else None for k, v in order_dict.items()}
-
-        # Convert date columns to Python datetime objects
-        for col in date_columns:
-            if order_dict[col]:
-                order_dict[col] = order_dict[col].to_pydatetime()
-            else:
-                order_dict[col] = None
-
-        # Get order items and embed them
-        order_items = order_items_grouped.get(order_id, [])
-        for item in order_items:
-            item.pop('order_id', None)
-        order_dict['order_items'] = order_items
-
-        # Get payment information and embed it
-        order_payments = order_payments_grouped.get(order_id, [])
-        for payment in order_payments:
-            payment.pop('order_id', None)
-        order_dict['payment'] = order_payments
-
-        # Get review information and embed it
-        order_reviews = order_reviews_grouped.get(order_id, [])
-        for review in order_reviews:
-            review.pop('order_id', None)
-        order_dict['review'] = order_reviews[0] if order_reviews else {}
-
-        # Set '_id' field and remove 'order_id'
-        order_dict['_id'] = order_dict['order_id']
-        order_dict.pop('order_id', None)
-
-        orders_data_batch.append(order_dict)
-        processed_order_ids.add(order_id)
-
-        # Insert batch when it reaches the batch_size
-        if len(orders_data_batch) >= batch_size:
-            db.orders.insert_many(orders_data_batch)
-            orders_data_batch = []
-            batch_count += 1
-            print(f"Inserted batch {batch_count * batch_size} orders.")
-
-            # Save progress to cache file
-            with open(cache_file, 'wb') as f:
-                pickle.dump(processed_order_ids, f)
-
-    # Insert any remaining orders in the last batch
-    if orders_data_batch:
-        db.orders.insert_many(orders_data_batch)
-        print(f"Inserted final batch of {len(orders_data_batch)} orders.")
-
-    # Save progress to cache file
-    with open(cache_file, 'wb') as f:
-        pickle.dump(processed_order_ids, f)
-
-    print("Orders collection inserted.")
-
-except Exception as e:
-    print(f"An error occurred: {e}")
-    # Save progress to cache file before exiting
-    with open(cache_file, 'wb') as f:
-        pickle.dump(processed_order_ids, f)
-    print("Progress saved to cache file.")
-    raise  # Re-raise exception to see the traceback
+if not args.incremental and args.sketches:
+    meta = sketches.build_sketches(db)
+    print(f"Built {meta['row_count']} sketches in {meta['duration_ms']} ms.")
 
 # ------------------ Script Complete ------------------
+journal.remove()
+peak_memory = peak_memory_mb()
+if peak_memory is not None:
+    print(f"Peak memory: {peak_memory:.0f} MB.")
 print("Data import to MongoDB completed successfully.")
@@ -1,8 +1,12 @@
-import pandas as pd
+import argparse
+import gzip
+import io
 import pymongo
 from bson import json_util
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
+from utils.loader import batched, write_batches
 
 load_dotenv()
 
@@ -11,33 +15,205 @@ mongo_connection_string = os.getenv('MONGODB_CONNECTION_STRING')
 client = pymongo.MongoClient(mongo_connection_string, timeoutMS=10*60*1000)
 db = client['olistDB']
 
-def dump_collection(collection, output_dir):
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+def open_output(path, compression):
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8')
+    if compression == 'zstd':
+        import zstandard  # optional dependency, only needed for zstd dumps
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, 'wb')), encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+def open_input(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zst'):
+        import zstandard  # optional dependency, only needed for zstd dumps
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+# Parquet schema metadata listing the columns decoded on restore
+JSON_COLUMNS_KEY = b'olist.json_columns'
+SPARSE_COLUMNS_KEY = b'olist.sparse_columns'
+
+def parquet_type(values):
+    # Native Parquet type of a column whose values all share one plain type, else None.
+    # Subclasses such as bson.Int64 and bool (an int) keep their BSON type through JSON.
+    import pyarrow as pa  # optional dependency, only needed for Parquet dumps
+    from datetime import datetime
+
+    types = {type(value) for value in values if value is not None}
+    if len(types) != 1:
+        return None
+    return {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_(), datetime: pa.timestamp('ms')}.get(types.pop())
+
+def to_parquet_table(documents):
+    """
+    Converts documents into a Parquet table with one column per top-level field.
+
+    Fields holding one plain type (strings, integers, floats, booleans or dates)
+    become native columns. Every other field, e.g. embedded documents, arrays,
+    ObjectIds or fields mixing types, is stored as canonical extended JSON
+    strings, which keep every BSON type. The schema metadata lists these columns,
+    and the native columns whose nulls mean a missing field, so
+    read_parquet_documents() restores the documents exactly.
+    """
+    import pyarrow as pa  # optional dependency, only needed for Parquet dumps
+
+    names = list(dict.fromkeys(key for document in documents for key in document))
+    arrays, fields, json_columns, sparse_columns = [], [], [], []
+    for name in names:
+        present = [name in document for document in documents]
+        values = [document.get(name) for document in documents]
+        has_null = any(value is None for value, found in zip(values, present) if found)
+        is_sparse = not all(present)
+        data_type = parquet_type(values)
+        # A native column can only tell one of missing and null apart
+        if data_type is None or (has_null and is_sparse):
+            arrays.append(pa.array([json_util.dumps(value, json_options=json_util.CANONICAL_JSON_OPTIONS) if found else None for value, found in zip(values, present)], pa.string()))
+            fields.append(pa.field(name, pa.string()))
+            json_columns.append(name)
+        else:
+            arrays.append(pa.array(values, data_type))
+            fields.append(pa.field(name, data_type))
+            if is_sparse:
+                sparse_columns.append(name)
+    metadata = {JSON_COLUMNS_KEY: json_util.dumps(json_columns), SPARSE_COLUMNS_KEY: json_util.dumps(sparse_columns)}
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
+
+def read_parquet_documents(path):
+    """
+    Yields the documents of a Parquet file written by to_parquet_table().
+    """
+    import pyarrow.parquet as pq  # optional dependency, only needed for Parquet dumps
+
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    if JSON_COLUMNS_KEY not in metadata:
+        raise ValueError(f"'{path}' was not written by this script and cannot be restored exactly")
+    json_columns = set(json_util.loads(metadata[JSON_COLUMNS_KEY]))
+    sparse_columns = set(json_util.loads(metadata[SPARSE_COLUMNS_KEY]))
+    for row in table.to_pylist():
+        document = {}
+        for name, value in row.items():
+            if name in json_columns:
+                if value is not None:
+                    document[name] = json_util.loads(value)
+            elif value is not None or name not in sparse_columns:
+                document[name] = value
+        yield document
+
+def dump_collection(collection, output_dir, file_format='jsonl', compression=None, batch_size=1000):
     try:
-        data = list(collection.find())
-        json_data = json_util.dumps(data, indent=4)
-        output_file = os.path.join(output_dir, f"{collection.name}.json")
+        cursor = collection.find(batch_size=batch_size)
+        if file_format == 'parquet':
+            import pyarrow.parquet as pq  # optional dependency, only needed for Parquet dumps
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(json_data)
-            print(f"Dumped collection '{collection.name}' to '{output_file}'")
+            # One part file per batch, each with the schema of its own documents
+            output_path = os.path.join(output_dir, f"{collection.name}.parquet")
+            os.makedirs(output_path, exist_ok=True)
+            count = 0
+            for part, batch in enumerate(batched(cursor, batch_size)):
+                table = to_parquet_table(batch)
+                pq.write_table(table, os.path.join(output_path, f"part-{part:05d}.parquet"), compression=compression or 'snappy')
+                count += len(batch)
+        else:
+            output_path = os.path.join(output_dir, f"{collection.name}.jsonl{COMPRESSION_EXTENSIONS[compression]}")
+            count = 0
+            with open_output(output_path, compression) as f:
+                for document in cursor:
+                    f.write(json_util.dumps(document))
+                    f.write('\n')
+                    count += 1
+        print(f"Dumped {count} documents of collection '{collection.name}' to '{output_path}'")
     except Exception as e:
         print(f"Error dumping collection '{collection.name}': {e}")
+        raise
 
-def dump_database(db, output_dir='db_dump'):
+def dump_database(db, output_dir='db_dump', file_format='jsonl', compression=None, batch_size=1000, workers=4):
     try:
         os.makedirs(output_dir, exist_ok=True)
 
         collections = db.list_collection_names()
         print(f"Found collections: {collections}")
 
-        for collection_name in collections:
-            collection = db[collection_name]
-            dump_collection(collection, output_dir)
-
-        print(f"Database dump completed. All collections are saved in '{output_dir}' directory.")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                name: executor.submit(dump_collection, db[name], output_dir, file_format, compression, batch_size)
+                for name in collections
+            }
+        failed = [name for name, future in futures.items() if future.exception()]
+        if failed:
+            print(f"Database dump failed for collections: {failed}")
+        else:
+            print(f"Database dump completed. All collections are saved in '{output_dir}' directory.")
+        return failed
     except Exception as e:
         print(f"Error dumping database: {e}")
+        raise
+
+def read_dump(path):
+    """
+    Yields the documents of a dump file or Parquet directory.
+    """
+    if path.endswith('.parquet'):
+        for part in sorted(os.listdir(path)):
+            yield from read_parquet_documents(os.path.join(path, part))
+    elif path.endswith('.json'):
+        # Single JSON array written by earlier versions of this script
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json_util.loads(f.read())
+    else:
+        with open_input(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+def collection_name(file_name):
+    for suffix in ('.gz', '.zst', '.jsonl', '.json', '.parquet'):
+        if file_name.endswith(suffix):
+            file_name = file_name[:-len(suffix)]
+    return file_name
+
+def restore_collection(db, path, batch_size=1000, workers=1):
+    name = collection_name(os.path.basename(path))
+    try:
+        inserted = write_batches(db[name], read_dump(path), batch_size=batch_size, workers=workers)
+        print(f"Restored {inserted} documents into collection '{name}' from '{path}'")
+    except Exception as e:
+        print(f"Error restoring collection '{name}': {e}")
+        raise
+
+def restore_database(db, input_dir='db_dump', batch_size=1000, workers=4):
+    try:
+        paths = [os.path.join(input_dir, file_name) for file_name in sorted(os.listdir(input_dir))]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = { path: executor.submit(restore_collection, db, path, batch_size) for path in paths }
+        failed = [path for path, future in futures.items() if future.exception()]
+        if failed:
+            print(f"Database restore failed for: {failed}")
+        else:
+            print(f"Database restore completed from '{input_dir}' directory.")
+        return failed
+    except Exception as e:
+        print(f"Error restoring database: {e}")
+        raise
 
 if __name__ == "__main__":
-    output_directory = 'db_dump'
-    dump_database(db, output_dir=output_directory)
+    parser = argparse.ArgumentParser(description="Dump olistDB collections to files or restore them.")
+    parser.add_argument('command', nargs='?', choices=['dump', 'restore'], default='dump')
+    parser.add_argument('--dir', default='db_dump', help="Dump directory.")
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl', help="Newline-delimited extended JSON or Parquet.")
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], help="Compression of the dump files.")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Documents per cursor batch, Parquet part or insert.")
+    parser.add_argument('--workers', type=int, default=4, help="Collections dumped or restored in parallel.")
+    args = parser.parse_args()
+
+    if args.command == 'dump':
+        failed = dump_database(db, output_dir=args.dir, file_format=args.format, compression=args.compression,
+                               batch_size=args.batch_size, workers=args.workers)
+    else:
+        failed = restore_database(db, input_dir=args.dir, batch_size=args.batch_size, workers=args.workers)
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,38 @@
+import argparse
+from utils.db_connection import get_database
+from utils import indexes
+from queries.catalog import PIPELINES, build_pipeline
+
+def explain_queries(db):
+    print(f"{'query':<34}{'collection':<12}{'plan':<28}{'indexes':<36}covered")
+    for name in PIPELINES:
+        collection, pipeline = build_pipeline(db, name)
+        report = indexes.explain_pipeline(db, collection, pipeline)
+        plan = " > ".join(dict.fromkeys(report["stages"])) or "-"
+        used = ", ".join(report["indexes"]) or "-"
+        covered = "yes" if report["covered"] else "no"
+        print(f"{name:<34}{collection:<12}{plan:<28}{used:<36}{covered}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the secondary indexes of olistDB.")
+    parser.add_argument("command", choices=["create", "verify", "drop", "explain"])
+    args = parser.parse_args()
+
+    db = get_database()
+    if args.command == "create":
+        for collection, index_name, action in indexes.create_indexes(db):
+            print(f"{collection}.{index_name}: {action}")
+    elif args.command == "verify":
+        report = indexes.verify_indexes(db)
+        for collection, index_name, status in report:
+            print(f"{collection}.{index_name}: {status}")
+        if any(status != "ok" for _, _, status in report):
+            raise SystemExit(1)
+    elif args.command == "drop":
+        for collection, index_name in indexes.drop_indexes(db):
+            print(f"{collection}.{index_name}: dropped")
+    else:
+        explain_queries(db)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+import pymongo
+from dotenv import load_dotenv
+from websockets.sync.client import connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+load_dotenv()
+
+# Labels of the app.py widgets the sessions change
+QUERY_SELECTBOX = "Select a query to display:"
+STATE_SELECTBOX = "Customer state"
+PERCENTILES = (50, 95, 99)
+
+class PageError(Exception):
+    pass
+
+class Session:
+    """
+    One simulated browser tab: a websocket to the app over which each page view
+    is a script rerun, timed from the request to the script_finished message.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.widgets = {}
+        self.websocket = None
+
+    @contextlib.contextmanager
+    def connected(self):
+        with connect(self.url, subprotocols=["streamlit"], max_size=None, open_timeout=30) as websocket:
+            self.websocket = websocket
+            try:
+                yield self
+            finally:
+                self.websocket = None
+
+    def view(self, widget_values=None, timeout=300):
+        """
+        Reruns the app with the given widget values (label -> value) and returns
+        the page latency in seconds. Raises PageError if the page shows an exception.
+        """
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        for label, value in (widget_values or {}).items():
+            message.rerun_script.widget_states.widgets.append(WidgetState(id=self.widgets[label]["id"], string_value=value))
+        start = time.perf_counter()
+        self.websocket.send(message.SerializeToString())
+        error = None
+        while True:
+            response = ForwardMsg()
+            response.ParseFromString(self.websocket.recv(timeout=timeout))
+            kind = response.WhichOneof("type")
+            if kind == "delta" and response.delta.WhichOneof("type") == "new_element":
+                element = response.delta.new_element
+                if element.WhichOneof("type") == "selectbox":
+                    self.widgets[element.selectbox.label] = { "id": element.selectbox.id, "options": list(element.selectbox.options) }
+                elif element.WhichOneof("type") == "exception":
+                    error = element.exception.message
+            elif kind == "script_finished":
+                latency = time.perf_counter() - start
+                if error is not None:
+                    raise PageError(error)
+                return latency
+
+def app_url(url):
+    parsed = urlparse(url)
+    scheme = "wss" if parsed.scheme == "https" else "ws"
+    return f"{scheme}://{parsed.netloc}{parsed.path.rstrip('/')}/_stcore/stream"
+
+def run_session(number, args, results, stop):
+    rng = random.Random(args.seed + number)
+    # Sessions arrive evenly over the ramp-up
+    time.sleep(args.ramp_up * number / args.sessions)
+    session = Session(app_url(args.url))
+
+    def think():
+        # Exponential think time between page views
+        return stop.wait(rng.expovariate(1 / args.think_time) if args.think_time > 0 else 0)
+
+    while not stop.is_set():
+        try:
+            with session.connected():
+                page, values = "(first load)", None
+                while not stop.is_set():
+                    try:
+                        results.append((page, session.view(values), None))
+                    except PageError as e:
+                        results.append((page, None, str(e)))
+                    if think():
+                        break
+                    values = { QUERY_SELECTBOX: rng.choice(session.widgets[QUERY_SELECTBOX]["options"]) }
+                    if rng.random() < args.filter_share:
+                        values[STATE_SELECTBOX] = rng.choice(session.widgets[STATE_SELECTBOX]["options"])
+                    page = values[QUERY_SELECTBOX]
+        except Exception as e:
+            # The session reconnects after a think time, like a reloaded tab
+            results.append(("(connection)", None, f"{type(e).__name__}: {e}"))
+            think()
+
+def process_rss_mb(pid):
+    # Resident memory of the app and its child processes, Linux only
+    total_kb = 0
+    for process_id in [pid] + child_pids(pid):
+        try:
+            with open(f"/proc/{process_id}/status") as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            continue
+    return total_kb / 1024 if total_kb else None
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def mongodb_connections(client):
+    try:
+        connections = client.admin.command("serverStatus")["connections"]
+    except pymongo.errors.PyMongoError:
+        return None
+    return { key: connections.get(key) for key in ("current", "active", "totalCreated") }
+
+def sample(args, client, samples, stop, started):
+    while True:
+        samples.append({
+            "elapsed_s": round(time.perf_counter() - started, 1),
+            "rss_mb": process_rss_mb(args.app_pid) if args.app_pid else None,
+            "mongodb_connections": mongodb_connections(client) if client is not None else None,
+        })
+        if stop.wait(args.sample_interval):
+            break
+
+def percentile(values, p):
+    # Nearest rank
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+def latency_summary(latencies):
+    summary = { "count": len(latencies) }
+    if latencies:
+        summary.update({ f"p{p}_ms": round(percentile(latencies, p) * 1000, 1) for p in PERCENTILES })
+        summary["max_ms"] = round(max(latencies) * 1000, 1)
+    return summary
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+def start_app(port):
+    command = [sys.executable, "-m", "streamlit", "run", "app.py", "--server.port", str(port), "--server.headless", "true"]
+    app = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("localhost", port)) == 0:
+                return app
+        time.sleep(0.5)
+    app.terminate()
+    raise SystemExit("The app did not start listening within 60 s.")
+
+def report(args, results, samples, duration_s):
+    views = [(title, latency) for title, latency, error in results if error is None]
+    errors = [(title, error) for title, _, error in results if error is not None]
+    per_query = {}
+    for title, latency in views:
+        per_query.setdefault(title, []).append(latency)
+    connections = [s["mongodb_connections"]["current"] for s in samples if s["mongodb_connections"]]
+    memory = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "settings": {
+            key: getattr(args, key)
+            for key in ("url", "sessions", "duration", "think_time", "ramp_up", "filter_share", "seed")
+        },
+        "duration_s": round(duration_s, 1),
+        "page_views": len(views),
+        "errors": len(errors),
+        "error_samples": sorted({ f"{title}: {error}" for title, error in errors })[:10],
+        "throughput_per_s": round(len(views) / duration_s, 2),
+        "latency": latency_summary([latency for _, latency in views]),
+        "latency_per_query": { title: latency_summary(latencies) for title, latencies in sorted(per_query.items()) },
+        "mongodb_connections": { "max": max(connections), "last": connections[-1] } if connections else None,
+        "app_rss_mb": { "start": round(memory[0], 1), "max": round(max(memory), 1), "end": round(memory[-1], 1) } if memory else None,
+        "samples": samples,
+    }
+
+def print_report(result):
+    latency = result["latency"]
+    print(f"{result['page_views']} page views in {result['duration_s']} s, {result['throughput_per_s']} per second, {result['errors']} errors.")
+    if latency["count"]:
+        print("Page latency: " + ", ".join(f"p{p} {latency[f'p{p}_ms']:.0f} ms" for p in PERCENTILES) + f", max {latency['max_ms']:.0f} ms")
+    print(f"{'page':<42}{'views':>7}" + "".join(f"{f'p{p} (ms)':>11}" for p in PERCENTILES))
+    for title, summary in result["latency_per_query"].items():
+        print(f"{title:<42}{summary['count']:>7}" + "".join(f"{summary[f'p{p}_ms']:>11.0f}" for p in PERCENTILES))
+    if result["mongodb_connections"]:
+        print(f"MongoDB connections: max {result['mongodb_connections']['max']}, last {result['mongodb_connections']['last']}")
+    if result["app_rss_mb"]:
+        memory = result["app_rss_mb"]
+        print(f"App memory (RSS): {memory['start']} MB at start, max {memory['max']} MB, {memory['end']} MB at the end")
+    for error in result["error_samples"]:
+        print(f"Error: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent dashboard sessions and report page latency and resource use.")
+    parser.add_argument("--url", help="App URL, e.g. http://localhost:8501. Starts app.py on a free port when omitted.")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent sessions.")
+    parser.add_argument("--duration", type=float, default=60, help="Test length in seconds, ramp-up included.")
+    parser.add_argument("--think-time", type=float, default=5, help="Mean seconds between page views of a session.")
+    parser.add_argument("--ramp-up", type=float, default=10, help="Seconds over which the sessions start.")
+    parser.add_argument("--filter-share", type=float, default=0.0, help="Share of page views that also pick a random customer state.")
+    parser.add_argument("--app-pid", type=int, help="Process id of the app to sample memory from, set when the app is started here.")
+    parser.add_argument("--mongodb-uri", default=os.getenv("MONGODB_CONNECTION_STRING"), help="Server whose connections are sampled, MONGODB_CONNECTION_STRING by default.")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    app = None
+    if args.url is None:
+        port = free_port()
+        app = start_app(port)
+        args.url, args.app_pid = f"http://localhost:{port}", app.pid
+        print(f"Started app.py at {args.url}.")
+    client = pymongo.MongoClient(args.mongodb_uri, serverSelectionTimeoutMS=2000, appname="load-test") if args.mongodb_uri else None
+
+    results, samples, stop = [], [], threading.Event()
+    started = time.perf_counter()
+    sampler = threading.Thread(target=sample, args=(args, client, samples, stop, started), daemon=True)
+    sampler.start()
+    sessions = [
+        threading.Thread(target=run_session, args=(number, args, results, stop), daemon=True)
+        for number in range(args.sessions)
+    ]
+    try:
+        for session in sessions:
+            session.start()
+        stop.wait(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        duration_s = time.perf_counter() - started
+        for session in sessions:
+            session.join(timeout=30)
+        sampler.join()
+        if app is not None:
+            app.terminate()
+            app.wait()
+
+    result = report(args, results, samples, duration_s)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Report written to '{args.output}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import os
+import statistics
+import time
+from utils import local_store, result_cache
+from queries import local
+from queries.catalog import PIPELINES, build_pipeline
+
+def time_call(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+def benchmark(repeat, compare):
+    db = None
+    if compare:
+        from utils.db_connection import get_database
+        db = get_database()
+
+    header = f"{'query':<34}{'local (ms)':>12}"
+    if db is not None:
+        header += f"{'mongodb (ms)':>14}{'speedup':>10}"
+    print(header)
+    # Reading the Parquet files is a one-off cost per process, keep it out of the timings
+    for table in local_store.TABLES:
+        local_store.load_table(table)
+    for name in PIPELINES:
+        local_df, local_ms = time_call(getattr(local, name), repeat)
+        line = f"{name:<34}{local_ms:>12.1f}"
+        if db is not None:
+            collection, pipeline = build_pipeline(db, name)
+            rows, mongo_ms = time_call(lambda: list(db[collection].aggregate(pipeline)), repeat)
+            line += f"{mongo_ms:>14.1f}{mongo_ms / local_ms:>9.1f}x"
+            if len(rows) != len(local_df):
+                line += f"  ({len(rows)} rows in MongoDB, {len(local_df)} locally)"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local columnar store or time the queries on it.")
+    parser.add_argument("command", nargs="?", choices=["build", "benchmark"], default="build")
+    parser.add_argument("--data-dir", default="./dataset", help="Directory holding the CSV files.")
+    parser.add_argument("--store-dir", help="Store directory, LOCAL_STORE_DIR or ./local_store by default.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query when benchmarking.")
+    parser.add_argument("--compare", action="store_true", help="Also time the live MongoDB pipelines.")
+    args = parser.parse_args()
+
+    if args.store_dir:
+        os.environ["LOCAL_STORE_DIR"] = args.store_dir
+    if args.command == "build":
+        start = time.perf_counter()
+        counts = local_store.build_store(args.data_dir)
+        for table, count in counts.items():
+            print(f"Wrote {count} rows to table '{table}'.")
+        print(f"Removed {result_cache.invalidate()} cached query results.")
+        print(f"Local store built in {time.perf_counter() - start:.1f} s.")
+    else:
+        benchmark(args.repeat, args.compare)
+
+if __name__ == "__main__":
+    main()
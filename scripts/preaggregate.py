@@ -0,0 +1,53 @@
+import argparse
+import time
+from datetime import datetime, timezone
+from utils.db_connection import get_database
+from utils import rollups, sketches, summaries
+from utils.schema import has_embedded_dimensions
+from queries.catalog import PIPELINES, build_pipeline
+from queries import order_facts
+
+def refresh_all(db, names=None):
+    names = list(names or [*PIPELINES, rollups.ROLLUP_NAME, sketches.SKETCH_NAME])
+
+    if sketches.SKETCH_NAME in names:
+        names.remove(sketches.SKETCH_NAME)
+        meta = sketches.build_sketches(db)
+        print(f"Rebuilt the sketches: {meta['row_count']} sketches in {meta['duration_ms']} ms.")
+
+    if rollups.ROLLUP_NAME in names:
+        names.remove(rollups.ROLLUP_NAME)
+        meta = rollups.refresh_rollups(db, has_embedded_dimensions(db))
+        print(f"Refreshed the sales rollups: {meta['row_count']} rows in {meta['duration_ms']} ms.")
+
+    # Queries over the order items are refreshed together from one scan
+    shared = [name for name in names if name in order_facts.FACETS]
+    if shared:
+        started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        results = order_facts.scan(db, shared)
+        for name in shared:
+            meta = summaries.store_summary(db, name, results[name], started_at)
+            print(f"Refreshed summary '{name}': {meta['row_count']} rows in {meta['duration_ms']} ms (shared scan).")
+
+    for name in names:
+        if name in order_facts.FACETS:
+            continue
+        collection, pipeline = build_pipeline(db, name)
+        meta = summaries.refresh_summary(db, name, collection, pipeline)
+        print(f"Refreshed summary '{name}': {meta['row_count']} rows in {meta['duration_ms']} ms.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize the dashboard queries into summary collections.")
+    parser.add_argument("--only", nargs="+", choices=[*PIPELINES, rollups.ROLLUP_NAME, sketches.SKETCH_NAME], help="Refresh only these summaries.")
+    parser.add_argument("--every", type=int, metavar="SECONDS", help="Keep running and refresh on this interval.")
+    args = parser.parse_args()
+
+    db = get_database()
+    while True:
+        refresh_all(db, args.only)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
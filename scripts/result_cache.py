@@ -0,0 +1,16 @@
+import argparse
+from utils import result_cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the on-disk query result cache.")
+    parser.add_argument("command", nargs="?", choices=["stats", "clear"], default="stats")
+    args = parser.parse_args()
+
+    if args.command == "clear":
+        print(f"Removed {result_cache.invalidate()} cached results from '{result_cache.cache_dir()}'.")
+    else:
+        stats = result_cache.stats()
+        print(f"{stats['entries']} cached results, {stats['bytes'] / 1024 / 1024:.1f} MB in '{result_cache.cache_dir()}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# tests/test_dump.py
+from datetime import datetime
+import pyarrow.parquet as pq
+import pytest
+from bson import Decimal128, Int64, ObjectId
+from scripts.dump import read_parquet_documents, to_parquet_table
+
+DOCUMENTS = [
+    {
+        "_id": ObjectId("65a1f0c2e4b0a1b2c3d4e5f6"),
+        "order_status": "delivered",
+        "order_delivered_customer_date": datetime(2018, 1, 8, 15, 0),
+        "order_items": [{ "order_item_id": 1, "price": 10.5, "shipping_limit_date": datetime(2018, 1, 5) }],
+        "review": {},
+    },
+    {
+        "_id": ObjectId("65a1f0c2e4b0a1b2c3d4e5f7"),
+        "order_status": "shipped",
+        "order_delivered_customer_date": None,
+        "order_items": [],
+        "review": {},
+        "customer_state": "SP",
+        "count": Int64(3),
+    },
+    {
+        "_id": "plain-string-id",
+        "order_status": None,
+        "total": Decimal128("1.10"),
+        "review": {},
+    },
+]
+
+
+def round_trip(tmp_path, documents):
+    path = str(tmp_path / "part-00000.parquet")
+    pq.write_table(to_parquet_table(documents), path)
+    return list(read_parquet_documents(path))
+
+
+def test_documents_round_trip_exactly(tmp_path):
+    restored = round_trip(tmp_path, DOCUMENTS)
+
+    assert restored == DOCUMENTS
+    assert [type(document["_id"]) for document in restored] == [ObjectId, ObjectId, str]
+    assert type(restored[1]["count"]) is Int64
+
+
+def test_plain_fields_stay_native_columns():
+    schema = to_parquet_table(DOCUMENTS[:2]).schema
+
+    assert str(schema.field("order_status").type) == "string"
+    assert str(schema.field("order_delivered_customer_date").type) == "timestamp[ms]"
+    assert str(schema.field("review").type) == "string"
+
+
+def test_foreign_parquet_is_refused(tmp_path):
+    import pyarrow as pa
+
+    path = str(tmp_path / "other.parquet")
+    pq.write_table(pa.Table.from_pylist([{ "a": 1 }]), path)
+    with pytest.raises(ValueError):
+        list(read_parquet_documents(path))
@@ -0,0 +1,109 @@
+# tests/test_incremental.py
+from datetime import datetime
+from utils.incremental import listed_order_ids, load_orders, read_extract
+from utils.loader import build_order_documents
+
+
+class FakeOrders:
+    """
+    In-memory stand-in for the orders collection, covering the find() and
+    bulk_write() calls of utils.incremental.
+    """
+
+    def __init__(self, documents):
+        self.documents = { document["_id"]: dict(document) for document in documents }
+
+    def find(self, query):
+        ids = query["_id"]["$in"]
+        return [dict(self.documents[_id]) for _id in ids if _id in self.documents]
+
+    def bulk_write(self, requests, ordered=True):
+        modified = 0
+        for request in requests:
+            _id = request._filter["_id"]
+            if "$set" in request._doc:
+                before = dict(self.documents[_id])
+                self.documents[_id].update(request._doc["$set"])
+                modified += before != self.documents[_id]
+            else:
+                self.documents[_id] = dict(request._doc)
+        return type("BulkWriteResult", (), { "modified_count": modified })()
+
+
+STORED_ORDER = {
+    "_id": "o1",
+    "order_id": "o1",
+    "customer_id": "c1",
+    "order_status": "shipped",
+    "order_purchase_timestamp": datetime(2018, 1, 2, 10, 0),
+    "order_approved_at": datetime(2018, 1, 2, 11, 0),
+    "order_delivered_carrier_date": datetime(2018, 1, 3, 9, 0),
+    "order_delivered_customer_date": None,
+    "order_estimated_delivery_date": datetime(2018, 1, 20),
+    "order_items": [{ "order_id": "o1", "order_item_id": 1, "product_id": "p1", "seller_id": "s1", "price": 10.0, "freight_value": 2.0 }],
+    "payment": [{ "order_id": "o1", "payment_sequential": 1, "payment_type": "credit_card", "payment_installments": 1, "payment_value": 12.0 }],
+    "review": { "review_id": "r1", "order_id": "o1", "review_score": 5 },
+}
+
+ORDERS_CSV = (
+    "order_id,customer_id,order_status,order_purchase_timestamp,order_approved_at,"
+    "order_delivered_carrier_date,order_delivered_customer_date,order_estimated_delivery_date\n"
+    "o1,c1,delivered,2018-01-02 10:00:00,2018-01-02 11:00:00,2018-01-03 09:00:00,2018-01-08 15:00:00,2018-01-20 00:00:00\n"
+)
+
+
+def load_extract(data_dir, collection):
+    orders_df = read_extract(data_dir, "olist_orders_dataset.csv")
+    order_items_df = read_extract(data_dir, "olist_order_items_dataset.csv")
+    order_payments_df = read_extract(data_dir, "olist_order_payments_dataset.csv")
+    order_reviews_df = read_extract(data_dir, "olist_order_reviews_dataset.csv")
+    orders = build_order_documents(orders_df, order_items_df, order_payments_df, order_reviews_df)
+    listed = listed_order_ids(data_dir, { "order_items": order_items_df, "payment": order_payments_df, "review": order_reviews_df })
+    return load_orders(collection, orders, listed)
+
+
+def test_orders_only_extract_keeps_stored_children(tmp_path):
+    (tmp_path / "olist_orders_dataset.csv").write_text(ORDERS_CSV)
+    collection = FakeOrders([STORED_ORDER])
+
+    new, changed = load_extract(str(tmp_path), collection)
+
+    stored = collection.documents["o1"]
+    assert new == []
+    assert len(changed) == 1
+    assert stored["order_status"] == "delivered"
+    assert stored["order_delivered_customer_date"] == datetime(2018, 1, 8, 15, 0)
+    for field in ("order_items", "payment", "review"):
+        assert stored[field] == STORED_ORDER[field]
+        assert changed[0][1][field] == STORED_ORDER[field]
+
+
+def test_child_file_replaces_only_listed_orders(tmp_path):
+    (tmp_path / "olist_orders_dataset.csv").write_text(ORDERS_CSV)
+    (tmp_path / "olist_order_payments_dataset.csv").write_text(
+        "order_id,payment_sequential,payment_type,payment_installments,payment_value\n"
+        "o2,1,voucher,1,5.0\n"
+    )
+    (tmp_path / "olist_order_reviews_dataset.csv").write_text(
+        "review_id,order_id,review_score,review_comment_title,review_comment_message,review_creation_date,review_answer_timestamp\n"
+        "r2,o1,3,,,2018-01-09 00:00:00,2018-01-10 12:00:00\n"
+    )
+    collection = FakeOrders([STORED_ORDER])
+
+    load_extract(str(tmp_path), collection)
+
+    stored = collection.documents["o1"]
+    assert stored["order_items"] == STORED_ORDER["order_items"]
+    assert stored["payment"] == STORED_ORDER["payment"]
+    assert stored["review"]["review_id"] == "r2"
+    assert stored["review"]["review_score"] == 3
+
+
+def test_unchanged_order_is_not_written(tmp_path):
+    (tmp_path / "olist_orders_dataset.csv").write_text(ORDERS_CSV.replace(",delivered,", ",shipped,").replace("2018-01-08 15:00:00", ""))
+    collection = FakeOrders([STORED_ORDER])
+
+    new, changed = load_extract(str(tmp_path), collection)
+
+    assert (new, changed) == ([], [])
+    assert collection.documents["o1"] == STORED_ORDER
@@ -0,0 +1,84 @@
+# utils/checkpoint.py
+import json
+import os
+import threading
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of the loader's progress.
+
+    Every written batch and every finished stage (a collection, or a set of
+    fields embedded into the orders) is recorded as one JSON line, so saving
+    progress costs one small append instead of rewriting the whole state. A
+    resumed load replays the journal, skips finished stages and skips the
+    batches already written in the interrupted stage.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._completed_stages = set()
+        self._batches = {}
+        self._batch_sizes = {}
+        if os.path.exists(path):
+            self._replay()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash, the batch is simply written again
+                    continue
+                stage = entry["stage"]
+                if entry.get("done"):
+                    self._completed_stages.add(stage)
+                elif "batch_size" in entry:
+                    self._batch_sizes[stage] = entry["batch_size"]
+                elif "batch" in entry:
+                    self._batches.setdefault(stage, set()).add(entry["batch"])
+
+    def _append(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    @property
+    def resumed(self):
+        return bool(self._completed_stages or self._batches)
+
+    def is_done(self, stage):
+        return stage in self._completed_stages
+
+    def completed_batches(self, stage):
+        return self._batches.get(stage, set())
+
+    def batch_size(self, stage, default):
+        """
+        Returns the batch size a stage was started with, so batch numbers stay
+        comparable across runs, and records default for a new stage.
+        """
+        if stage not in self._batch_sizes:
+            self._batch_sizes[stage] = default
+            self._append({ "stage": stage, "batch_size": default })
+        return self._batch_sizes[stage]
+
+    def record_batch(self, stage, index):
+        self._append({ "stage": stage, "batch": index })
+
+    def complete(self, stage):
+        self._completed_stages.add(stage)
+        self._append({ "stage": stage, "done": True })
+
+    def close(self):
+        self._file.close()
+
+    def remove(self):
+        """
+        Closes and deletes the journal once a load has finished.
+        """
+        self.close()
+        os.remove(self.path)
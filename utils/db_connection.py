@@ -1,14 +1,162 @@
 # utils/db_connection.py
+import atexit
 import os
-from pymongo import MongoClient
+import threading
+from pymongo import MongoClient, monitoring
 from dotenv import load_dotenv
 
 load_dotenv()
 
+DEFAULT_DATABASE_NAME = 'olistDB'
+
+# Environment variables mapped to MongoClient keyword arguments. Options that are
+# not set fall back to the PyMongo defaults.
+_CLIENT_OPTIONS = {
+    'MONGODB_MAX_POOL_SIZE': ('maxPoolSize', int),
+    'MONGODB_MIN_POOL_SIZE': ('minPoolSize', int),
+    'MONGODB_MAX_IDLE_TIME_MS': ('maxIdleTimeMS', int),
+    'MONGODB_WAIT_QUEUE_TIMEOUT_MS': ('waitQueueTimeoutMS', int),
+    'MONGODB_CONNECT_TIMEOUT_MS': ('connectTimeoutMS', int),
+    'MONGODB_SOCKET_TIMEOUT_MS': ('socketTimeoutMS', int),
+    'MONGODB_SERVER_SELECTION_TIMEOUT_MS': ('serverSelectionTimeoutMS', int),
+    'MONGODB_READ_PREFERENCE': ('readPreference', str),
+    'MONGODB_APP_NAME': ('appname', str),
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class _PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Collects connection pool counters for the shared client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {
+                "pools_created": 0,
+                "pools_cleared": 0,
+                "connections_created": 0,
+                "connections_closed": 0,
+                "checkouts": 0,
+                "checkins": 0,
+                "checkout_failures": 0,
+            }
+
+    def _incr(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["connections_open"] = stats["connections_created"] - stats["connections_closed"]
+        stats["connections_in_use"] = stats["checkouts"] - stats["checkins"]
+        return stats
+
+    def pool_created(self, event):
+        self._incr("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._incr("checkouts")
+
+    def connection_checked_in(self, event):
+        self._incr("checkins")
+
+
+_pool_metrics = _PoolMetrics()
+
+
+def _client_options():
+    options = {}
+    for env_var, (option, cast) in _CLIENT_OPTIONS.items():
+        value = os.getenv(env_var)
+        if value:
+            options[option] = cast(value)
+    return options
+
+
+def get_client():
+    """
+    Returns the process-wide MongoClient, creating it on first use.
+
+    The client is shared by every query and Streamlit session, so connections are
+    pooled instead of being opened for each call.
+
+    Returns:
+        MongoClient: The shared client.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                mongo_connection_string = os.getenv('MONGODB_CONNECTION_STRING')
+                if not mongo_connection_string:
+                    raise ValueError("MONGODB_CONNECTION_STRING is not set in the environment variables.")
+                _client = MongoClient(
+                    mongo_connection_string,
+                    event_listeners=[_pool_metrics],
+                    **_client_options()
+                )
+    return _client
+
+
 def get_database():
-    mongo_connection_string = os.getenv('MONGODB_CONNECTION_STRING')
-    if not mongo_connection_string:
-        raise ValueError("MONGODB_CONNECTION_STRING is not set in the environment variables.")
-    client = MongoClient(mongo_connection_string)
-    db = client['olistDB']
+    client = get_client()
+    db = client[os.getenv('MONGODB_DATABASE', DEFAULT_DATABASE_NAME)]
     return db
+
+
+def close_client():
+    """
+    Closes the shared client and its connection pool. A later call to
+    get_client() opens a new one.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_pool_stats():
+    """
+    Returns connection pool counters for the shared client.
+
+    Returns:
+        dict: Pool, connection and checkout counters, including the number of
+        currently open and in-use connections.
+    """
+    return _pool_metrics.snapshot()
+
+
+atexit.register(close_client)
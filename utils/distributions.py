@@ -0,0 +1,137 @@
+# utils/distributions.py
+import math
+import pandas as pd
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def quantile_name(q):
+    # 0.5 -> "p50", 0.999 -> "p99_9"; field names cannot contain dots
+    return "p" + f"{round(q * 100, 3):g}".replace(".", "_")
+
+
+def nearest_rank_index(q, count):
+    """
+    Returns the 0-based index of the q quantile among count sorted values by the
+    nearest-rank method, ceil(q * count) - 1, as scripts/load_test.py does.
+    """
+    return max(math.ceil(q * count) - 1, 0)
+
+
+def _nearest_rank(q):
+    # nearest_rank_index() on the "count" field
+    return { "$max": [{ "$subtract": [{ "$toInt": { "$ceil": { "$multiply": [q, "$count"] } } }, 1] }, 0] }
+
+
+def _is_rank(q):
+    # $documentNumber ranks start at 1
+    return { "$eq": ["$rank", { "$add": [_nearest_rank(q), 1] }] }
+
+
+def supports_percentile(db):
+    """
+    Tells whether the server has the $percentile accumulator (MongoDB 7.0+).
+    """
+    return db.client.server_info()["versionArray"][0] >= 7
+
+
+def build_distribution_stage(field, buckets=None, boundaries=None, default=None,
+                             quantiles=DEFAULT_QUANTILES, use_percentile=False):
+    """
+    Builds a $facet stage summarizing a numeric field as a histogram and quantiles,
+    so only the summary leaves the database.
+
+    Args:
+        field (str): Field to summarize, without the leading '$'.
+        buckets (int, optional): Number of bins chosen by $bucketAuto.
+        boundaries (list, optional): Fixed bin edges for $bucket, used instead of buckets.
+        default: Lower bound of the $bucket bin collecting values past the last edge.
+        quantiles (tuple): Quantiles to compute, between 0 and 1.
+        use_percentile (bool): Use the $percentile accumulator, otherwise quantiles
+            are picked by rank with $setWindowFields (MongoDB 5.0+). Run the
+            pipeline with allowDiskUse, so the ranking can spill to disk.
+
+    Returns:
+        dict: The $facet stage, parsed by to_distribution().
+    """
+    if boundaries is not None:
+        bucket = { "groupBy": f"${field}", "boundaries": boundaries, "output": { "count": { "$sum": 1 } } }
+        if default is not None:
+            bucket["default"] = default
+        histogram = [{ "$bucket": bucket }]
+    else:
+        histogram = [{ "$bucketAuto": { "groupBy": f"${field}", "buckets": buckets or 20 } }]
+
+    numeric = { "$match": { field: { "$type": "number" } } }
+    if use_percentile:
+        quantile_stages = [
+            numeric,
+            {
+                "$group": {
+                    "_id": None,
+                    "count": { "$sum": 1 },
+                    "values": { "$percentile": { "input": f"${field}", "p": list(quantiles), "method": "approximate" } }
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "count": 1,
+                    **{ quantile_name(q): { "$arrayElemAt": ["$values", i] } for i, q in enumerate(quantiles) }
+                }
+            }
+        ]
+    else:
+        # Number the sorted values and keep the documents at the nearest ranks,
+        # no document ever holds more than one value
+        quantile_stages = [
+            numeric,
+            { "$project": { "_id": 0, "value": f"${field}" } },
+            {
+                "$setWindowFields": {
+                    "sortBy": { "value": 1 },
+                    "output": {
+                        "rank": { "$documentNumber": {} },
+                        "count": { "$count": {}, "window": { "documents": ["unbounded", "unbounded"] } }
+                    }
+                }
+            },
+            { "$match": { "$expr": { "$or": [_is_rank(q) for q in quantiles] } } },
+            {
+                "$group": {
+                    "_id": None,
+                    "count": { "$first": "$count" },
+                    **{ quantile_name(q): { "$max": { "$cond": [_is_rank(q), "$value", None] } } for q in quantiles }
+                }
+            },
+            { "$project": { "_id": 0 } }
+        ]
+    return { "$facet": { "histogram": histogram, "quantiles": quantile_stages } }
+
+
+def to_distribution(result, boundaries=None):
+    """
+    Parses the output of a distribution $facet stage.
+
+    Args:
+        result (list): Output of the aggregation ending with the $facet stage.
+        boundaries (list, optional): The $bucket edges the stage was built with.
+
+    Returns:
+        tuple: DataFrame with bin_start, bin_end and count per bin, and a dict with
+        the number of values and each quantile. bin_end is NaN for the $bucket
+        overflow bin.
+    """
+    facet = result[0] if result else { "histogram": [], "quantiles": [] }
+    rows = []
+    for bucket in facet["histogram"]:
+        if isinstance(bucket["_id"], dict):
+            rows.append({ "bin_start": bucket["_id"]["min"], "bin_end": bucket["_id"]["max"], "count": bucket["count"] })
+        else:
+            rows.append({ "bin_start": bucket["_id"], "bin_end": None, "count": bucket["count"] })
+    histogram = pd.DataFrame(rows, columns=["bin_start", "bin_end", "count"])
+    if boundaries is not None:
+        histogram["bin_end"] = histogram["bin_start"].map(dict(zip(boundaries, boundaries[1:])))
+    histogram = histogram.sort_values("bin_start").reset_index(drop=True)
+    quantiles = facet["quantiles"][0] if facet["quantiles"] else { "count": 0 }
+    return histogram, quantiles
@@ -0,0 +1,126 @@
+# utils/geo.py
+import copy
+import functools
+import json
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATES_GEOJSON_PATH = './dataset/brazil-states.geojson'
+# In degrees, about 2 km at Brazilian latitudes
+DEFAULT_TOLERANCE = 0.02
+# Feature properties the maps use, the others are dropped from the simplified geometry
+STATE_PROPERTIES = ('sigla', 'name')
+COORDINATE_DECIMALS = 4
+
+
+def _tolerance():
+    return float(os.getenv('GEOJSON_SIMPLIFY_TOLERANCE', DEFAULT_TOLERANCE))
+
+
+def simplify_line(points, tolerance):
+    """
+    Simplifies a line with the Douglas-Peucker algorithm, keeping its end points.
+
+    Args:
+        points (np.ndarray): (n, 2) array of coordinates.
+        tolerance (float): Maximum distance of a removed point to the simplified line.
+
+    Returns:
+        np.ndarray: The kept points.
+    """
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        inner = points[first + 1:last] - start
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack += [(first, index), (index, last)]
+    return points[keep]
+
+
+def _simplify_polygon(rings, tolerance):
+    simplified = []
+    for ring in rings:
+        points = simplify_line(np.asarray(ring, dtype='float64'), tolerance)
+        # A ring needs at least three distinct points plus the closing one
+        if len(points) >= 4:
+            simplified.append(np.round(points, COORDINATE_DECIMALS).tolist())
+        elif not simplified:
+            # The exterior ring collapsed, the polygon is smaller than the tolerance
+            return None
+    return simplified
+
+
+def simplify_geojson(geojson, tolerance, properties=None):
+    """
+    Returns a copy of a FeatureCollection with its Polygon and MultiPolygon
+    geometries simplified and coordinates rounded. Polygons smaller than the
+    tolerance are dropped, unless a feature would lose all of them.
+
+    Args:
+        properties (iterable, optional): Feature properties to keep, all when omitted.
+    """
+    simplified = copy.deepcopy(geojson)
+    for feature, original in zip(simplified['features'], geojson['features']):
+        if properties is not None:
+            feature['properties'] = { key: feature['properties'].get(key) for key in properties }
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            rings = _simplify_polygon(geometry['coordinates'], tolerance)
+            if rings:
+                geometry['coordinates'] = rings
+        elif geometry['type'] == 'MultiPolygon':
+            polygons = [polygon for polygon in (_simplify_polygon(rings, tolerance) for rings in geometry['coordinates']) if polygon]
+            if polygons:
+                geometry['coordinates'] = polygons
+            else:
+                geometry['coordinates'] = original['geometry']['coordinates']
+    return simplified
+
+
+@functools.lru_cache(maxsize=None)
+def _read_geojson(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def _simplified_geojson(path, tolerance):
+    return simplify_geojson(_read_geojson(path), tolerance, STATE_PROPERTIES)
+
+
+def states_geojson(tolerance=None, path=STATES_GEOJSON_PATH):
+    """
+    Returns the Brazilian states GeoJSON, parsed and simplified once per process.
+
+    Args:
+        tolerance (float, optional): Simplification tolerance in degrees,
+            GEOJSON_SIMPLIFY_TOLERANCE (0.02 by default) when omitted. 0 returns
+            the full-resolution geometry.
+
+    Returns:
+        dict: The FeatureCollection, shared between callers: do not modify it.
+    """
+    if tolerance is None:
+        tolerance = _tolerance()
+    if tolerance <= 0:
+        return _read_geojson(path)
+    return _simplified_geojson(path, tolerance)
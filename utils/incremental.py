@@ -0,0 +1,247 @@
+# utils/incremental.py
+import os
+import pandas as pd
+from pymongo import ReplaceOne, UpdateOne
+from utils.loader import batched, read_dataset_csv, CSV_DTYPES
+
+# Embedded order children -> extract file listing them
+ORDER_CHILD_FILES = {
+    'order_items': 'olist_order_items_dataset.csv',
+    'payment': 'olist_order_payments_dataset.csv',
+    'review': 'olist_order_reviews_dataset.csv',
+}
+
+
+def read_extract(data_dir, file_name):
+    """
+    Reads an extract file. Extracts may leave out files without changes, which
+    read as an empty DataFrame with the file's columns.
+    """
+    if os.path.exists(os.path.join(data_dir, file_name)):
+        return read_dataset_csv(data_dir, file_name)
+    return pd.DataFrame({ column: pd.Series(dtype=dtype) for column, dtype in CSV_DTYPES[file_name].items() })
+
+
+def get_purchase_watermark(db):
+    """
+    Returns the latest order_purchase_timestamp loaded so far, read through the
+    purchase_timestamp index, or None for an empty collection.
+    """
+    latest = db.orders.find_one(
+        { "order_purchase_timestamp": { "$type": "date" } },
+        { "order_purchase_timestamp": 1 },
+        sort=[("order_purchase_timestamp", -1)]
+    )
+    return latest["order_purchase_timestamp"] if latest else None
+
+
+def split_changed(collection, documents, is_known_new=None, merge=None, batch_size=1000):
+    """
+    Compares documents with the stored ones by _id.
+
+    Args:
+        collection: Collection holding the current documents.
+        documents (iterable): Candidate documents keyed by '_id'.
+        is_known_new (callable, optional): Returns True for documents that are new
+            without looking them up, e.g. orders past the purchase watermark.
+        merge (callable, optional): Builds the updated document from the stored
+            one and the candidate, e.g. to keep fields the extract does not carry.
+            The candidate replaces the stored document by default.
+        batch_size (int): Documents looked up per query.
+
+    Returns:
+        tuple: (new documents, list of (stored, updated) document pairs).
+    """
+    new, changed = [], []
+    for batch in batched(documents, batch_size):
+        lookup = []
+        for document in batch:
+            if is_known_new and is_known_new(document):
+                new.append(document)
+            else:
+                lookup.append(document)
+        stored = {
+            document["_id"]: document
+            for document in collection.find({ "_id": { "$in": [document["_id"] for document in lookup] } })
+        } if lookup else {}
+        for document in lookup:
+            current = stored.get(document["_id"])
+            if current is None:
+                new.append(document)
+                continue
+            if merge:
+                document = merge(current, document)
+            if current != document:
+                changed.append((current, document))
+    return new, changed
+
+
+def upsert_documents(collection, documents, batch_size=1000):
+    """
+    Replaces or inserts documents by _id with unordered bulk writes.
+
+    Returns:
+        int: Number of documents written.
+    """
+    written = 0
+    for batch in batched(documents, batch_size):
+        collection.bulk_write([ReplaceOne({ "_id": document["_id"] }, document, upsert=True) for document in batch], ordered=False)
+        written += len(batch)
+    return written
+
+
+def set_changed_fields(collection, changed, batch_size=1000):
+    """
+    Sets the fields that differ between stored and updated documents, leaving
+    the other fields as they are stored.
+
+    Args:
+        collection: Collection holding the documents.
+        changed (list): (stored, updated) document pairs from split_changed().
+
+    Returns:
+        int: Number of documents modified.
+    """
+    modified = 0
+    for batch in batched(changed, batch_size):
+        updates = [
+            UpdateOne(
+                { "_id": updated["_id"] },
+                { "$set": { key: value for key, value in updated.items() if key not in current or current[key] != value } }
+            )
+            for current, updated in batch
+        ]
+        modified += collection.bulk_write(updates, ordered=False).modified_count
+    return modified
+
+
+def listed_order_ids(data_dir, child_frames):
+    """
+    Tells which orders each child file of an extract lists.
+
+    Args:
+        data_dir (str): Extract directory.
+        child_frames (dict): Child field ('order_items', 'payment', 'review') ->
+            DataFrame read from its file.
+
+    Returns:
+        dict: Child field -> set of order ids, or None when the file is not part
+        of the extract.
+    """
+    return {
+        field: set(df['order_id'].dropna()) if os.path.exists(os.path.join(data_dir, ORDER_CHILD_FILES[field])) else None
+        for field, df in child_frames.items()
+    }
+
+
+def merge_order(stored, order, listed):
+    """
+    Updates a stored order with the extract. Order fields come from the orders
+    file, while each embedded child list is replaced only when its file lists the
+    order: a file left out of the extract, or one listing other orders, keeps the
+    stored children.
+
+    Args:
+        stored (dict): The stored order document.
+        order (dict): The order document built from the extract.
+        listed (dict): Child field -> order ids listed by its file, see
+            listed_order_ids().
+
+    Returns:
+        dict: The updated order document.
+    """
+    merged = dict(stored)
+    for key, value in order.items():
+        order_ids = listed.get(key, ())
+        if key in ORDER_CHILD_FILES and (order_ids is None or order['_id'] not in order_ids):
+            continue
+        merged[key] = value
+    return merged
+
+
+def load_orders(collection, orders, listed, is_known_new=None, batch_size=1000):
+    """
+    Writes the orders of an extract: new orders are inserted whole, while stored
+    orders only get the fields that changed, see merge_order().
+
+    Args:
+        collection: The orders collection.
+        orders (list): Order documents built from the extract.
+        listed (dict): Child field -> order ids listed by its file.
+        is_known_new (callable, optional): See split_changed().
+
+    Returns:
+        tuple: (new orders, list of (stored, updated) order pairs).
+    """
+    new, changed = split_changed(
+        collection,
+        orders,
+        is_known_new=is_known_new,
+        merge=lambda stored, order: merge_order(stored, order, listed),
+        batch_size=batch_size
+    )
+    upsert_documents(collection, new, batch_size)
+    set_changed_fields(collection, changed, batch_size)
+    return new, changed
+
+
+def set_reviews(collection, reviews, batch_size=1000):
+    """
+    Sets the embedded review of existing orders.
+
+    Args:
+        collection: The orders collection.
+        reviews (dict): Order id -> review document.
+
+    Returns:
+        int: Number of orders whose review changed.
+    """
+    modified = 0
+    for batch in batched(list(reviews.items()), batch_size):
+        result = collection.bulk_write(
+            [UpdateOne({ "_id": order_id, "review": { "$ne": review } }, { "$set": { "review": review } }) for order_id, review in batch],
+            ordered=False
+        )
+        modified += result.modified_count
+    return modified
+
+
+def add_dimensions(db, orders_df, order_items_df, customers_df):
+    """
+    Adds the embedded customer and product category columns to extract rows,
+    taking customers from the extract first and from the database otherwise.
+
+    Args:
+        customers_df (pd.DataFrame): Extract customers with '_id' as key.
+
+    Returns:
+        tuple: The orders and order items DataFrames with the dimension columns.
+    """
+    customer_columns = ['_id', 'customer_city', 'customer_state']
+    missing_ids = sorted(set(orders_df['customer_id'].dropna()) - set(customers_df['_id']))
+    stored_customers = pd.DataFrame(
+        list(db.customers.find({ "_id": { "$in": missing_ids } }, { "customer_city": 1, "customer_state": 1 })),
+        columns=customer_columns
+    )
+    customer_dimensions_df = pd.concat([customers_df[customer_columns], stored_customers]).rename(columns={'_id': 'customer_id'})
+    orders_df = orders_df.merge(customer_dimensions_df, on='customer_id', how='left')
+
+    product_ids = sorted(set(order_items_df['product_id'].dropna()))
+    product_dimensions_df = pd.DataFrame(
+        list(db.products.find({ "_id": { "$in": product_ids } }, { "product_category_name_english": 1 })),
+        columns=['_id', 'product_category_name_english']
+    ).rename(columns={'_id': 'product_id'})
+    order_items_df = order_items_df.merge(product_dimensions_df, on='product_id', how='left')
+    return orders_df, order_items_df
+
+
+def classify_order_changes(changed):
+    """
+    Tells which data a set of changed orders touches: "reviews" when only the
+    embedded review differs, "orders" otherwise.
+    """
+    kinds = set()
+    for current, updated in changed:
+        differing = { key for key in current.keys() | updated.keys() if current.get(key) != updated.get(key) }
+        kinds.add("reviews" if differing == {"review"} else "orders")
+    return kinds
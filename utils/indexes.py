@@ -0,0 +1,219 @@
+# utils/indexes.py
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+_HAS_DATE = { "$type": "date" }
+
+# Collection -> secondary indexes matching the query filters. Date filters use
+# {"$type": "date"} so the partial indexes can serve them.
+INDEX_SPECS = {
+    "orders": [
+        {
+            # query4: approved and delivered orders
+            "name": "approved_delivered_dates",
+            "keys": [("order_approved_at", 1), ("order_delivered_customer_date", 1)],
+            "partialFilterExpression": {
+                "order_approved_at": _HAS_DATE,
+                "order_delivered_customer_date": _HAS_DATE,
+            },
+        },
+        {
+            # query10: delivered orders with an estimate
+            "name": "delivered_estimated_dates",
+            "keys": [("order_delivered_customer_date", 1), ("order_estimated_delivery_date", 1)],
+            "partialFilterExpression": {
+                "order_delivered_customer_date": _HAS_DATE,
+                "order_estimated_delivery_date": _HAS_DATE,
+            },
+        },
+        {
+            "name": "purchase_timestamp",
+            "keys": [("order_purchase_timestamp", 1)],
+        },
+        {
+            # Customer state filter without embedded dimensions, see queries/filters.py
+            "name": "customer_id",
+            "keys": [("customer_id", 1)],
+        },
+        {
+            # Seller filter
+            "name": "item_seller",
+            "keys": [("order_items.seller_id", 1)],
+        },
+        {
+            # Product category filter without embedded dimensions
+            "name": "item_product",
+            "keys": [("order_items.product_id", 1)],
+        },
+    ],
+    "customers": [
+        {
+            # query8: $sort + $group on customer_unique_id becomes a covered DISTINCT_SCAN
+            "name": "unique_id_city",
+            "keys": [("customer_unique_id", 1), ("customer_city", 1)],
+        },
+        {
+            # Customer ids of a state, covered
+            "name": "customer_state",
+            "keys": [("customer_state", 1), ("_id", 1)],
+        },
+    ],
+    "products": [
+        {
+            # Product ids of a category, covered
+            "name": "category_product",
+            "keys": [("product_category_name_english", 1), ("_id", 1)],
+        },
+    ],
+    "sales_rollups": [
+        {
+            # Rollup rows of a granularity and filter over a period range, see utils/rollups.py
+            "name": "granularity_grouping_period",
+            "keys": [("granularity", 1), ("grouping", 1), ("customer_state", 1), ("product_category", 1), ("period_start", 1)],
+        },
+    ],
+    "sketches": [
+        {
+            # Largest distinct-count estimates of a family, see utils/sketches.py
+            "name": "family_estimate",
+            "keys": [("family", 1), ("estimate", -1)],
+        },
+    ],
+}
+
+
+def _index_model(spec):
+    options = { key: value for key, value in spec.items() if key != "keys" }
+    return IndexModel(spec["keys"], **options)
+
+
+def _matches(spec, info):
+    return (
+        [tuple(key) for key in info["key"]] == list(spec["keys"])
+        and dict(info.get("partialFilterExpression", {})) == spec.get("partialFilterExpression", {})
+    )
+
+
+def index_models(collection):
+    """
+    Returns the IndexModels of the INDEX_SPECS of a collection, e.g. to give a
+    copy of it the same indexes.
+    """
+    return [_index_model(spec) for spec in INDEX_SPECS[collection]]
+
+
+def verify_indexes(db):
+    """
+    Compares the indexes in the database with INDEX_SPECS.
+
+    Returns:
+        list: (collection, index name, status) tuples, where status is "ok",
+        "missing" or "different".
+    """
+    report = []
+    for collection, specs in INDEX_SPECS.items():
+        existing = db[collection].index_information()
+        for spec in specs:
+            info = existing.get(spec["name"])
+            if info is None:
+                status = "missing"
+            elif _matches(spec, info):
+                status = "ok"
+            else:
+                status = "different"
+            report.append((collection, spec["name"], status))
+    return report
+
+
+def create_indexes(db):
+    """
+    Creates the indexes in INDEX_SPECS. Indexes that already match are left alone
+    and indexes with the same name but a different definition are rebuilt, so the
+    call is idempotent.
+
+    Returns:
+        list: (collection, index name, action) tuples.
+    """
+    actions = []
+    for collection, index_name, status in verify_indexes(db):
+        if status == "ok":
+            actions.append((collection, index_name, "unchanged"))
+            continue
+        spec = next(spec for spec in INDEX_SPECS[collection] if spec["name"] == index_name)
+        if status == "different":
+            db[collection].drop_index(index_name)
+        db[collection].create_indexes([_index_model(spec)])
+        actions.append((collection, index_name, "created" if status == "missing" else "rebuilt"))
+    return actions
+
+
+def drop_indexes(db):
+    """
+    Drops the indexes in INDEX_SPECS that exist.
+
+    Returns:
+        list: (collection, index name) tuples of the dropped indexes.
+    """
+    dropped = []
+    for collection, index_name, status in verify_indexes(db):
+        if status == "missing":
+            continue
+        try:
+            db[collection].drop_index(index_name)
+        except OperationFailure:
+            continue
+        dropped.append((collection, index_name))
+    return dropped
+
+
+def _collect_plan_stages(node, stages, index_names):
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "indexName" in node:
+            index_names.add(node["indexName"])
+        for value in node.values():
+            _collect_plan_stages(value, stages, index_names)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_plan_stages(value, stages, index_names)
+
+
+def _winning_plans(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _winning_plans(value)
+
+
+def explain_pipeline(db, collection, pipeline):
+    """
+    Explains an aggregation pipeline and summarizes how its initial query stage is
+    executed.
+
+    Returns:
+        dict: Plan stages, index names used, whether the plan scans the collection
+        and whether it is covered by an index (no FETCH of full documents).
+    """
+    explain = db.command(
+        "explain",
+        { "aggregate": collection, "pipeline": pipeline, "cursor": {} },
+        verbosity="queryPlanner"
+    )
+    stages = []
+    index_names = set()
+    for plan in _winning_plans(explain):
+        _collect_plan_stages(plan, stages, index_names)
+
+    uses_index = any(stage in ("IXSCAN", "DISTINCT_SCAN", "COUNT_SCAN") for stage in stages)
+    return {
+        "stages": stages,
+        "indexes": sorted(index_names),
+        "collection_scan": "COLLSCAN" in stages,
+        "covered": uses_index and "FETCH" not in stages and "COLLSCAN" not in stages,
+    }
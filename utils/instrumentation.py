@@ -0,0 +1,244 @@
+# utils/instrumentation.py
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from utils import local_store
+
+load_dotenv()
+
+DEFAULT_SLOW_QUERY_MS = 1000
+DEFAULT_HISTORY_SIZE = 200
+# off: never explain, slow: explain pipelines slower than QUERY_SLOW_MS, all: explain every pipeline
+EXPLAIN_MODES = ('off', 'slow', 'all')
+
+logger = logging.getLogger('olist.queries')
+
+_history = collections.deque(maxlen=int(os.getenv('QUERY_HISTORY_SIZE', DEFAULT_HISTORY_SIZE)))
+_history_lock = threading.Lock()
+# The query function call the current thread is running, pipelines are recorded into it
+_current_call = contextvars.ContextVar('current_query_call', default=None)
+# Explains re-run the pipeline, one at a time off the request path
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='query-explain')
+
+
+def _slow_query_ms():
+    return float(os.getenv('QUERY_SLOW_MS', DEFAULT_SLOW_QUERY_MS))
+
+
+def _explain_mode():
+    mode = os.getenv('QUERY_EXPLAIN', 'slow')
+    if mode not in EXPLAIN_MODES:
+        raise ValueError(f"QUERY_EXPLAIN must be one of {', '.join(EXPLAIN_MODES)}, got '{mode}'.")
+    return mode
+
+
+def _configure_logger():
+    # Structured logs are JSON lines on stderr unless the application set up its own handlers
+    if os.getenv('QUERY_LOG', '1') == '0':
+        logger.disabled = True
+    elif not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(os.getenv('QUERY_LOG_LEVEL', 'INFO').upper())
+        logger.propagate = False
+
+
+_configure_logger()
+
+
+def _log(level, event, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({ "event": event, "at": datetime.now(timezone.utc).isoformat(), **fields }, default=str))
+
+
+def annotate(**fields):
+    """
+    Adds fields to the record of the query function call in progress, if any.
+    result_cache.cached uses it to report whether the call hit the disk cache.
+    """
+    call = _current_call.get()
+    if call is not None:
+        call.update(fields)
+
+
+def instrumented(function):
+    """
+    Records every call of a query function: arguments, wall time, cache outcome
+    and the pipelines it ran. Calls are logged and kept in a bounded in-process
+    history for the diagnostics panel.
+
+    Applied above st.cache_data, so calls answered from the Streamlit memory cache
+    are recorded too: they are the calls that never reach result_cache.cached.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        call = {
+            "query": name,
+            "backend": "local" if local_store.enabled() else "mongodb",
+            "arguments": [repr(arg) for arg in args] + [f"{key}={value!r}" for key, value in kwargs.items() if value is not None],
+            "started_at": datetime.now(timezone.utc),
+            "pipelines": [],
+        }
+        token = _current_call.set(call)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            call["error"] = str(e)
+            raise
+        finally:
+            _current_call.reset(token)
+            call["wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            call.setdefault("cache", "memory")
+            with _history_lock:
+                _history.append(call)
+            _log(
+                logging.WARNING if "error" in call or call["wall_ms"] >= _slow_query_ms() else logging.INFO,
+                "query",
+                **{ key: value for key, value in call.items() if key != "pipelines" },
+                pipeline_count=len(call["pipelines"]),
+            )
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def operation(collection, kind, pipeline=None):
+    """
+    Times a read on a collection and records it under the current query call.
+
+    Yields:
+        dict: The operation record, set its "returned" row count.
+    """
+    record = {
+        "collection": collection.name,
+        "kind": kind,
+        "stages": [next(iter(stage)) for stage in pipeline] if pipeline else [],
+        "returned": None,
+    }
+    call = _current_call.get()
+    if call is not None:
+        record["query"] = call["query"]
+        call["pipelines"].append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        slow = record["wall_ms"] >= _slow_query_ms()
+        if slow:
+            _log(logging.WARNING, "slow_pipeline", **record, pipeline=pipeline)
+        else:
+            _log(logging.DEBUG, "pipeline", **record)
+        mode = _explain_mode()
+        if kind == "aggregate" and (mode == "all" or (mode == "slow" and slow)):
+            record["explain"] = "pending"
+            _explain_executor.submit(_explain, collection, pipeline, record)
+
+
+def aggregate(collection, pipeline, **kwargs):
+    """
+    Runs an aggregation pipeline like collection.aggregate() and returns its rows
+    as a list, recording wall time and, per QUERY_EXPLAIN, server execution stats.
+    """
+    with operation(collection, "aggregate", pipeline) as record:
+        rows = list(collection.aggregate(pipeline, **kwargs))
+        record["returned"] = len(rows)
+    return rows
+
+
+def _explain(collection, pipeline, record):
+    try:
+        explain = collection.database.command(
+            "explain",
+            { "aggregate": collection.name, "pipeline": pipeline, "cursor": {}, "allowDiskUse": True },
+            verbosity="executionStats"
+        )
+        stats = explain_stats(explain)
+    except Exception as e:
+        with _history_lock:
+            record["explain"] = f"failed: {e}"
+        return
+    with _history_lock:
+        record.update(stats, explain="done")
+        fields = { key: value for key, value in record.items() if key != "explain" }
+    _log(logging.INFO, "explain", **fields)
+
+
+def explain_stats(explain):
+    """
+    Summarizes the executionStats explain output of a pipeline, whether its query
+    stage runs as a $cursor stage, in the query engine or on shards.
+
+    Returns:
+        dict: docs_examined, keys_examined, server_ms, collection_scan and
+        used_disk (whether any stage spilled to disk).
+    """
+    stats = { "docs_examined": 0, "keys_examined": 0, "server_ms": 0, "collection_scan": False, "used_disk": False }
+
+    def visit(node):
+        if isinstance(node, list):
+            for item in node:
+                visit(item)
+            return
+        if not isinstance(node, dict):
+            return
+        execution = node.get("executionStats")
+        if isinstance(execution, dict):
+            stats["docs_examined"] += execution.get("totalDocsExamined", 0)
+            stats["keys_examined"] += execution.get("totalKeysExamined", 0)
+            stats["server_ms"] = max(stats["server_ms"], execution.get("executionTimeMillis", 0))
+        if node.get("stage") == "COLLSCAN":
+            stats["collection_scan"] = True
+        if node.get("usedDisk") or node.get("spills", 0) > 0:
+            stats["used_disk"] = True
+        for value in node.values():
+            visit(value)
+
+    visit(explain)
+    return stats
+
+
+def history():
+    """
+    Returns the recent query function calls of this process, newest first, with
+    their pipelines.
+    """
+    # Explains update pipeline records under the same lock
+    with _history_lock:
+        return [{ **call, "pipelines": [dict(record) for record in call["pipelines"]] } for call in reversed(_history)]
+
+
+def stats():
+    """
+    Returns, per query function, the number of calls, how they were answered
+    (memory, disk or computed) and their mean and max wall time over the history.
+    """
+    per_query = {}
+    for call in history():
+        query = per_query.setdefault(call["query"], { "calls": 0, "memory": 0, "disk": 0, "miss": 0, "off": 0, "total_ms": 0.0, "max_ms": 0.0 })
+        query["calls"] += 1
+        query[call["cache"]] += 1
+        query["total_ms"] += call["wall_ms"]
+        query["max_ms"] = max(query["max_ms"], call["wall_ms"])
+    for query in per_query.values():
+        query["mean_ms"] = round(query.pop("total_ms") / query["calls"], 1)
+    return per_query
+
+
+def clear():
+    with _history_lock:
+        _history.clear()
@@ -0,0 +1,438 @@
+# utils/loader.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Explicit column types, so chunks are parsed consistently and without type inference
+CSV_DTYPES = {
+    'olist_customers_dataset.csv': {
+        'customer_id': 'str',
+        'customer_unique_id': 'str',
+        'customer_zip_code_prefix': 'int64',
+        'customer_city': 'str',
+        'customer_state': 'str',
+    },
+    'olist_geolocation_dataset.csv': {
+        'geolocation_zip_code_prefix': 'int64',
+        'geolocation_lat': 'float64',
+        'geolocation_lng': 'float64',
+        'geolocation_city': 'str',
+        'geolocation_state': 'str',
+    },
+    'olist_order_items_dataset.csv': {
+        'order_id': 'str',
+        'order_item_id': 'int64',
+        'product_id': 'str',
+        'seller_id': 'str',
+        'shipping_limit_date': 'str',
+        'price': 'float64',
+        'freight_value': 'float64',
+    },
+    'olist_order_payments_dataset.csv': {
+        'order_id': 'str',
+        'payment_sequential': 'int64',
+        'payment_type': 'str',
+        'payment_installments': 'int64',
+        'payment_value': 'float64',
+    },
+    'olist_order_reviews_dataset.csv': {
+        'review_id': 'str',
+        'order_id': 'str',
+        'review_score': 'int64',
+        'review_comment_title': 'str',
+        'review_comment_message': 'str',
+        'review_creation_date': 'str',
+        'review_answer_timestamp': 'str',
+    },
+    'olist_orders_dataset.csv': {
+        'order_id': 'str',
+        'customer_id': 'str',
+        'order_status': 'str',
+        'order_purchase_timestamp': 'str',
+        'order_approved_at': 'str',
+        'order_delivered_carrier_date': 'str',
+        'order_delivered_customer_date': 'str',
+        'order_estimated_delivery_date': 'str',
+    },
+    'olist_products_dataset.csv': {
+        'product_id': 'str',
+        'product_category_name': 'str',
+        'product_name_lenght': 'float64',
+        'product_description_lenght': 'float64',
+        'product_photos_qty': 'float64',
+        'product_weight_g': 'float64',
+        'product_length_cm': 'float64',
+        'product_height_cm': 'float64',
+        'product_width_cm': 'float64',
+    },
+    'olist_sellers_dataset.csv': {
+        'seller_id': 'str',
+        'seller_zip_code_prefix': 'int64',
+        'seller_city': 'str',
+        'seller_state': 'str',
+    },
+    'product_category_name_translation.csv': {
+        'product_category_name': 'str',
+        'product_category_name_english': 'str',
+    },
+}
+
+ORDER_DATE_COLUMNS = [
+    'order_purchase_timestamp',
+    'order_approved_at',
+    'order_delivered_carrier_date',
+    'order_delivered_customer_date',
+    'order_estimated_delivery_date'
+]
+ORDER_ITEM_DATE_COLUMNS = ['shipping_limit_date']
+REVIEW_DATE_COLUMNS = ['review_creation_date', 'review_answer_timestamp']
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def to_document_frame(df, date_columns=()):
+    """
+    Converts a DataFrame into object columns holding BSON-ready values in one
+    vectorized pass: date columns become Python datetimes and every missing value
+    (NaN/NaT) becomes None.
+
+    Args:
+        df (pd.DataFrame): Source rows.
+        date_columns (iterable): Columns to parse as datetimes.
+
+    Returns:
+        pd.DataFrame: A new DataFrame with object dtype columns.
+    """
+    result = df.astype(object).where(df.notna(), None)
+    for col in date_columns:
+        dates = pd.to_datetime(df[col], errors='coerce')
+        values = pd.Series(dates.dt.to_pydatetime(), index=df.index, dtype=object)
+        result[col] = values.where(dates.notna(), None)
+    return result
+
+
+def group_records(df, key='order_id'):
+    """
+    Groups rows into lists of documents keyed by a column in a single pass. The
+    key column is left out of the documents.
+
+    Returns:
+        dict: Key value -> list of row dictionaries.
+    """
+    df = df[df[key].notna()]
+    keys = df[key].tolist()
+    records = df.drop(columns=[key]).to_dict(orient='records')
+    grouped = {}
+    for key_value, record in zip(keys, records):
+        grouped.setdefault(key_value, []).append(record)
+    return grouped
+
+
+def build_order_documents(orders_df, order_items_df, order_payments_df, order_reviews_df):
+    """
+    Builds order documents with their items, payments and review embedded.
+
+    Args:
+        orders_df (pd.DataFrame): Rows of olist_orders_dataset.csv, optionally
+            with embedded customer columns.
+        order_items_df (pd.DataFrame): Rows of olist_order_items_dataset.csv.
+        order_payments_df (pd.DataFrame): Rows of olist_order_payments_dataset.csv.
+        order_reviews_df (pd.DataFrame): Rows of olist_order_reviews_dataset.csv.
+
+    Returns:
+        list: Order documents keyed by '_id'.
+    """
+    order_items = group_records(to_document_frame(order_items_df, ORDER_ITEM_DATE_COLUMNS))
+    order_payments = group_records(to_document_frame(order_payments_df))
+    order_reviews = group_records(to_document_frame(order_reviews_df, REVIEW_DATE_COLUMNS))
+
+    orders = to_document_frame(orders_df, ORDER_DATE_COLUMNS).to_dict(orient='records')
+    for order in orders:
+        order_id = order.pop('order_id')
+        order['order_items'] = order_items.get(order_id, [])
+        order['payment'] = order_payments.get(order_id, [])
+        reviews = order_reviews.get(order_id)
+        order['review'] = reviews[0] if reviews else {}
+        order['_id'] = order_id
+    return orders
+
+
+def batched(documents, batch_size):
+    """
+    Splits an iterable of documents into lists of at most batch_size documents.
+    """
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert_batch(collection, batch):
+    """
+    Inserts a batch unordered, treating documents that already exist as written so
+    batches can be retried after an interrupted load.
+
+    Returns:
+        int: Number of documents inserted.
+    """
+    try:
+        collection.insert_many(batch, ordered=False)
+        return len(batch)
+    except BulkWriteError as e:
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details["writeErrors"]):
+            raise
+        return e.details["nInserted"]
+
+
+def write_batches(collection, documents, batch_size=1000, workers=1, on_batch=None, skip=None):
+    """
+    Inserts documents into a collection in unordered batches. Documents whose _id
+    already exists are skipped instead of failing the load.
+
+    With a single worker the batches are inserted from the calling thread. With
+    more workers they are written concurrently, and at most two batches per worker
+    are in flight, so documents produced by a generator never pile up in memory
+    faster than they are written.
+
+    Args:
+        collection: Target PyMongo collection.
+        documents (iterable): Documents to insert, may be a generator.
+        batch_size (int): Documents per insert_many call.
+        workers (int): Number of concurrent writer threads.
+        on_batch (callable, optional): Called with the batch number and the batch
+            once it is written, never concurrently.
+        skip (set, optional): Batch numbers written by a previous run.
+
+    Returns:
+        int: Number of documents inserted.
+    """
+    skip = skip or set()
+    pending = (
+        (index, batch) for index, batch in enumerate(batched(documents, batch_size))
+        if index not in skip
+    )
+
+    if workers <= 1:
+        inserted = 0
+        for index, batch in pending:
+            inserted += _insert_batch(collection, batch)
+            if on_batch:
+                on_batch(index, batch)
+        return inserted
+
+    slots = threading.BoundedSemaphore(workers * 2)
+    callback_lock = threading.Lock()
+    failed = threading.Event()
+
+    def write(index, batch):
+        try:
+            inserted = _insert_batch(collection, batch)
+            if on_batch:
+                with callback_lock:
+                    on_batch(index, batch)
+            return inserted
+        except Exception:
+            failed.set()
+            raise
+        finally:
+            slots.release()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"write-{collection.name}") as executor:
+        for index, batch in pending:
+            slots.acquire()
+            if failed.is_set():
+                # Stop producing, the failing batch is re-raised below
+                slots.release()
+                break
+            futures.append(executor.submit(write, index, batch))
+    return sum(future.result() for future in futures)
+
+
+def read_dataset_csv(data_dir, file_name, chunk_size=None):
+    """
+    Reads one of the Olist CSV files with its explicit column types.
+
+    Args:
+        data_dir (str): Directory holding the CSV files.
+        file_name (str): CSV file name, a key of CSV_DTYPES.
+        chunk_size (int, optional): When set, returns an iterator of DataFrames
+            with at most this many rows instead of a single DataFrame.
+    """
+    return pd.read_csv(os.path.join(data_dir, file_name), dtype=CSV_DTYPES[file_name], chunksize=chunk_size)
+
+
+def stream_documents(chunks, rename=None, date_columns=(), transform=None):
+    """
+    Turns an iterator of DataFrame chunks into a generator of documents, so only
+    one chunk is held in memory at a time.
+
+    Args:
+        chunks (iterable): DataFrame chunks.
+        rename (dict, optional): Column renames, e.g. {'customer_id': '_id'}.
+        date_columns (iterable): Columns to convert to datetimes.
+        transform (callable, optional): Applied to each chunk before conversion.
+    """
+    for chunk in chunks:
+        if transform:
+            chunk = transform(chunk)
+        if rename:
+            chunk = chunk.rename(columns=rename)
+        yield from to_document_frame(chunk, date_columns).to_dict(orient='records')
+
+
+def stream_order_documents(chunks):
+    """
+    Yields order documents without their embedded arrays, which are filled in
+    afterwards by push_order_children().
+    """
+    for order in stream_documents(chunks, rename={'order_id': '_id'}, date_columns=ORDER_DATE_COLUMNS):
+        order['order_items'] = []
+        order['payment'] = []
+        order['review'] = {}
+        yield order
+
+
+def push_order_children(collection, chunks, field, date_columns=(), key=None, first_only=False,
+                        on_chunk=None, skip=None):
+    """
+    Embeds child rows (items, payments or reviews) into already inserted orders,
+    one chunk at a time, with unordered bulk updates.
+
+    The updates are idempotent: rows are only pushed into orders that do not hold
+    any of their key values yet, and a first-only field is only set while empty.
+
+    Args:
+        collection: The orders collection.
+        chunks (iterable): DataFrame chunks of the child CSV.
+        field (str): Order field receiving the rows.
+        date_columns (iterable): Columns to convert to datetimes.
+        key (str, optional): Column identifying a row within its order, e.g.
+            'order_item_id'. Required unless first_only is set.
+        first_only (bool): Store only the first row per order as a subdocument,
+            as done for reviews.
+        on_chunk (callable, optional): Called with the chunk number once written.
+        skip (set, optional): Chunk numbers written by a previous run.
+
+    Returns:
+        int: Number of child rows read.
+    """
+    skip = skip or set()
+    rows = 0
+    for index, chunk in enumerate(chunks):
+        rows += len(chunk)
+        if index in skip:
+            continue
+        grouped = group_records(to_document_frame(chunk, date_columns))
+        if first_only:
+            requests = [
+                UpdateOne({ "_id": order_id, field: {} }, { "$set": { field: records[0] } })
+                for order_id, records in grouped.items()
+            ]
+        else:
+            requests = [
+                UpdateOne(
+                    { "_id": order_id, f"{field}.{key}": { "$nin": [record[key] for record in records] } },
+                    { "$push": { field: { "$each": records } } }
+                )
+                for order_id, records in grouped.items()
+            ]
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+        if on_chunk:
+            on_chunk(index)
+    return rows
+
+
+def embed_dimensions(db, match=None):
+    """
+    Embeds customer_state/customer_city and the items' product_category_name_english
+    into the orders collection on the server, for loads that did not denormalize
+    them in pandas.
+
+    Args:
+        db: The olistDB database.
+        match (dict, optional): Restricts the update to the matching orders.
+    """
+    match_stages = [{ "$match": match }] if match else []
+    db.orders.aggregate(match_stages + [
+        {
+            "$lookup": {
+                "from": "customers",
+                "localField": "customer_id",
+                "foreignField": "_id",
+                "as": "customer_info"
+            }
+        },
+        {
+            "$project": {
+                "customer_city": { "$ifNull": [{ "$arrayElemAt": ["$customer_info.customer_city", 0] }, None] },
+                "customer_state": { "$ifNull": [{ "$arrayElemAt": ["$customer_info.customer_state", 0] }, None] }
+            }
+        },
+        { "$merge": { "into": "orders", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard" } }
+    ])
+    db.orders.aggregate(match_stages + [
+        {
+            "$lookup": {
+                "from": "products",
+                "localField": "order_items.product_id",
+                "foreignField": "_id",
+                "as": "product_info"
+            }
+        },
+        {
+            "$project": {
+                "order_items": {
+                    "$map": {
+                        "input": "$order_items",
+                        "as": "item",
+                        "in": {
+                            "$let": {
+                                "vars": { "index": { "$indexOfArray": ["$product_info._id", "$$item.product_id"] } },
+                                "in": {
+                                    "$mergeObjects": [
+                                        "$$item",
+                                        {
+                                            "product_category_name_english": {
+                                                "$cond": [
+                                                    { "$gte": ["$$index", 0] },
+                                                    { "$arrayElemAt": ["$product_info.product_category_name_english", "$$index"] },
+                                                    None
+                                                ]
+                                            }
+                                        }
+                                    ]
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        { "$merge": { "into": "orders", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard" } }
+    ])
+
+
+def peak_memory_mb():
+    """
+    Returns the peak resident set size of the process in megabytes, or None if it
+    cannot be measured on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
@@ -0,0 +1,101 @@
+# utils/local_store.py
+import functools
+import os
+import pandas as pd
+from dotenv import load_dotenv
+from utils.loader import ORDER_DATE_COLUMNS, read_dataset_csv
+
+load_dotenv()
+
+DEFAULT_STORE_DIR = './local_store'
+
+# Table name -> (CSV file, columns kept). Only the columns the queries read are
+# stored, so every table is a handful of typed Parquet columns.
+TABLES = {
+    'orders': ('olist_orders_dataset.csv', ['order_id', 'customer_id', *ORDER_DATE_COLUMNS]),
+    'order_items': ('olist_order_items_dataset.csv', ['order_id', 'product_id', 'seller_id', 'price', 'freight_value']),
+    'payments': ('olist_order_payments_dataset.csv', ['order_id', 'payment_type', 'payment_value']),
+    'reviews': ('olist_order_reviews_dataset.csv', ['order_id', 'review_score']),
+    'customers': ('olist_customers_dataset.csv', ['customer_id', 'customer_unique_id', 'customer_city', 'customer_state']),
+    'products': ('olist_products_dataset.csv', ['product_id', 'product_category_name', 'product_name_lenght']),
+}
+
+
+def enabled():
+    """
+    Tells whether queries run on the local columnar store instead of MongoDB,
+    i.e. QUERY_BACKEND is set to 'local'.
+    """
+    return os.getenv('QUERY_BACKEND', 'mongodb').lower() == 'local'
+
+
+def store_dir():
+    return os.getenv('LOCAL_STORE_DIR', DEFAULT_STORE_DIR)
+
+
+def build_store(data_dir='./dataset', output_dir=None):
+    """
+    Converts the Olist CSV files into one Parquet file per table.
+
+    Values are prepared the way the loader stores them in MongoDB: dates are
+    parsed, items, payments and reviews of unknown orders are dropped, each
+    order keeps only its first review and products get their English category
+    name, 'Unknown' when missing.
+
+    Args:
+        data_dir (str): Directory holding the CSV files.
+        output_dir (str, optional): Store directory, LOCAL_STORE_DIR by default.
+
+    Returns:
+        dict: Table name -> number of rows written.
+    """
+    output_dir = output_dir or store_dir()
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {}
+    order_ids = None
+    for table, (file_name, columns) in TABLES.items():
+        df = read_dataset_csv(data_dir, file_name)[columns]
+        if table == 'orders':
+            for column in ORDER_DATE_COLUMNS:
+                df[column] = pd.to_datetime(df[column], errors='coerce')
+            order_ids = set(df['order_id'])
+        elif table in ('order_items', 'payments', 'reviews'):
+            # Children are embedded in their order in MongoDB, those of unknown orders are never seen
+            df = df[df['order_id'].map(order_ids.__contains__)]
+        if table == 'reviews':
+            df = df.drop_duplicates('order_id', keep='first')
+        elif table == 'products':
+            translation_df = read_dataset_csv(data_dir, 'product_category_name_translation.csv')
+            df = df.merge(translation_df, on='product_category_name', how='left')
+            df['product_category_name_english'] = df['product_category_name_english'].fillna('Unknown')
+            df = df.drop(columns='product_category_name')
+        df.to_parquet(os.path.join(output_dir, f'{table}.parquet'), index=False)
+        counts[table] = len(df)
+    load_table.cache_clear()
+    return counts
+
+
+@functools.lru_cache(maxsize=None)
+def load_table(table):
+    """
+    Reads a table of the local store, once per process.
+
+    Returns:
+        pd.DataFrame: The table. Callers must not modify it in place.
+    """
+    path = os.path.join(store_dir(), f'{table}.parquet')
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Local store table '{path}' not found, build it with 'python -m scripts.local_store'.")
+    return pd.read_parquet(path)
+
+
+def data_version():
+    """
+    Returns a version of the store that changes whenever it is rebuilt.
+    """
+    mtimes = [
+        os.path.getmtime(path)
+        for path in (os.path.join(store_dir(), f'{table}.parquet') for table in TABLES)
+        if os.path.exists(path)
+    ]
+    return str(max(mtimes)) if mtimes else None
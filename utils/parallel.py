@@ -0,0 +1,44 @@
+# utils/parallel.py
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_WORKERS = 8
+
+
+def _timed(task):
+    start = time.perf_counter()
+    try:
+        result, error = task(), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, int((time.perf_counter() - start) * 1000)
+
+
+def run_parallel(tasks, workers=None):
+    """
+    Runs tasks in a thread pool and yields each one as soon as it finishes, so
+    waiting for all of them takes as long as the slowest instead of the sum.
+
+    PyMongo releases the GIL while waiting for the server, and all threads share
+    the pooled client, so each running query holds one pooled connection.
+
+    Args:
+        tasks (dict): Name -> callable without arguments.
+        workers (int, optional): Threads, QUERY_RUNNER_WORKERS (8 by default)
+            when omitted.
+
+    Yields:
+        tuple: (name, result, error, duration_ms) in completion order. error is
+        the exception raised by the task, or None.
+    """
+    if not tasks:
+        return
+    workers = workers or int(os.getenv('QUERY_RUNNER_WORKERS', DEFAULT_WORKERS))
+    with ThreadPoolExecutor(max_workers=min(workers, len(tasks)), thread_name_prefix="query-runner") as executor:
+        futures = { executor.submit(_timed, task): name for name, task in tasks.items() }
+        for future in as_completed(futures):
+            yield (futures[future], *future.result())
@@ -0,0 +1,175 @@
+# utils/partitions.py
+from datetime import datetime
+from utils import instrumentation
+from utils.indexes import index_models
+from utils.schema import get_month_partitions, set_month_partitions
+
+PARTITION_PREFIX = 'orders_'
+
+
+def partition_name(month):
+    """
+    Returns the collection holding the orders purchased in a month, e.g.
+    "orders_2017_01" for "2017-01".
+    """
+    return PARTITION_PREFIX + month.replace('-', '_')
+
+
+def _month_range(month):
+    year, number = (int(part) for part in month.split('-'))
+    start = datetime(year, number, 1)
+    end = datetime(year + number // 12, number % 12 + 1, 1)
+    return start, end
+
+
+def _month_of(value):
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def _purchase_months(db, match=None):
+    rows = db.orders.aggregate([
+        { "$match": { **(match or {}), "order_purchase_timestamp": { "$type": "date" } } },
+        {
+            "$group": {
+                "_id": {
+                    "year": { "$year": "$order_purchase_timestamp" },
+                    "month": { "$month": "$order_purchase_timestamp" }
+                }
+            }
+        }
+    ], allowDiskUse=True)
+    return { f"{row['_id']['year']:04d}-{row['_id']['month']:02d}" for row in rows }
+
+
+def _copy_month(db, month):
+    # $out replaces the partition in one step and keeps its indexes
+    start, end = _month_range(month)
+    db.orders.aggregate([
+        { "$match": { "order_purchase_timestamp": { "$gte": start, "$lt": end } } },
+        { "$out": partition_name(month) }
+    ], allowDiskUse=True)
+    collection = db[partition_name(month)]
+    collection.create_indexes(index_models("orders"))
+    return collection.estimated_document_count()
+
+
+def build_partitions(db):
+    """
+    Copies the orders into one collection per purchase month, replacing any
+    earlier partitions. Orders without a purchase date are left out: only
+    queries filtered by purchase date read the partitions.
+
+    Returns:
+        dict: Month -> number of orders copied.
+    """
+    drop_partitions(db)
+    counts = { month: _copy_month(db, month) for month in sorted(_purchase_months(db)) }
+    set_month_partitions(db, list(counts))
+    return counts
+
+
+def refresh_partitions(db, months):
+    """
+    Copies the orders of some months again after they changed, e.g. after an
+    incremental load. Does nothing when orders are not partitioned.
+
+    Args:
+        months (iterable): "YYYY-MM" months to copy.
+
+    Returns:
+        dict: Month -> number of orders copied.
+    """
+    partitioned = set(get_month_partitions(db))
+    if not partitioned:
+        return {}
+    counts = { month: _copy_month(db, month) for month in sorted(set(months)) }
+    set_month_partitions(db, (partitioned | set(counts)) - { month for month, count in counts.items() if not count })
+    for month, count in counts.items():
+        if not count:
+            db.drop_collection(partition_name(month))
+    return counts
+
+
+def months_of_orders(db, order_ids=None, customer_ids=None):
+    """
+    Returns the purchase months of the given orders and of the orders of the
+    given customers, as "YYYY-MM" strings.
+    """
+    conditions = []
+    if order_ids:
+        conditions.append({ "_id": { "$in": list(order_ids) } })
+    if customer_ids:
+        conditions.append({ "customer_id": { "$in": list(customer_ids) } })
+    if not conditions:
+        return set()
+    return _purchase_months(db, { "$or": conditions })
+
+
+def months_of(purchase_dates):
+    """
+    Returns the "YYYY-MM" months of purchase dates, skipping missing ones.
+    """
+    return { _month_of(value) for value in purchase_dates if value is not None }
+
+
+def drop_partitions(db):
+    """
+    Drops every month partition and records that orders are not partitioned.
+    """
+    for month in get_month_partitions(db):
+        db.drop_collection(partition_name(month))
+    set_month_partitions(db, [])
+
+
+def route(db, purchase_range):
+    """
+    Lists the partitions overlapping a purchase date range.
+
+    Args:
+        db: The olistDB database.
+        purchase_range (dict): Condition on order_purchase_timestamp with "$gte"
+            and/or "$lte" bounds, as built by queries.filters.build_stages.
+
+    Returns:
+        list | None: Partition collection names in month order, or None when
+        the orders must be read instead: orders are not partitioned or the
+        range is unbounded.
+    """
+    start, end = purchase_range.get("$gte"), purchase_range.get("$lte")
+    if start is None and end is None:
+        return None
+    months = get_month_partitions(db)
+    if not months:
+        return None
+    names = []
+    for month in months:
+        month_start, month_end = _month_range(month)
+        if (end is None or month_start <= end) and (start is None or month_end > start):
+            names.append(partition_name(month))
+    return names
+
+
+def aggregate(db, collection, pipeline, **kwargs):
+    """
+    Runs a pipeline like instrumentation.aggregate(). On the orders, a leading
+    $match with a purchase date range is routed to the month partitions that
+    overlap it: it runs on the first one and, through $unionWith, on the others,
+    so the cost follows the number of months in the range, not the history.
+
+    Args:
+        db: The olistDB database.
+        collection (str): Source collection name.
+        pipeline (list): Aggregation pipeline.
+
+    Returns:
+        list: The result rows.
+    """
+    match = pipeline[0].get("$match", {}) if pipeline else {}
+    purchase_range = match.get("order_purchase_timestamp")
+    names = route(db, purchase_range) if collection == "orders" and isinstance(purchase_range, dict) else None
+    # No overlapping month: the orders index answers the empty range
+    if not names:
+        return instrumentation.aggregate(db[collection], pipeline, **kwargs)
+    first = pipeline[0]
+    unions = [{ "$unionWith": { "coll": name, "pipeline": [first] } } for name in names[1:]]
+    return instrumentation.aggregate(db[names[0]], [first] + unions + pipeline[1:], **kwargs)
@@ -0,0 +1,228 @@
+# utils/result_cache.py
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+import threading
+import time
+from dotenv import load_dotenv
+from utils import instrumentation
+
+load_dotenv()
+
+DEFAULT_CACHE_DIR = './.result_cache'
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+ENTRY_SUFFIX = '.pkl'
+
+_counters = { "hits": 0, "misses": 0, "evictions": 0 }
+_counters_lock = threading.Lock()
+
+
+def cache_dir():
+    return os.getenv('RESULT_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+
+def _ttl_seconds():
+    return int(os.getenv('RESULT_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+
+
+def _max_bytes():
+    return int(os.getenv('RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def _count(counter):
+    with _counters_lock:
+        _counters[counter] += 1
+
+
+def data_version(query=None):
+    """
+    Returns the version of the data the queries currently read: the version
+    recorded by the last load in MongoDB, or the build of the local store.
+
+    Args:
+        query (str, optional): A query name of queries.catalog: returns the
+            version of the last load that changed its results.
+    """
+    # Imported here so the cache does not open a MongoDB connection on import
+    from utils import local_store
+    if local_store.enabled():
+        return f"local:{local_store.data_version()}"
+    from utils.db_connection import get_database
+    from utils.schema import get_data_version
+    return f"mongodb:{get_data_version(get_database(), query)}"
+
+
+def make_key(name, args, version):
+    return hashlib.sha256(repr((name, args, version)).encode('utf-8')).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(cache_dir(), key + ENTRY_SUFFIX)
+
+
+def get(key):
+    """
+    Reads a cached result.
+
+    Returns:
+        tuple: (True, result) on a hit, (False, None) when the entry is missing
+        or older than RESULT_CACHE_TTL_SECONDS.
+    """
+    path = _entry_path(key)
+    try:
+        with open(path, 'rb') as f:
+            stored_at, result = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False, None
+    if time.time() - stored_at > _ttl_seconds():
+        _remove(path)
+        return False, None
+    # The access time drives LRU eviction, filesystems mounted noatime do not update it
+    now = time.time()
+    try:
+        os.utime(path, (now, now))
+    except OSError:
+        pass
+    return True, result
+
+
+def put(key, result):
+    """
+    Stores a result, then evicts the least recently used entries while the cache
+    is larger than RESULT_CACHE_MAX_BYTES.
+    """
+    directory = cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    # Written under a temporary name and renamed, so other processes never read a partial entry
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time(), result), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, _entry_path(key))
+    except BaseException:
+        _remove(temp_path)
+        raise
+    evict(_max_bytes())
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _entries():
+    entries = []
+    directory = cache_dir()
+    if not os.path.isdir(directory):
+        return entries
+    for file_name in os.listdir(directory):
+        if not file_name.endswith(ENTRY_SUFFIX):
+            continue
+        path = os.path.join(directory, file_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_atime, stat.st_size, path))
+    return entries
+
+
+def evict(max_bytes):
+    """
+    Removes the least recently used entries until the cache holds at most
+    max_bytes.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+        removed += 1
+        _count("evictions")
+    return removed
+
+
+def invalidate():
+    """
+    Removes every cached result. Results of other data versions are already
+    unreachable, this also frees their space right away.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    entries = _entries()
+    for _, _, path in entries:
+        _remove(path)
+    return len(entries)
+
+
+def stats():
+    """
+    Returns the hit, miss and eviction counters of this process along with the
+    number of entries and bytes on disk.
+    """
+    entries = _entries()
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        **counters,
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+    }
+
+
+def cached(function=None, query=None):
+    """
+    Caches the result of a query function on disk, shared by every process using
+    the same RESULT_CACHE_DIR.
+
+    Entries are keyed by the function, its arguments and the data version of its
+    query, so a load changing the query's results makes earlier ones unreachable.
+    A TTL of 0 disables the cache.
+
+    Args:
+        query (str, optional): Query name of queries.catalog the function answers
+            from, defaults to the function name. Use as @cached(query=...).
+    """
+    if function is None:
+        return functools.partial(cached, query=query)
+    query = query or function.__name__
+    signature = inspect.signature(function)
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _ttl_seconds() <= 0:
+            instrumentation.annotate(cache="off")
+            return function(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = make_key(name, tuple(bound.arguments.items()), data_version(query))
+        hit, result = get(key)
+        if hit:
+            _count("hits")
+            instrumentation.annotate(cache="disk")
+            return result
+        _count("misses")
+        instrumentation.annotate(cache="miss")
+        result = function(*args, **kwargs)
+        try:
+            put(key, result)
+        except OSError:
+            # A cache that cannot be written must not fail the query
+            pass
+        return result
+
+    return wrapper
@@ -0,0 +1,338 @@
+# utils/rollups.py
+from datetime import datetime, timedelta
+from utils import instrumentation, summaries
+
+ROLLUP_COLLECTION = 'sales_rollups'
+# Name of the rollups in the summary_meta collection
+ROLLUP_NAME = 'sales_rollups'
+GRANULARITIES = ('day', 'week', 'month', 'quarter')
+# Coarser granularity -> finer one it is summed from
+DERIVED_FROM = { "week": "day", "month": "day", "quarter": "month" }
+# Grouping -> dimensions the rows are keyed by besides the period
+GROUPINGS = {
+    "total": (),
+    "customer_state": ("customer_state",),
+    "product_category": ("product_category",),
+    "customer_state+product_category": ("customer_state", "product_category"),
+}
+# Groupings summed from another grouping of the same granularity. Every order has a
+# single customer state, so order counts add up over states, but not over categories.
+GROUPING_DERIVED_FROM = { "total": "customer_state", "product_category": "customer_state+product_category" }
+METRICS = ('revenue', 'items', 'orders', 'freight')
+DIMENSIONS = ('customer_state', 'product_category')
+
+
+def period_start_expression(granularity, date):
+    """
+    Builds the expression truncating a date to the start of its period: the day,
+    the ISO week starting on Monday, the month or the quarter. Uses $dateFromParts
+    rather than $dateTrunc, which needs MongoDB 5.0.
+
+    Args:
+        granularity (str): One of GRANULARITIES.
+        date: Date expression, e.g. "$order_purchase_timestamp".
+    """
+    if granularity == "day":
+        return { "$dateFromParts": { "year": { "$year": date }, "month": { "$month": date }, "day": { "$dayOfMonth": date } } }
+    if granularity == "week":
+        return { "$dateFromParts": { "isoWeekYear": { "$isoWeekYear": date }, "isoWeek": { "$isoWeek": date }, "isoDayOfWeek": 1 } }
+    if granularity == "month":
+        return { "$dateFromParts": { "year": { "$year": date }, "month": { "$month": date }, "day": 1 } }
+    if granularity == "quarter":
+        quarter_month = { "$add": [{ "$multiply": [{ "$trunc": { "$divide": [{ "$subtract": [{ "$month": date }, 1] }, 3] } }, 3] }, 1] }
+        return { "$dateFromParts": { "year": { "$year": date }, "month": quarter_month, "day": 1 } }
+    raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}, got '{granularity}'.")
+
+
+def period_start(granularity, value):
+    """
+    Truncates a datetime to the start of its period, like period_start_expression.
+    """
+    day = datetime(value.year, value.month, value.day)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "quarter":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}, got '{granularity}'.")
+
+
+def grouping_for(customer_state=None, product_category=None):
+    """
+    Returns the grouping whose rows answer a query filtered on these dimensions.
+    """
+    dimensions = tuple(name for name, value in zip(DIMENSIONS, (customer_state, product_category)) if value is not None)
+    return next(grouping for grouping, keys in GROUPINGS.items() if keys == dimensions)
+
+
+def _row_projection(granularity, grouping, refreshed_at):
+    # Rows grouped on { period_start, <dimensions> } become rollup documents with a
+    # deterministic _id, so a refresh replaces them in place
+    keys = GROUPINGS[grouping]
+    dimensions = { name: f"$_id.{name}" if name in keys else { "$literal": None } for name in DIMENSIONS }
+    return {
+        "$project": {
+            "_id": {
+                "granularity": { "$literal": granularity },
+                "grouping": { "$literal": grouping },
+                "period_start": "$_id.period_start",
+                **dimensions,
+            },
+            "granularity": { "$literal": granularity },
+            "grouping": { "$literal": grouping },
+            "period_start": "$_id.period_start",
+            **dimensions,
+            **{ metric: 1 for metric in METRICS },
+            "refreshed_at": { "$literal": refreshed_at },
+        }
+    }
+
+
+_MERGE = { "$merge": { "into": ROLLUP_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert" } }
+
+
+def _purchase_match(since):
+    purchased = { "$type": "date" }
+    if since is not None:
+        purchased["$gte"] = period_start("day", since)
+    return { "$match": { "order_purchase_timestamp": purchased, "order_items.0": { "$exists": True } } }
+
+
+def _customer_state_stages(embedded):
+    if embedded:
+        return []
+    return [
+        { "$lookup": { "from": "customers", "localField": "customer_id", "foreignField": "_id", "as": "customer_info" } },
+        { "$addFields": { "customer_state": { "$first": "$customer_info.customer_state" } } },
+    ]
+
+
+def build_daily_state_pipeline(embedded, refreshed_at, since=None):
+    """
+    Builds the pipeline writing the daily rows per customer state. Orders are
+    grouped without unwinding their items, so each counts once.
+    """
+    return [_purchase_match(since)] + _customer_state_stages(embedded) + [
+        {
+            "$group": {
+                "_id": {
+                    "period_start": period_start_expression("day", "$order_purchase_timestamp"),
+                    "customer_state": { "$ifNull": ["$customer_state", None] },
+                },
+                "revenue": { "$sum": { "$sum": "$order_items.price" } },
+                "items": { "$sum": { "$size": "$order_items" } },
+                "orders": { "$sum": 1 },
+                "freight": { "$sum": { "$sum": "$order_items.freight_value" } },
+            }
+        },
+        _row_projection("day", "customer_state", refreshed_at),
+        _MERGE,
+    ]
+
+
+def build_daily_state_category_pipeline(embedded, refreshed_at, since=None):
+    """
+    Builds the pipeline writing the daily rows per customer state and product
+    category. Items are grouped per order first, an order holding items of
+    several categories counts once in each.
+    """
+    if embedded:
+        category_stages = [{ "$unwind": "$order_items" }]
+        category = "$order_items.product_category_name_english"
+    else:
+        category_stages = [
+            { "$unwind": "$order_items" },
+            { "$lookup": { "from": "products", "localField": "order_items.product_id", "foreignField": "_id", "as": "product_info" } },
+        ]
+        category = { "$first": "$product_info.product_category_name_english" }
+    return [_purchase_match(since)] + _customer_state_stages(embedded) + category_stages + [
+        {
+            "$group": {
+                "_id": {
+                    "period_start": period_start_expression("day", "$order_purchase_timestamp"),
+                    "customer_state": { "$ifNull": ["$customer_state", None] },
+                    "product_category": { "$ifNull": [category, None] },
+                    "order_id": "$_id",
+                },
+                "revenue": { "$sum": "$order_items.price" },
+                "items": { "$sum": 1 },
+                "freight": { "$sum": "$order_items.freight_value" },
+            }
+        },
+        {
+            "$group": {
+                "_id": { "period_start": "$_id.period_start", "customer_state": "$_id.customer_state", "product_category": "$_id.product_category" },
+                "revenue": { "$sum": "$revenue" },
+                "items": { "$sum": "$items" },
+                "orders": { "$sum": 1 },
+                "freight": { "$sum": "$freight" },
+            }
+        },
+        _row_projection("day", "customer_state+product_category", refreshed_at),
+        _MERGE,
+    ]
+
+
+def build_rollup_pipeline(granularity, grouping, source_granularity, source_grouping, refreshed_at, since=None):
+    """
+    Builds the pipeline on the rollup collection summing the rows of a finer
+    granularity, or of a grouping with more dimensions, into coarser rows.
+    """
+    match = { "granularity": source_granularity, "grouping": source_grouping }
+    if since is not None:
+        match["period_start"] = { "$gte": period_start(granularity, since) }
+    keys = GROUPINGS[grouping]
+    return [
+        { "$match": match },
+        {
+            "$group": {
+                "_id": {
+                    "period_start": period_start_expression(granularity, "$period_start") if granularity != source_granularity else "$period_start",
+                    **{ name: f"${name}" for name in keys },
+                },
+                **{ metric: { "$sum": f"${metric}" } for metric in METRICS },
+            }
+        },
+        _row_projection(granularity, grouping, refreshed_at),
+        _MERGE,
+    ]
+
+
+def _remove_replaced(db, granularity, refreshed_at, since):
+    # Rows of the refreshed periods the new data no longer produces, e.g. a
+    # state whose only order moved to another day
+    query = { "granularity": granularity, "refreshed_at": { "$ne": refreshed_at } }
+    if since is not None:
+        query["period_start"] = { "$gte": period_start(granularity, since) }
+    db[ROLLUP_COLLECTION].delete_many(query)
+
+
+def refresh_rollups(db, embedded, since=None):
+    """
+    Rebuilds the sales rollups: revenue, items, orders and freight per day, ISO
+    week, month and quarter, in total and per customer state, product category
+    or both.
+
+    Only the daily rows are computed from the orders, in two scans. Weeks and
+    months are summed from days and quarters from months, and the total and
+    per-category rows from the per-state rows of the same period.
+
+    Args:
+        db: The olistDB database.
+        embedded (bool): Whether orders carry the customer and category dimensions.
+        since (datetime, optional): Rebuild only the periods holding orders
+            purchased from this date on, e.g. after an incremental load.
+
+    Returns:
+        dict: The rollup metadata document.
+    """
+    refreshed_at = summaries._now()
+    orders = db.orders
+    rollups = db[ROLLUP_COLLECTION]
+    for pipeline in (
+        build_daily_state_pipeline(embedded, refreshed_at, since),
+        build_daily_state_category_pipeline(embedded, refreshed_at, since),
+    ):
+        with instrumentation.operation(orders, "aggregate", pipeline):
+            orders.aggregate(pipeline, allowDiskUse=True)
+
+    for granularity in GRANULARITIES:
+        pipelines = []
+        if granularity in DERIVED_FROM:
+            pipelines += [
+                build_rollup_pipeline(granularity, grouping, DERIVED_FROM[granularity], grouping, refreshed_at, since)
+                for grouping in GROUPINGS
+                if grouping not in GROUPING_DERIVED_FROM
+            ]
+        pipelines += [
+            build_rollup_pipeline(granularity, grouping, granularity, source_grouping, refreshed_at, since)
+            for grouping, source_grouping in GROUPING_DERIVED_FROM.items()
+        ]
+        for pipeline in pipelines:
+            with instrumentation.operation(rollups, "aggregate", pipeline):
+                rollups.aggregate(pipeline, allowDiskUse=True)
+        # Coarser levels are summed from this one, drop replaced rows first
+        _remove_replaced(db, granularity, refreshed_at, since)
+
+    meta = {
+        "refreshed_at": refreshed_at,
+        "stale": False,
+        "row_count": rollups.estimated_document_count(),
+        "duration_ms": int((summaries._now() - refreshed_at).total_seconds() * 1000),
+    }
+    db[summaries.SUMMARY_META_COLLECTION].update_one({ "_id": ROLLUP_NAME }, { "$set": meta }, upsert=True)
+    return { "_id": ROLLUP_NAME, **meta }
+
+
+def update_rollups(db, embedded, since):
+    """
+    Brings maintained rollups up to date after an incremental load. Rollups that
+    were never built or are stale are left for the next full refresh.
+
+    Args:
+        since (datetime | None): Earliest purchase date of the loaded orders,
+            None to rebuild every period.
+
+    Returns:
+        dict | None: The rollup metadata document, None when nothing was refreshed.
+    """
+    meta = db[summaries.SUMMARY_META_COLLECTION].find_one({ "_id": ROLLUP_NAME })
+    if not meta or meta.get("stale"):
+        return None
+    return refresh_rollups(db, embedded, since)
+
+
+def read_rollups(db, granularity, start_date=None, end_date=None, customer_state=None, product_category=None):
+    """
+    Reads the sales of each period from the rollups.
+
+    Whole periods are read from the rows of the granularity. With a date range,
+    the daily rows of the range are summed instead, so the first and last
+    periods only count the days in the range.
+
+    Args:
+        db: The olistDB database.
+        granularity (str): One of GRANULARITIES.
+        start_date (date, optional): First purchase day.
+        end_date (date, optional): Last purchase day, included.
+        customer_state (str, optional): Customer state.
+        product_category (str, optional): English product category name.
+
+    Returns:
+        list | None: Rows with period_start and the METRICS ordered by period,
+        or None when the rollups are missing or not fresh.
+    """
+    if summaries.get_fresh_meta(db, ROLLUP_NAME) is None:
+        return None
+    match = {
+        "granularity": "day" if start_date is not None or end_date is not None else granularity,
+        "grouping": grouping_for(customer_state, product_category),
+    }
+    if customer_state is not None:
+        match["customer_state"] = customer_state
+    if product_category is not None:
+        match["product_category"] = product_category
+    period_range = {}
+    if start_date is not None:
+        period_range["$gte"] = period_start("day", start_date)
+    if end_date is not None:
+        period_range["$lte"] = period_start("day", end_date)
+    if period_range:
+        match["period_start"] = period_range
+
+    pipeline = [{ "$match": match }]
+    if match["granularity"] != granularity:
+        pipeline.append({
+            "$group": {
+                "_id": period_start_expression(granularity, "$period_start"),
+                **{ metric: { "$sum": f"${metric}" } for metric in METRICS },
+            }
+        })
+        pipeline.append({ "$project": { "_id": 0, "period_start": "$_id", **{ metric: 1 for metric in METRICS } } })
+    else:
+        pipeline.append({ "$project": { "_id": 0, "period_start": 1, **{ metric: 1 for metric in METRICS } } })
+    pipeline.append({ "$sort": { "period_start": 1 } })
+    return instrumentation.aggregate(db[ROLLUP_COLLECTION], pipeline)
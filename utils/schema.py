@@ -0,0 +1,87 @@
+# utils/schema.py
+from datetime import datetime, timezone
+
+SCHEMA_META_COLLECTION = 'schema_meta'
+
+
+def set_embedded_dimensions(db, enabled):
+    """
+    Records whether the orders collection carries the denormalized customer and
+    product category fields written by scripts/create.py --embed-dimensions.
+    """
+    db[SCHEMA_META_COLLECTION].update_one(
+        { "_id": "orders" },
+        { "$set": { "embedded_dimensions": bool(enabled) } },
+        upsert=True
+    )
+
+
+def has_embedded_dimensions(db):
+    """
+    Checks whether orders embed customer_state/customer_city and each order item
+    embeds product_category_name_english, so queries can skip the $lookup stages.
+
+    Returns:
+        bool: True if the embedded fields can be used.
+    """
+    meta = db[SCHEMA_META_COLLECTION].find_one({ "_id": "orders" })
+    return bool(meta and meta.get("embedded_dimensions"))
+
+
+def set_month_partitions(db, months):
+    """
+    Records the purchase months copied into their own orders collection by
+    utils.partitions, an empty list when orders are not partitioned.
+    """
+    db[SCHEMA_META_COLLECTION].update_one(
+        { "_id": "orders" },
+        { "$set": { "month_partitions": sorted(months) } },
+        upsert=True
+    )
+
+
+def get_month_partitions(db):
+    """
+    Returns the partitioned purchase months as "YYYY-MM" strings, in order, or an
+    empty list when orders are not partitioned.
+    """
+    meta = db[SCHEMA_META_COLLECTION].find_one({ "_id": "orders" })
+    return (meta or {}).get("month_partitions", [])
+
+
+def bump_data_version(db, queries=None):
+    """
+    Records that the data changed, e.g. after a load, so results cached for the
+    previous version are no longer served.
+
+    Args:
+        queries (iterable, optional): Names of the queries whose results changed,
+            see queries.catalog. All of them by default.
+
+    Returns:
+        str: The new data version.
+    """
+    version = datetime.now(timezone.utc).isoformat()
+    if queries is None:
+        update = { "$set": { "version": version, "base_version": version }, "$unset": { "queries": "" } }
+    else:
+        update = { "$set": { "version": version, **{ f"queries.{name}": version for name in queries } } }
+    db[SCHEMA_META_COLLECTION].update_one({ "_id": "data_version" }, update, upsert=True)
+    return version
+
+
+def get_data_version(db, query=None):
+    """
+    Returns the version recorded by the last bump_data_version(), or None if the
+    data was loaded before versions were recorded.
+
+    Args:
+        query (str, optional): A query name: returns the version of the last
+            bump covering that query instead of the last bump of any query.
+    """
+    meta = db[SCHEMA_META_COLLECTION].find_one({ "_id": "data_version" })
+    if not meta:
+        return None
+    if query is None:
+        return meta["version"]
+    return meta.get("queries", {}).get(query, meta.get("base_version", meta["version"]))
@@ -0,0 +1,351 @@
+# utils/sketches.py
+import hashlib
+import math
+import numpy as np
+from bson import Binary
+from pymongo import ReplaceOne
+from utils import instrumentation, summaries
+from utils.loader import batched
+
+SKETCH_COLLECTION = 'sketches'
+# Name of the sketches in the summary_meta collection
+SKETCH_NAME = 'sketches'
+PRODUCT_COUNTS = 'product_counts'
+CITY_CUSTOMERS = 'city_customers'
+STATE_BUYERS = 'state_buyers'
+# epsilon = e / 2^16 of the items overcounted at most, delta = e^-5 chance of more
+COUNT_MIN_WIDTH = 2 ** 16
+COUNT_MIN_DEPTH = 5
+# Products whose estimated count is kept, out of which the top k are answered
+HEAVY_HITTER_CAPACITY = 100
+# HyperLogLog family -> precision, 2^p registers per counter. The standard error
+# is 1.04 / sqrt(2^p): 1.6% per city (about 4,000 counters) and 0.8% per state.
+HLL_PRECISION = { CITY_CUSTOMERS: 12, STATE_BUYERS: 14 }
+# Distinct-count error bounds span two standard errors, about 95% confidence
+HLL_ERROR_DEVIATIONS = 2
+BATCH_SIZE = 50_000
+
+
+def _hashes(keys):
+    # Two independent 64-bit hashes per key
+    digests = b"".join(hashlib.blake2b(str(key).encode(), digest_size=16).digest() for key in keys)
+    return np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch of item counts, with the estimated counts of the heaviest
+    items seen so far.
+
+    An estimate never undercounts and overcounts by more than error_bound() with
+    probability at most delta = e^-depth. Counts can be decremented, e.g. for the
+    items of an order that changed, as long as no true count becomes negative.
+    """
+
+    def __init__(self, width=COUNT_MIN_WIDTH, depth=COUNT_MIN_DEPTH, capacity=HEAVY_HITTER_CAPACITY, table=None, total=0, candidates=None):
+        self.width, self.depth, self.capacity = width, depth, capacity
+        self.table = np.zeros((depth, width), dtype=np.int64) if table is None else table
+        self.total = total
+        self.candidates = dict(candidates or {})
+
+    def _columns(self, keys):
+        # Row i hashes with h1 + i * h2 (Kirsch-Mitzenmacher), wrapping around 2^64
+        hashes = _hashes(keys)
+        rows = np.arange(self.depth, dtype=np.uint64)
+        return ((hashes[:, :1] + rows * hashes[:, 1:]) % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, keys, sign=1):
+        """
+        Counts each key once more, or once less with sign=-1.
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        columns = self._columns(keys)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[:, row], sign)
+        self.total += sign * len(keys)
+        # Updated keys compete with the kept ones on their new estimates
+        candidates = list(self.candidates.keys() | set(keys))
+        ranked = sorted(zip(candidates, self.estimate(candidates).tolist()), key=lambda pair: -pair[1])
+        self.candidates = dict(ranked[:self.capacity])
+
+    def estimate(self, keys):
+        columns = self._columns(keys)
+        return self.table[np.arange(self.depth), columns].min(axis=1)
+
+    def error_bound(self):
+        return math.ceil(math.e / self.width * self.total)
+
+    def confidence(self):
+        return 1 - math.exp(-self.depth)
+
+    def top(self, k):
+        """
+        Returns the k heaviest (key, estimated count) pairs.
+        """
+        return sorted(self.candidates.items(), key=lambda pair: -pair[1])[:k]
+
+    def to_document(self):
+        return {
+            "kind": "count_min",
+            "width": self.width,
+            "depth": self.depth,
+            "capacity": self.capacity,
+            "table": Binary(self.table.tobytes()),
+            "total": self.total,
+            "candidates": [{ "key": key, "count": count } for key, count in self.top(self.capacity)],
+        }
+
+    @classmethod
+    def from_document(cls, document):
+        table = np.frombuffer(document["table"], dtype=np.int64).reshape(document["depth"], document["width"]).copy()
+        return cls(
+            document["width"], document["depth"], document["capacity"], table, document["total"],
+            { candidate["key"]: candidate["count"] for candidate in document["candidates"] }
+        )
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2^precision registers and a standard error
+    of 1.04 / sqrt(2^precision). Keys can be added but not removed.
+    """
+
+    def __init__(self, precision, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def update(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+        hashes = _hashes(keys)[:, 0]
+        rest_bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        # Rank: position of the first 1 bit in the rest, rest_bits + 1 when all are 0
+        ranks = np.full(len(keys), rest_bits + 1, dtype=np.uint8)
+        for bit in range(rest_bits - 1, -1, -1):
+            unset = ranks == rest_bits + 1
+            ranks[unset & (((rest >> np.uint64(bit)) & np.uint64(1)) == 1)] = rest_bits - bit
+        np.maximum.at(self.registers, indexes, ranks)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    def standard_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def error_bound(self):
+        return math.ceil(HLL_ERROR_DEVIATIONS * self.standard_error() * self.estimate())
+
+
+def _counter_document(family, key, counter, refreshed_at):
+    return {
+        "_id": f"{family}:{key}",
+        "family": family,
+        "key": key,
+        "precision": counter.precision,
+        "registers": Binary(counter.registers.tobytes()),
+        "estimate": round(counter.estimate()),
+        "error": counter.error_bound(),
+        "refreshed_at": refreshed_at,
+    }
+
+
+def _load_counters(db, family, keys):
+    counters = {
+        document["key"]: HyperLogLog(document["precision"], np.frombuffer(document["registers"], dtype=np.uint8).copy())
+        for document in db[SKETCH_COLLECTION].find({ "family": family, "key": { "$in": list(keys) } })
+    }
+    for key in keys:
+        counters.setdefault(key, HyperLogLog(HLL_PRECISION[family]))
+    return counters
+
+
+def _update_counters(counters, family, pairs):
+    # pairs: (counter key, distinct value), e.g. (city, customer_unique_id)
+    for batch in batched(pairs, BATCH_SIZE):
+        grouped = {}
+        for key, value in batch:
+            grouped.setdefault(key, []).append(value)
+        for key, values in grouped.items():
+            if key not in counters:
+                counters[key] = HyperLogLog(HLL_PRECISION[family])
+            counters[key].update(values)
+    return counters
+
+
+def _item_product_ids(orders):
+    for order in orders:
+        for item in order.get("order_items") or []:
+            yield item["product_id"]
+
+
+def _buyer_pipeline(match=None):
+    return ([{ "$match": match }] if match else []) + [
+        { "$group": { "_id": "$customer_id" } },
+        { "$lookup": { "from": "customers", "localField": "_id", "foreignField": "_id", "as": "customer" } },
+        { "$unwind": "$customer" },
+        { "$project": { "_id": 0, "customer_state": "$customer.customer_state", "customer_unique_id": "$customer.customer_unique_id" } },
+    ]
+
+
+def _save(db, product_counts, counters, refreshed_at):
+    writes = []
+    if product_counts is not None:
+        writes.append(ReplaceOne(
+            { "_id": PRODUCT_COUNTS },
+            { "_id": PRODUCT_COUNTS, **product_counts.to_document(), "refreshed_at": refreshed_at },
+            upsert=True
+        ))
+    for family, family_counters in counters.items():
+        for key, counter in family_counters.items():
+            document = _counter_document(family, key, counter, refreshed_at)
+            writes.append(ReplaceOne({ "_id": document["_id"] }, document, upsert=True))
+    for batch in batched(writes, 1000):
+        db[SKETCH_COLLECTION].bulk_write(batch, ordered=False)
+
+
+def _publish(db, refreshed_at, started_at):
+    meta = {
+        "refreshed_at": refreshed_at,
+        "stale": False,
+        "row_count": db[SKETCH_COLLECTION].estimated_document_count(),
+        "duration_ms": int((summaries._now() - started_at).total_seconds() * 1000),
+    }
+    db[summaries.SUMMARY_META_COLLECTION].update_one({ "_id": SKETCH_NAME }, { "$set": meta }, upsert=True)
+    return { "_id": SKETCH_NAME, **meta }
+
+
+def build_sketches(db):
+    """
+    Builds the sketches from the whole database in one pass over the order
+    items, the customers and the customers of the orders:
+
+    - a Count-Min sketch of the purchases per product, with its heavy hitters;
+    - a HyperLogLog of the distinct customers (customer_unique_id) per city;
+    - a HyperLogLog of the distinct buyers per customer state.
+
+    Returns:
+        dict: The sketch metadata document.
+    """
+    refreshed_at = summaries._now()
+    product_counts = CountMinSketch()
+    for batch in batched(_item_product_ids(db.orders.find({}, { "_id": 0, "order_items.product_id": 1 })), BATCH_SIZE):
+        product_counts.update(batch)
+    counters = {
+        CITY_CUSTOMERS: _update_counters({}, CITY_CUSTOMERS, (
+            (customer["customer_city"], customer["customer_unique_id"])
+            for customer in db.customers.find({}, { "_id": 0, "customer_city": 1, "customer_unique_id": 1 })
+        )),
+        STATE_BUYERS: _update_counters({}, STATE_BUYERS, (
+            (buyer["customer_state"], buyer["customer_unique_id"])
+            for buyer in db.orders.aggregate(_buyer_pipeline(), allowDiskUse=True)
+        )),
+    }
+    _save(db, product_counts, counters, refreshed_at)
+    # Counters of cities and states that no longer have customers
+    db[SKETCH_COLLECTION].delete_many({ "refreshed_at": { "$ne": refreshed_at } })
+    return _publish(db, refreshed_at, refreshed_at)
+
+
+def update_sketches(db, new_orders, changed_orders, new_customers, changed_customers):
+    """
+    Adds the orders and customers of an incremental load to maintained sketches.
+
+    HyperLogLogs cannot forget a customer, so changes that would remove one from
+    a counter (a customer moving, an order changing customer) mark the sketches
+    stale instead, and queries answer exactly until the next build.
+
+    Args:
+        new_orders (list): New order documents.
+        changed_orders (list): (stored, updated) order document pairs.
+        new_customers (list): New customer documents.
+        changed_customers (list): (stored, updated) customer document pairs.
+
+    Returns:
+        dict | None: The sketch metadata document, None when the sketches were
+        missing, already stale or marked stale.
+    """
+    meta = db[summaries.SUMMARY_META_COLLECTION].find_one({ "_id": SKETCH_NAME })
+    if not meta or meta.get("stale"):
+        return None
+    customer_fields = ("customer_city", "customer_state", "customer_unique_id")
+    if any(current.get("customer_id") != updated.get("customer_id") for current, updated in changed_orders) or any(
+        any(current.get(field) != updated.get(field) for field in customer_fields) for current, updated in changed_customers
+    ):
+        summaries.mark_stale(db, [SKETCH_NAME])
+        return None
+
+    started_at = summaries._now()
+    document = db[SKETCH_COLLECTION].find_one({ "_id": PRODUCT_COUNTS })
+    if document is None:
+        return None
+    product_counts = CountMinSketch.from_document(document)
+    product_counts.update(_item_product_ids(current for current, _ in changed_orders), sign=-1)
+    product_counts.update(_item_product_ids(new_orders + [updated for _, updated in changed_orders]))
+
+    cities = [(customer["customer_city"], customer["customer_unique_id"]) for customer in new_customers]
+    buyers = [
+        (buyer["customer_state"], buyer["customer_unique_id"])
+        for buyer in db.orders.aggregate(_buyer_pipeline({ "_id": { "$in": [order["_id"] for order in new_orders] } }))
+    ] if new_orders else []
+    counters = {
+        CITY_CUSTOMERS: _update_counters(_load_counters(db, CITY_CUSTOMERS, { city for city, _ in cities }), CITY_CUSTOMERS, cities),
+        STATE_BUYERS: _update_counters(_load_counters(db, STATE_BUYERS, { state for state, _ in buyers }), STATE_BUYERS, buyers),
+    }
+    refreshed_at = summaries._now()
+    _save(db, product_counts, counters, refreshed_at)
+    return _publish(db, refreshed_at, started_at)
+
+
+def read_top_products(db, k=10):
+    """
+    Reads the k most purchased products from the Count-Min sketch.
+
+    Returns:
+        tuple | None: (list of (product_id, estimated count), error bound), where
+        each estimate overcounts by at most the error bound with probability
+        1 - e^-COUNT_MIN_DEPTH. None when the sketches are missing or not fresh.
+    """
+    if summaries.get_fresh_meta(db, SKETCH_NAME) is None:
+        return None
+    collection = db[SKETCH_COLLECTION]
+    with instrumentation.operation(collection, "find") as record:
+        document = collection.find_one({ "_id": PRODUCT_COUNTS }, { "table": 0 })
+        record["returned"] = int(document is not None)
+    if document is None:
+        return None
+    candidates = sorted(document["candidates"], key=lambda candidate: -candidate["count"])[:k]
+    error = math.ceil(math.e / document["width"] * document["total"])
+    return [(candidate["key"], candidate["count"]) for candidate in candidates], error
+
+
+def read_distinct_counts(db, family, limit=None):
+    """
+    Reads the estimates of a family of HyperLogLog counters, largest first.
+
+    Returns:
+        list | None: Rows with key, estimate and error, the half-width of an
+        interval holding the true count with about 95% confidence. None when the
+        sketches are missing or not fresh.
+    """
+    if summaries.get_fresh_meta(db, SKETCH_NAME) is None:
+        return None
+    collection = db[SKETCH_COLLECTION]
+    with instrumentation.operation(collection, "find") as record:
+        cursor = collection.find({ "family": family }, { "_id": 0, "key": 1, "estimate": 1, "error": 1 }).sort("estimate", -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        rows = list(cursor)
+        record["returned"] = len(rows)
+    return rows
@@ -0,0 +1,208 @@
+# utils/summaries.py
+import os
+from datetime import datetime, timezone
+from utils import instrumentation, partitions
+
+SUMMARY_META_COLLECTION = 'summary_meta'
+DEFAULT_MAX_AGE_SECONDS = 24 * 60 * 60
+
+
+def summary_collection_name(name):
+    return f"summary_{name}"
+
+
+def _max_age_seconds():
+    return int(os.getenv('SUMMARY_MAX_AGE_SECONDS', DEFAULT_MAX_AGE_SECONDS))
+
+
+def _now():
+    # BSON dates have millisecond precision, truncate so the value read back matches
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000, tzinfo=None)
+
+
+def refresh_summary(db, name, collection, pipeline):
+    """
+    Runs a query pipeline and materializes its result into the summary collection
+    for that query using $merge.
+
+    Rows from previous refreshes are removed once the new result is in place, so
+    readers always see a single complete snapshot.
+
+    Args:
+        db: The olistDB database.
+        name (str): Summary name, usually the query function name.
+        collection (str): Source collection the pipeline runs on.
+        pipeline (list): Aggregation pipeline producing the query result.
+
+    Returns:
+        dict: The summary metadata document.
+    """
+    refreshed_at = _now()
+    target = summary_collection_name(name)
+    merge_pipeline = pipeline + [
+        { "$project": { "_id": 0, "row": "$$ROOT", "refreshed_at": { "$literal": refreshed_at } } },
+        {
+            "$merge": {
+                "into": target,
+                "on": "_id",
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }
+        }
+    ]
+    db[collection].aggregate(merge_pipeline, allowDiskUse=True)
+    return _publish_summary(db, name, refreshed_at, refreshed_at)
+
+
+def store_summary(db, name, rows, started_at=None):
+    """
+    Materializes a query result computed elsewhere, e.g. by a shared scan, into
+    the summary collection for that query.
+
+    Args:
+        db: The olistDB database.
+        name (str): Summary name.
+        rows (list): The result rows.
+        started_at (datetime, optional): When computing the rows started, for the
+            reported duration.
+
+    Returns:
+        dict: The summary metadata document.
+    """
+    refreshed_at = _now()
+    if rows:
+        db[summary_collection_name(name)].insert_many([{ "row": row, "refreshed_at": refreshed_at } for row in rows])
+    return _publish_summary(db, name, refreshed_at, started_at or refreshed_at)
+
+
+def _publish_summary(db, name, refreshed_at, started_at):
+    # Point readers at the new snapshot, then drop the rows of earlier ones
+    target = summary_collection_name(name)
+    meta = {
+        "refreshed_at": refreshed_at,
+        "stale": False,
+        "row_count": db[target].count_documents({ "refreshed_at": refreshed_at }),
+        "duration_ms": int((_now() - started_at).total_seconds() * 1000),
+    }
+    db[SUMMARY_META_COLLECTION].update_one({ "_id": name }, { "$set": meta }, upsert=True)
+    db[target].delete_many({ "refreshed_at": { "$ne": refreshed_at } })
+    return { "_id": name, **meta }
+
+
+def get_fresh_meta(db, name, max_age_seconds=None):
+    """
+    Returns the metadata of a summary if it can be served, otherwise None.
+
+    A summary is fresh when it exists, has not been marked stale and is younger
+    than max_age_seconds (SUMMARY_MAX_AGE_SECONDS by default). A max age of 0
+    disables summaries.
+    """
+    if max_age_seconds is None:
+        max_age_seconds = _max_age_seconds()
+    if max_age_seconds <= 0:
+        return None
+    meta = db[SUMMARY_META_COLLECTION].find_one({ "_id": name })
+    if not meta or meta.get("stale"):
+        return None
+    age = (_now() - meta["refreshed_at"]).total_seconds()
+    if age > max_age_seconds:
+        return None
+    return meta
+
+
+def read_summary(db, name, sort=None, max_age_seconds=None):
+    """
+    Reads the materialized result of a query.
+
+    Args:
+        db: The olistDB database.
+        name (str): Summary name.
+        sort (list, optional): (field, direction) pairs restoring the query's order.
+        max_age_seconds (int, optional): Overrides SUMMARY_MAX_AGE_SECONDS.
+
+    Returns:
+        list | None: The result rows, or None if the summary is missing or not fresh.
+    """
+    meta = get_fresh_meta(db, name, max_age_seconds)
+    if meta is None:
+        return None
+    collection = db[summary_collection_name(name)]
+    with instrumentation.operation(collection, "find") as record:
+        cursor = collection.find(
+            { "refreshed_at": meta["refreshed_at"] },
+            { "_id": 0, "row": 1 }
+        )
+        if sort:
+            cursor = cursor.sort([(f"row.{field}", direction) for field, direction in sort])
+        rows = [doc["row"] for doc in cursor]
+        record["returned"] = len(rows)
+    return rows
+
+
+def aggregate(db, name, collection, pipeline, sort=None, filter_stages=None):
+    """
+    Returns the result of a query pipeline, served from its summary collection when
+    that is fresh and computed from the source collection otherwise.
+
+    Args:
+        db: The olistDB database.
+        name (str): Summary name.
+        collection (str): Source collection the pipeline runs on.
+        pipeline (list): Aggregation pipeline producing the query result.
+        sort (list, optional): (field, direction) pairs restoring the query's order.
+        filter_stages (list, optional): Stages filtering the source documents,
+            placed before the pipeline. Summaries hold unfiltered results, so
+            filtered results are always computed, from the month partitions of
+            the orders when the filters restrict the purchase dates.
+
+    Returns:
+        list: The result rows.
+    """
+    if filter_stages:
+        return partitions.aggregate(db, collection, filter_stages + pipeline)
+    rows = read_summary(db, name, sort)
+    if rows is not None:
+        return rows
+    return instrumentation.aggregate(db[collection], pipeline)
+
+
+def mark_stale(db, names=None):
+    """
+    Marks summaries as stale so queries fall back to the source collections until
+    the next refresh.
+
+    Args:
+        db: The olistDB database.
+        names (list, optional): Summaries to mark. All summaries when omitted.
+    """
+    query = {} if names is None else { "_id": { "$in": list(names) } }
+    db[SUMMARY_META_COLLECTION].update_many(query, { "$set": { "stale": True } })
+
+
+def aggregate_rows(db, name, collection, pipeline, stages, filter_stages=None):
+    """
+    Runs further stages over the rows of a query, e.g. to summarize them, reading
+    the rows from the summary collection when that is fresh.
+
+    Args:
+        db: The olistDB database.
+        name (str): Summary name.
+        collection (str): Source collection the pipeline runs on.
+        pipeline (list): Aggregation pipeline producing the query result.
+        stages (list): Stages applied to the result rows.
+        filter_stages (list, optional): Stages filtering the source documents,
+            filtered rows are always computed.
+
+    Returns:
+        list: The output of the stages.
+    """
+    if filter_stages:
+        return partitions.aggregate(db, collection, filter_stages + pipeline + stages, allowDiskUse=True)
+    meta = get_fresh_meta(db, name)
+    if meta is not None:
+        return instrumentation.aggregate(db[summary_collection_name(name)], [
+            { "$match": { "refreshed_at": meta["refreshed_at"] } },
+            { "$replaceRoot": { "newRoot": "$row" } }
+        ] + stages, allowDiskUse=True)
+    return instrumentation.aggregate(db[collection], pipeline + stages, allowDiskUse=True)
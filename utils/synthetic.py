@@ -0,0 +1,275 @@
+# utils/synthetic.py
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from utils.loader import read_dataset_csv
+
+# Synthetic Olist CSV files at any scale, in the layout scripts/create.py reads.
+# Products and sellers are resampled from the real catalog in dataset/, so
+# categories and seller states keep their skew; customer states follow the
+# shares of the original orders.
+
+REFERENCE_DIR = './dataset'
+DEFAULT_CHUNK_SIZE = 100_000
+FIRST_PURCHASE = pd.Timestamp('2016-09-04')
+LAST_PURCHASE = pd.Timestamp('2018-10-17')
+
+# Share of orders per customer state in the original dataset
+CUSTOMER_STATE_SHARES = {
+    "SP": 0.4198, "RJ": 0.1292, "MG": 0.1170, "RS": 0.0550, "PR": 0.0507, "SC": 0.0366,
+    "BA": 0.0340, "DF": 0.0215, "ES": 0.0204, "GO": 0.0203, "PE": 0.0166, "CE": 0.0134,
+    "PA": 0.0098, "MT": 0.0091, "MA": 0.0075, "MS": 0.0072, "PB": 0.0054, "PI": 0.0050,
+    "RN": 0.0049, "AL": 0.0041, "SE": 0.0034, "TO": 0.0028, "RO": 0.0025, "AM": 0.0015,
+    "AC": 0.0008, "AP": 0.0007, "RR": 0.0005,
+}
+# Dimension rows per order in the original dataset
+PRODUCTS_PER_ORDER = 0.33
+SELLERS_PER_ORDER = 0.031
+UNIQUE_CUSTOMERS_PER_ORDER = 0.966
+# Items per order: 1 to 4
+ITEM_COUNT_SHARES = [0.90, 0.075, 0.015, 0.01]
+PAYMENT_TYPE_SHARES = { "credit_card": 0.739, "boleto": 0.190, "voucher": 0.056, "debit_card": 0.015 }
+# Review scores 1 to 5
+REVIEW_SCORE_SHARES = [0.115, 0.032, 0.082, 0.193, 0.578]
+ORDER_STATUS_SHARES = {
+    "delivered": 0.970, "shipped": 0.011, "canceled": 0.006, "unavailable": 0.006,
+    "invoiced": 0.003, "processing": 0.003, "created": 0.0005, "approved": 0.0005,
+}
+# Power-law exponents of product and seller popularity. The best-selling product
+# and seller get about 1% and 2% of the items, as in the original dataset.
+PRODUCT_POPULARITY_EXPONENT = 0.7
+SELLER_POPULARITY_EXPONENT = 0.7
+
+
+def _ids(prefix, start, count):
+    # 32 characters like the md5 ids of the original files
+    return pd.Series(np.arange(start, start + count)).map(lambda i: f"{prefix}{i:031x}")
+
+
+def _shares(shares):
+    names = list(shares)
+    weights = np.asarray([shares[name] for name in names], dtype='float64')
+    return np.asarray(names), weights / weights.sum()
+
+
+def _power_law_weights(count, exponent, rng):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    # Popular ids are spread over the id range rather than being the first ones
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _seconds(values):
+    return pd.to_timedelta(np.round(values).astype('int64'), unit='s')
+
+
+def _write(df, data_dir, file_name, first):
+    df.to_csv(os.path.join(data_dir, file_name), mode='w' if first else 'a', header=first, index=False)
+
+
+class _Catalog:
+    """
+    Products, sellers and customer cities shared by every chunk of orders.
+    """
+
+    def __init__(self, orders, rng, reference_dir):
+        products = read_dataset_csv(reference_dir, 'olist_products_dataset.csv')
+        sellers = read_dataset_csv(reference_dir, 'olist_sellers_dataset.csv')
+
+        product_count = max(int(orders * PRODUCTS_PER_ORDER), 10)
+        self.products = products.sample(product_count, replace=True, random_state=rng).reset_index(drop=True)
+        self.products['product_id'] = _ids('p', 0, product_count)
+        self.product_weights = _power_law_weights(product_count, PRODUCT_POPULARITY_EXPONENT, rng)
+        # Heavier products ship for more
+        self.product_freight = 8 + np.nan_to_num(self.products['product_weight_g'].to_numpy(), nan=700) / 400
+
+        seller_count = max(int(orders * SELLERS_PER_ORDER), 10)
+        self.sellers = sellers.sample(seller_count, replace=True, random_state=rng).reset_index(drop=True)
+        self.sellers['seller_id'] = _ids('s', 0, seller_count)
+        self.seller_weights = _power_law_weights(seller_count, SELLER_POPULARITY_EXPONENT, rng)
+        # Each product is sold by one seller, like most of the original catalog
+        self.product_sellers = rng.choice(seller_count, size=product_count, p=self.seller_weights)
+        self.product_prices = np.round(rng.lognormal(mean=4.3, sigma=0.9, size=product_count), 2)
+
+        # Customer cities are the seller cities of the same state, weighted by their frequency
+        self.states, self.state_weights = _shares(CUSTOMER_STATE_SHARES)
+        cities = sellers.groupby('seller_state')['seller_city'].value_counts()
+        self.cities = {}
+        for state in self.states:
+            if state in cities.index.get_level_values(0):
+                counts = cities.loc[state]
+                self.cities[state] = (counts.index.to_numpy(), (counts / counts.sum()).to_numpy())
+            else:
+                self.cities[state] = (np.asarray([f"{state.lower()} capital"]), np.asarray([1.0]))
+
+
+def _purchase_timestamps(count, rng):
+    # Order volume grows over the period, as in the original dataset
+    span = (LAST_PURCHASE - FIRST_PURCHASE).total_seconds()
+    return FIRST_PURCHASE + _seconds(np.sqrt(rng.random(count)) * span)
+
+
+def _unique_customer_ids(order_numbers):
+    # Consecutive orders share a unique customer now and then, about 3% of them are repeat purchases
+    numbers = np.floor(np.asarray(order_numbers) * UNIQUE_CUSTOMERS_PER_ORDER).astype('int64')
+    return pd.Series(numbers).map(lambda i: f"u{i:031x}")
+
+
+def _customers(catalog, order_ids, rng):
+    count = len(order_ids)
+    states = catalog.states[rng.choice(len(catalog.states), size=count, p=catalog.state_weights)]
+    cities = np.empty(count, dtype=object)
+    for state in np.unique(states):
+        rows = states == state
+        names, weights = catalog.cities[state]
+        cities[rows] = names[rng.choice(len(names), size=rows.sum(), p=weights)]
+    return pd.DataFrame({
+        'customer_id': _ids('c', int(order_ids.index[0]), count),
+        'customer_unique_id': _unique_customer_ids(order_ids.index),
+        'customer_zip_code_prefix': rng.integers(1000, 99999, size=count),
+        'customer_city': cities,
+        'customer_state': states,
+    })
+
+
+def _orders(order_ids, customer_ids, rng):
+    count = len(order_ids)
+    statuses, status_weights = _shares(ORDER_STATUS_SHARES)
+    status = statuses[rng.choice(len(statuses), size=count, p=status_weights)]
+    purchased = _purchase_timestamps(count, rng)
+    approved = purchased + _seconds(rng.exponential(10 * 3600, size=count))
+    carrier = approved + _seconds(rng.gamma(2.0, 1.5 * 86400, size=count))
+    delivered = carrier + _seconds(rng.gamma(3.0, 3.0 * 86400, size=count))
+    estimated = (purchased + _seconds(rng.integers(15, 35, size=count) * 86400)).normalize()
+
+    not_shipped = ~np.isin(status, ["delivered", "shipped"])
+    not_delivered = status != "delivered"
+    canceled = np.isin(status, ["canceled", "created"])
+    return pd.DataFrame({
+        'order_id': order_ids,
+        'customer_id': customer_ids,
+        'order_status': status,
+        'order_purchase_timestamp': purchased,
+        'order_approved_at': approved.where(~canceled),
+        'order_delivered_carrier_date': carrier.where(~not_shipped),
+        'order_delivered_customer_date': delivered.where(~not_delivered),
+        'order_estimated_delivery_date': estimated,
+    })
+
+
+def _order_items(catalog, orders, rng):
+    counts = rng.choice(len(ITEM_COUNT_SHARES), size=len(orders), p=ITEM_COUNT_SHARES) + 1
+    order_rows = np.repeat(np.arange(len(orders)), counts)
+    products = rng.choice(len(catalog.products), size=len(order_rows), p=catalog.product_weights)
+    # Position of each item within its order, from 1
+    item_ids = np.arange(len(order_rows)) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    purchased = orders['order_purchase_timestamp'].to_numpy()[order_rows]
+    return pd.DataFrame({
+        'order_id': orders['order_id'].to_numpy()[order_rows],
+        'order_item_id': item_ids,
+        'product_id': catalog.products['product_id'].to_numpy()[products],
+        'seller_id': catalog.sellers['seller_id'].to_numpy()[catalog.product_sellers[products]],
+        'shipping_limit_date': purchased + _seconds(rng.integers(3, 8, size=len(order_rows)) * 86400).to_numpy(),
+        'price': catalog.product_prices[products],
+        'freight_value': np.round(catalog.product_freight[products] * rng.uniform(0.7, 1.3, size=len(order_rows)), 2),
+    })
+
+
+def _payments(orders, order_items, rng):
+    totals = (order_items['price'] + order_items['freight_value']).groupby(order_items['order_id']).sum()
+    totals = totals.reindex(orders['order_id']).fillna(0).to_numpy()
+    types, type_weights = _shares(PAYMENT_TYPE_SHARES)
+    payment_types = types[rng.choice(len(types), size=len(orders), p=type_weights)]
+    installments = np.where(payment_types == "credit_card", rng.choice([1, 2, 3, 4, 5, 6, 8, 10], size=len(orders)), 1)
+    payments = pd.DataFrame({
+        'order_id': orders['order_id'].to_numpy(),
+        'payment_sequential': 1,
+        'payment_type': payment_types,
+        'payment_installments': installments,
+        'payment_value': np.round(totals, 2),
+    })
+    # A few orders pay part of the total with a voucher
+    split = rng.random(len(orders)) < 0.03
+    vouchers = payments[split].assign(
+        payment_sequential=2, payment_type="voucher", payment_installments=1,
+        payment_value=lambda df: np.round(df['payment_value'] * 0.2, 2),
+    )
+    payments.loc[split, 'payment_value'] = np.round(payments.loc[split, 'payment_value'] * 0.8, 2)
+    return pd.concat([payments, vouchers], ignore_index=True).sort_values(['order_id', 'payment_sequential'], kind='stable')
+
+
+def _reviews(orders, first_order, rng):
+    reviewed = orders[rng.random(len(orders)) < 0.99]
+    count = len(reviewed)
+    created = reviewed['order_delivered_customer_date'].fillna(reviewed['order_estimated_delivery_date']).dt.normalize() + pd.Timedelta(days=1)
+    scores = rng.choice(5, size=count, p=REVIEW_SCORE_SHARES) + 1
+    commented = rng.random(count) < 0.41
+    return pd.DataFrame({
+        'review_id': _ids('r', first_order, count),
+        'order_id': reviewed['order_id'].to_numpy(),
+        'review_score': scores,
+        'review_comment_title': None,
+        'review_comment_message': np.where(commented, "produto recebido", None),
+        'review_creation_date': created.to_numpy(),
+        'review_answer_timestamp': (created + _seconds(rng.exponential(2 * 86400, size=count))).to_numpy(),
+    })
+
+
+def generate_dataset(data_dir, orders, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, reference_dir=REFERENCE_DIR):
+    """
+    Writes a synthetic dataset with the files and columns of the Olist CSVs.
+
+    Orders are generated and appended in chunks, so memory stays bounded by the
+    chunk size and the product and seller catalog, about a third and 3% of the
+    order count.
+
+    Args:
+        data_dir (str): Output directory, created if needed.
+        orders (int): Number of orders.
+        seed (int): Random seed, the same seed and sizes give the same files.
+        chunk_size (int): Orders generated at a time.
+        reference_dir (str): Directory holding the real products, sellers and
+            category translation files the catalog is sampled from.
+
+    Returns:
+        dict: File name -> number of rows written.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    catalog = _Catalog(orders, rng, reference_dir)
+
+    counts = {}
+    for file_name, df in [
+        ('olist_products_dataset.csv', catalog.products),
+        ('olist_sellers_dataset.csv', catalog.sellers),
+    ]:
+        _write(df, data_dir, file_name, first=True)
+        counts[file_name] = len(df)
+    shutil.copy(os.path.join(reference_dir, 'product_category_name_translation.csv'), data_dir)
+
+    for start in range(0, orders, chunk_size):
+        count = min(chunk_size, orders - start)
+        order_ids = _ids('o', start, count).set_axis(np.arange(start, start + count))
+        customers = _customers(catalog, order_ids, rng)
+        order_df = _orders(order_ids.to_numpy(), customers['customer_id'].to_numpy(), rng)
+        items = _order_items(catalog, order_df, rng)
+        geolocations = pd.DataFrame({
+            'geolocation_zip_code_prefix': customers['customer_zip_code_prefix'],
+            'geolocation_lat': rng.uniform(-33.7, 5.2, size=count),
+            'geolocation_lng': rng.uniform(-73.9, -34.8, size=count),
+            'geolocation_city': customers['customer_city'],
+            'geolocation_state': customers['customer_state'],
+        })
+        for file_name, df in [
+            ('olist_customers_dataset.csv', customers),
+            ('olist_geolocation_dataset.csv', geolocations),
+            ('olist_orders_dataset.csv', order_df),
+            ('olist_order_items_dataset.csv', items),
+            ('olist_order_payments_dataset.csv', _payments(order_df, items, rng)),
+            ('olist_order_reviews_dataset.csv', _reviews(order_df, start, rng)),
+        ]:
+            _write(df, data_dir, file_name, first=start == 0)
+            counts[file_name] = counts.get(file_name, 0) + len(df)
+    counts['product_category_name_translation.csv'] = len(read_dataset_csv(data_dir, 'product_category_name_translation.csv'))
+    return counts
@@ -1,28 +1,114 @@
 import streamlit as st
 import plotly.express as px
-import json
+from utils import geo
 
-def visualize_data(data, selected_query_title):
-    if selected_query_title == "Monthly sales trends":
+# Rollup granularity -> period name in the sales trends charts
+PERIOD_NAMES = {"day": "Day", "week": "Week", "month": "Month", "quarter": "Quarter"}
+
+def error_column(data, column, one_sided=False):
+    """
+    Returns the error bound column of an approximate result, for error bars, or
+    None when the result is exact.
+
+    Args:
+        one_sided (bool): The estimates never undercount, e.g. Count-Min counts,
+            so the true count lies between the estimate minus the bound and the
+            estimate. Such bounds are drawn below the bars only.
+    """
+    error = f"{column}_error"
+    if error in data.columns and data[error].any():
+        if one_sided:
+            st.caption("Approximate counts from sketches, which never undercount: error bars show how much lower the true counts may be.")
+        else:
+            st.caption("Approximate counts from sketches, error bars show their error bounds.")
+        return error
+    return None
+
+def state_choropleth(data, color, color_scale, title, labels=None):
+    """
+    Draws a map of Brazilian states colored by a column of a per-state result,
+    using the simplified state geometry parsed once per process.
+    """
+    fig_map = px.choropleth(
+        data,
+        geojson=geo.states_geojson(),
+        locations="customer_state",
+        featureidkey="properties.sigla",
+        color=color,
+        color_continuous_scale=color_scale,
+        projection="mercator",
+        title=title,
+        labels=labels,
+    )
+    fig_map.update_geos(fitbounds="locations", visible=True)
+    st.plotly_chart(fig_map, use_container_width=True)
+
+def distribution_chart(distribution, x_label, title, color):
+    """
+    Draws a histogram binned by the database, marking its quantiles.
+
+    Args:
+        distribution (tuple): Histogram DataFrame and quantiles dict, see
+            utils.distributions.to_distribution.
+    """
+    histogram, quantiles = distribution
+    quantile_names = [name for name in quantiles if name.startswith("p")]
+
+    for column, name in zip(st.columns(len(quantile_names) or 1), quantile_names):
+        column.metric(name, f"{quantiles[name]:.1f}")
+
+    # The overflow bin has no end, draw it as wide as the other bins
+    widths = (histogram["bin_end"] - histogram["bin_start"])
+    widths = widths.fillna(widths.median())
+    fig = px.bar(
+        histogram,
+        x="bin_start",
+        y="count",
+        hover_data=["bin_end"],
+        labels={"bin_start": x_label, "bin_end": "Bin end", "count": "Count"},
+        title=title,
+        color_discrete_sequence=[color],
+    )
+    # Draw each bar from the start of its bin
+    fig.update_traces(offset=0, width=widths.tolist())
+    fig.update_layout(bargap=0)
+    for name in quantile_names:
+        fig.add_vline(x=quantiles[name], line_dash="dash", annotation_text=name)
+    st.plotly_chart(fig, use_container_width=True)
+
+def visualize_data(data, selected_query_title, distribution=None, granularity="month"):
+    if selected_query_title == "Sales trends":
+        period = PERIOD_NAMES[granularity]
         fig_line = px.line(
             data,
             x="date",
             y="total_sales",
-            labels={"date": "Month", "total_sales": "Total sales (BRL)"},
-            title="Monthly sales trend",
-            markers=True,
+            labels={"date": period, "total_sales": "Total sales (BRL)"},
+            title=f"Sales per {period.lower()}",
+            markers=granularity != "day",
             line_shape="linear",
             color_discrete_sequence=["indigo"],
         )
         st.plotly_chart(fig_line, use_container_width=True)
 
+        fig_orders = px.bar(
+            data,
+            x="date",
+            y=["orders", "items"],
+            barmode="group",
+            labels={"date": period, "value": "Count", "variable": ""},
+            title=f"Orders and items per {period.lower()}",
+            color_discrete_sequence=["darkorange", "teal"],
+        )
+        st.plotly_chart(fig_orders, use_container_width=True)
+
         data["cumulative_sales"] = data["total_sales"].cumsum()
         fig_area = px.area(
             data,
             x="date",
             y="cumulative_sales",
-            labels={"date": "Month", "cumulative_sales": "Cumulative sales (BRL)"},
-            title="Cumulative monthly sales",
+            labels={"date": period, "cumulative_sales": "Cumulative sales (BRL)"},
+            title="Cumulative sales",
             color_discrete_sequence=["lightseagreen"],
         )
         st.plotly_chart(fig_area, use_container_width=True)
@@ -42,21 +128,12 @@ def visualize_data(data, selected_query_title):
         )
         st.plotly_chart(fig, use_container_width=True)
 
-        with open("./dataset/brazil-states.geojson") as f:
-            geojson = json.load(f)
-
-        fig_map = px.choropleth(
+        state_choropleth(
             data,
-            geojson=geojson,
-            locations="customer_state",
-            featureidkey="properties.sigla",
             color="average_order_value",
-            color_continuous_scale="Viridis",
-            projection="mercator",
+            color_scale="Viridis",
             title="Average order value by customer state",
         )
-        fig_map.update_geos(fitbounds="locations", visible=True)
-        st.plotly_chart(fig_map, use_container_width=True)
 
     elif selected_query_title == "Most popular products":
         st.markdown("Results limited to the top 10 products.")
@@ -70,6 +147,8 @@ def visualize_data(data, selected_query_title):
             title="Most popular products",
             color="purchase_count",
             color_continuous_scale="Purples",
+            error_y=None,
+            error_y_minus=error_column(data, "purchase_count", one_sided=True),
         )
         st.plotly_chart(fig, use_container_width=True)
 
@@ -100,15 +179,13 @@ def visualize_data(data, selected_query_title):
         )
         st.plotly_chart(fig, use_container_width=True)
 
-        fig_scatter = px.histogram(
-            data,
-            x="average_delivery_time_in_days",
-            nbins=100,
-            labels={"average_delivery_time_in_days": "Average delivery time (days)"},
+        # Binned by the database, see query4.delivery_time_distribution
+        distribution_chart(
+            distribution,
+            x_label="Average delivery time (days)",
             title="Average delivery time histogram",
-            color_discrete_sequence=["crimson"],
+            color="crimson",
         )
-        st.plotly_chart(fig_scatter, use_container_width=True)
 
     elif selected_query_title == "Top rated products":
         st.markdown("Results limited to the top 10 products with at least 100 reviews.")
@@ -212,9 +289,31 @@ def visualize_data(data, selected_query_title):
             title="Top 10 cities by number of customers",
             color="customer_count",
             color_continuous_scale="Blues",
+            error_x=error_column(data, "customer_count"),
         )
         st.plotly_chart(fig_horizontal, use_container_width=True)
 
+    elif selected_query_title == "Distinct buyers by state":
+        fig = px.bar(
+            data,
+            x="customer_state",
+            y="buyer_count",
+            labels={"buyer_count": "Distinct buyers", "customer_state": "Customer state"},
+            title="Distinct buyers by customer state",
+            color="buyer_count",
+            color_continuous_scale="Teal",
+            error_y=error_column(data, "buyer_count"),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+        state_choropleth(
+            data,
+            color="buyer_count",
+            color_scale="Teal",
+            title="Distinct buyers by customer state",
+            labels={"buyer_count": "Distinct buyers"},
+        )
+
     elif selected_query_title == "Average freight value by state":
         fig = px.bar(
             data,
@@ -230,14 +329,19 @@ def visualize_data(data, selected_query_title):
         )
         st.plotly_chart(fig, use_container_width=True)
 
-    elif selected_query_title == "Orders with delayed delivery":
-
-        fig = px.histogram(
+        state_choropleth(
             data,
-            x="delay_in_days",
-            nbins=100,
-            labels={"delay_in_days": "Delay in Days"},
+            color="average_freight_value",
+            color_scale="Oranges",
+            title="Average freight value by customer state",
+            labels={"average_freight_value": "Average freight value (BRL)"},
+        )
+
+    elif selected_query_title == "Orders with delayed delivery":
+        # Binned by the database, see query10.delay_distribution
+        distribution_chart(
+            distribution,
+            x_label="Delay in Days",
             title="Distribution of delivery delays",
-            color_discrete_sequence=["crimson"],
+            color="crimson",
         )
-        st.plotly_chart(fig, use_container_width=True)
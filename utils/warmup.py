@@ -0,0 +1,64 @@
+# utils/warmup.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_WORKERS = 4
+
+
+def enabled():
+    return os.getenv('CACHE_WARMUP', '1') != '0'
+
+
+def _workers():
+    return int(os.getenv('CACHE_WARMUP_WORKERS', DEFAULT_WORKERS))
+
+
+class CacheWarmup:
+    """
+    Runs the dashboard queries in a background thread pool so their caches are
+    filled before anyone selects them.
+
+    Each task is a callable making the same calls as its view; its results are
+    discarded, only the caches it fills matter.
+    """
+
+    def __init__(self, tasks, workers=None, data_version=None):
+        self.data_version = data_version
+        self._lock = threading.Lock()
+        self._status = { name: { "state": "pending" } for name in tasks }
+        self._executor = ThreadPoolExecutor(max_workers=workers or _workers(), thread_name_prefix="cache-warmup")
+        for name, task in tasks.items():
+            self._executor.submit(self._run, name, task)
+        # Let the workers finish on their own, nothing waits for them
+        self._executor.shutdown(wait=False)
+
+    def _run(self, name, task):
+        self._set(name, state="running")
+        start = time.perf_counter()
+        try:
+            task()
+        except Exception as e:
+            self._set(name, state="failed", error=str(e))
+        else:
+            self._set(name, state="warm", duration_ms=int((time.perf_counter() - start) * 1000))
+
+    def _set(self, name, **status):
+        with self._lock:
+            self._status[name] = status
+
+    def status(self):
+        """
+        Returns the warm-up state of each task: pending, running, warm (with its
+        duration_ms) or failed (with the error).
+        """
+        with self._lock:
+            return { name: dict(status) for name, status in self._status.items() }
+
+    @property
+    def done(self):
+        return all(status["state"] in ("warm", "failed") for status in self.status().values())